@@ -1,9 +1,14 @@
 import os
+import sys
 import hashlib
 import json
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 import argparse
 
 from openai import OpenAI
@@ -16,13 +21,145 @@ from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Shared helpers live in utils/ at the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.llm import chat_completion
+from utils.llm_cache import get_llm_cache
+from utils.tokens import get_counter
+
+class MetadataStore:
+    """
+    Run-scoped view of output/metadata.json.
+
+    The file is read once and entries are updated in memory, so checks and updates during a
+    run cost no I/O. flush() writes the entries changed since the last flush back to disk
+    under an advisory lock on metadata.json.lock: it re-reads the file, applies the changes
+    on top of what other runs may have written in the meantime, and replaces the file
+    atomically through a temporary file and a rename.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock_path = path.with_name(path.name + ".lock")
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._data = self._read()
+
+    def _read(self) -> Dict:
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def get(self, key: str, default=None):
+        """Get an entry, or default if it is missing."""
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key: str, value):
+        """Set an entry in memory; it is written by the next flush."""
+        with self._lock:
+            self._data[key] = value
+            self._dirty.add(key)
+
+    def flush(self):
+        """Write the changed entries to disk atomically, merged with the current file."""
+        with self._lock:
+            if not self._dirty:
+                return
+            with self._file_lock():
+                self._write(self._merged())
+
+    def update(self, key: str, fn: Callable):
+        """
+        Read-modify-write one entry under the file lock, so concurrent runs never lose an update.
+
+        fn is called with the entry as currently on disk (or None) and returns its new value,
+        which is written at once together with the other pending changes. Returns the new value.
+        """
+        with self._lock, self._file_lock():
+            data = self._merged()
+            data[key] = fn(data.get(key))
+            self._write(data)
+            return data[key]
+
+    def _merged(self) -> Dict:
+        """The file as on disk with the pending changes applied; call with the file lock held."""
+        data = self._read()
+        data.update({key: self._data[key] for key in self._dirty})
+        return data
+
+    def _write(self, data: Dict):
+        """Replace the file atomically and mark everything clean; call with both locks held."""
+        fd, temp_path = tempfile.mkstemp(prefix=self.path.name + ".", suffix=".tmp", dir=self.path.parent)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._data = data
+        self._dirty = set()
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold an exclusive advisory lock shared with other runs on the same output directory."""
+        with open(self.lock_path, 'a+') as f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def fingerprint(value) -> str:
+    """MD5 of a JSON-serializable value, stable across runs."""
+    return hashlib.md5(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class BuildNode:
+    """
+    One artifact of the report in the build graph.
+
+    inputs() returns the fingerprint of everything the artifact is made from, by name, or None
+    when there is nothing to build it from. It is called once the dependencies are built, so
+    it can hash their outputs. action() builds the artifact and returns whether it succeeded.
+    The fingerprints of the last successful build are kept in the metadata entry named after
+    the node, and the node is stale when one of them differs or an output is missing.
+    """
+
+    def __init__(self, name: str, deps: List[str], inputs: Callable[[], Optional[Dict[str, str]]], action: Callable[[], bool], outputs: List[Path]):
+        self.name = name
+        self.deps = deps
+        self.inputs = inputs
+        self.action = action
+        self.outputs = outputs
+
+
 class TechnicalReportGenerator:
     """
     Generates a PDF technical report presenting Perceptual Control Theory (PCT) applied to a target environment,
     with a comparison against a Reinforcement Learning (RL) controller.
     """
     
-    def __init__(self, input_dir: str = "input", output_dir: str = "output", environment: str = "OpenAI Gym"):
+    def __init__(self, input_dir: str = "input", output_dir: str = "output", environment: str = "OpenAI Gym", max_workers: int = 4):
         # Look for .env file in the VS Code root folder (parent of report_generator)
         vscode_root = Path(__file__).parent.parent
         env_path = vscode_root / ".env"
@@ -40,7 +177,23 @@ class TechnicalReportGenerator:
         self.input_dir = report_gen_dir / input_dir if not Path(input_dir).is_absolute() else Path(input_dir)
         self.output_dir = report_gen_dir / output_dir if not Path(output_dir).is_absolute() else Path(output_dir)
         self.metadata_file = self.output_dir / "metadata.json"
+        self.digests_dir = self.output_dir / "digests"
         self.environment = environment
+        self.token_counter = get_counter("gpt-4o")
+        # Sections are generated concurrently
+        self.max_workers = max_workers
+        self.section_errors: Dict[str, str] = {}
+
+        # Request parameters; they are part of the fingerprint of what they generate
+        self.section_params = {"model": "gpt-4o", "max_tokens": 2000, "temperature": 0.7}
+        self.abstract_params = {"model": "gpt-4o", "max_tokens": 400, "temperature": 0.7}
+        self.bibtex_params = {"model": "gpt-4o", "max_tokens": 2000, "temperature": 0.3}
+        # Digests are extracted, not written, so a small deterministic model is enough
+        self.digest_params = {"model": "gpt-4o-mini", "max_tokens": 300, "temperature": 0}
+
+        # The version is incremented once per run, on first use
+        self._version: Optional[str] = None
+        self._version_lock = threading.Lock()
         
         # Load report metadata from environment variables
         self.report_author = os.getenv("REPORT_AUTHOR", "Research Team")
@@ -75,28 +228,38 @@ class TechnicalReportGenerator:
             "recommendations_future_work": "Recommendations & Future Work",
             "references": "References"
         }
+
+        # Sections the abstract is written from
+        self.abstract_sections = [
+            "introduction", "methodology",
+            "experimental_results", "discussion", "recommendations_future_work"
+        ]
         
         self.ensure_directories()
+        self.metadata = MetadataStore(self.metadata_file)
         
     def get_version_number(self) -> str:
-        """Get and increment version number."""
-        metadata = self.load_metadata()
-        current_version = metadata.get("version", "1.0.0")
-        
-        # Parse version (major.minor.patch)
-        parts = current_version.split(".")
-        major, minor, patch = int(parts[0]), int(parts[1]), int(parts[2])
-        
-        # Increment patch version
-        patch += 1
-        new_version = f"{major}.{minor}.{patch}"
-        
-        # Save new version
-        metadata["version"] = new_version
-        metadata["version_date"] = datetime.now().isoformat()
-        self.save_metadata(metadata)
-        
-        return new_version
+        """
+        Get the version of this run's documents, incrementing the stored one on first use.
+
+        The increment holds the metadata file lock from read to write, so concurrent runs on
+        the same output directory get distinct versions.
+        """
+        with self._version_lock:
+            if self._version:
+                return self._version
+
+            def increment(current_version):
+                # Parse version (major.minor.patch) and increment the patch version
+                parts = (current_version or "1.0.0").split(".")
+                major, minor, patch = int(parts[0]), int(parts[1]), int(parts[2])
+                return f"{major}.{minor}.{patch + 1}"
+
+            new_version = self.metadata.update("version", increment)
+            self.metadata.set("version_date", datetime.now().isoformat())
+
+            self._version = new_version
+            return new_version
     
     def get_author_name(self) -> str:
         """Get author name from environment or metadata."""
@@ -105,8 +268,7 @@ class TechnicalReportGenerator:
             return self.report_author
             
         # Try metadata as fallback
-        metadata = self.load_metadata()
-        author = metadata.get("author")
+        author = self.metadata.get("author")
         if author:
             return author
             
@@ -187,48 +349,25 @@ class TechnicalReportGenerator:
                 hash_md5.update(chunk)
         return hash_md5.hexdigest()
     
-    def load_metadata(self) -> Dict:
-        """Load metadata about file hashes and generation timestamps."""
-        if self.metadata_file.exists():
-            with open(self.metadata_file, 'r') as f:
-                return json.load(f)
-        return {}
-    
-    def save_metadata(self, metadata: Dict):
-        """Save metadata about file hashes and generation timestamps."""
-        with open(self.metadata_file, 'w') as f:
-            json.dump(metadata, f, indent=2)
-    
-    def needs_regeneration(self, section: str) -> bool:
-        """
-        Check if a section needs to be regenerated based on:
-        1. Output file doesn't exist
-        2. Input file has changed since last generation
-        """
-        input_file = self.input_dir / f"{section}.md"
-        output_file = self.output_dir / f"{section}.txt"
-        
-        # If input file doesn't exist, skip this section
-        if not input_file.exists():
-            print(f"Warning: Input file {input_file} not found. Skipping {section}.")
-            return False
-            
-        # If output file doesn't exist, always regenerate
-        if not output_file.exists():
-            print(f"Output file {output_file} missing. Will regenerate {section}.")
-            return True
-            
-        # Check if input file has changed since last generation
-        current_hash = self.get_file_hash(input_file)
-        metadata = self.load_metadata()
-        
-        stored_hash = metadata.get(section, {}).get("input_hash", "")
-        if current_hash != stored_hash:
-            print(f"Input file {input_file} has changed. Will regenerate {section}.")
-            return True
-            
-        # No regeneration needed
-        return False
+    def missing_outputs(self, node: BuildNode) -> List[str]:
+        """Paths of the node's outputs that do not exist, relative to the output directory when inside it."""
+        return [
+            str(path.relative_to(self.output_dir)) if path.is_relative_to(self.output_dir) else path.name
+            for path in node.outputs if not path.exists()
+        ]
+
+    def stale_reason(self, node: BuildNode, inputs: Dict[str, str]) -> Optional[str]:
+        """Why a node has to be rebuilt, or None if it is up to date."""
+        missing = self.missing_outputs(node)
+        if missing:
+            return f"{', '.join(missing)} missing"
+        stored = self.metadata.get(node.name, {}).get("inputs")
+        if not stored:
+            return "no record of the last build"
+        changed = [name for name in sorted(set(stored) | set(inputs)) if stored.get(name) != inputs.get(name)]
+        if changed:
+            return f"{', '.join(changed)} changed"
+        return None
     
     def generate_section_prompt(self, section: str, notes: str) -> str:
         """Generate the OpenAI prompt for a specific section."""
@@ -292,6 +431,13 @@ class TechnicalReportGenerator:
         prompt = f"{base_context}\n\n{section_specific_prompts[section]}\n\nNotes for this section:\n{notes}\n\nGenerate the content for this section:"
 
         return prompt
+
+    def section_messages(self, section: str, notes: str) -> List[Dict[str, str]]:
+        """Chat messages that generate a section from its notes."""
+        return [
+            {"role": "system", "content": "You are an expert technical writer specializing in control systems and artificial intelligence research."},
+            {"role": "user", "content": self.generate_section_prompt(section, notes)}
+        ]
     
     def generate_section_content(self, section: str) -> Optional[str]:
         """Generate content for a specific section using OpenAI."""
@@ -312,67 +458,75 @@ class TechnicalReportGenerator:
         print(f"Generating content for {section}...")
         
         try:
-            prompt = self.generate_section_prompt(section, notes)
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an expert technical writer specializing in control systems and artificial intelligence research."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=2000,
-                temperature=0.7
-            )
+            messages = self.section_messages(section, notes)
+            print(f"  Prompt size: {self.token_counter.count(messages[-1]['content'])} tokens")
             
-            content = response.choices[0].message.content
+            content = chat_completion(self.client, messages=messages, **self.section_params)
             
             # Save generated content
             output_file = self.output_dir / f"{section}.txt"
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write(content)
-                
-            # Update metadata
-            metadata = self.load_metadata()
-            metadata[section] = {
-                "input_hash": self.get_file_hash(input_file),
-                "generated_at": datetime.now().isoformat(),
-                "output_file": str(output_file)
-            }
-            self.save_metadata(metadata)
             
             print(f"[OK] Generated {section}")
             return content
             
         except Exception as e:
             print(f"Error generating {section}: {e}")
+            self.section_errors[section] = str(e)
             return None
     
-    def generate_abstract_from_sections(self) -> Optional[str]:
-        """Generate abstract based on existing sections."""
-        print("Generating abstract from existing sections...")
-        
-        # Collect content from key sections
-        sections_for_abstract = [
-            "introduction", "methodology", 
-            "experimental_results", "discussion", "recommendations_future_work"
+    def digest_messages(self, section: str, content: str) -> List[Dict[str, str]]:
+        """Chat messages that condense a generated section into the digest the abstract is written from."""
+        prompt = f"""
+            Condense the following {self.section_titles[section]} section of a technical report into a digest for the author of its abstract.
+            List as short bullet points, and nothing else:
+            - The key claims and conclusions
+            - Every number reported, with what it measures
+            - The figures, tables and videos it refers to
+            
+            Use at most 150 words. Do not add anything that is not in the section.
+            
+            Section:
+            {content}
+            """
+        return [
+            {"role": "system", "content": "You are an expert technical editor who summarizes research precisely."},
+            {"role": "user", "content": prompt}
         ]
-        
-        combined_content = ""
-        for section in sections_for_abstract:
-            output_file = self.output_dir / f"{section}.txt"
-            if output_file.exists():
-                with open(output_file, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if content:
-                        combined_content += f"\n\n{self.section_titles[section]}:\n{content}"
-        
-        if not combined_content:
-            print("No existing sections found for abstract generation.")
+
+    def generate_section_digest(self, section: str) -> Optional[str]:
+        """Generate the digest of a generated section: its key claims, numbers and figures."""
+        output_file = self.output_dir / f"{section}.txt"
+        if not output_file.exists():
+            print(f"Output file {output_file} not found. Skipping {section} digest.")
             return None
-            
+
+        with open(output_file, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+
+        print(f"Generating digest for {section}...")
+
         try:
-            prompt = f"""
-            Based on the following technical report sections, write a concise abstract (maximum 250 words) that summarizes the research study comparing control systems for the {self.environment} environment. The abstract should include:
+            messages = self.digest_messages(section, content)
+            digest = chat_completion(self.client, messages=messages, **self.digest_params)
+
+            self.digests_dir.mkdir(exist_ok=True)
+            with open(self.digests_dir / f"{section}.txt", 'w', encoding='utf-8') as f:
+                f.write(digest.strip())
+
+            print(f"[OK] Generated {section} digest ({self.token_counter.count(content)} -> {self.token_counter.count(digest)} tokens)")
+            return digest
+
+        except Exception as e:
+            print(f"Error generating {section} digest: {e}")
+            self.section_errors[f"{section}_digest"] = str(e)
+            return None
+
+    def abstract_messages(self, combined_digests: str) -> List[Dict[str, str]]:
+        """Chat messages that write the abstract from the combined section digests."""
+        prompt = f"""
+            Based on the following digests of the technical report sections, listing their key claims, numbers and figures, write a concise abstract (maximum 250 words) that summarizes the research study comparing control systems for the {self.environment} environment. The abstract should include:
             1. Research objective and problem statement
             2. Methodology overview (PCT vs RL comparison)
             3. Key findings and results
@@ -380,75 +534,56 @@ class TechnicalReportGenerator:
             
             Make it a standalone summary that gives readers a complete overview of the work. IMPORTANT: Keep the abstract to 250 words or fewer.
             
-            Report content:
-            {combined_content}
+            Section digests:
+            {combined_digests}
             
             Generate a professional abstract:
             """
+        return [
+            {"role": "system", "content": "You are an expert technical writer specializing in research abstracts."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def generate_abstract_from_sections(self) -> Optional[str]:
+        """Generate abstract from the digests of existing sections."""
+        print("Generating abstract from section digests...")
+        
+        # Collect the digests of key sections
+        combined_digests = ""
+        for section in self.abstract_sections:
+            digest_file = self.digests_dir / f"{section}.txt"
+            if digest_file.exists():
+                with open(digest_file, 'r', encoding='utf-8') as f:
+                    digest = f.read().strip()
+                    if digest:
+                        combined_digests += f"\n\n{self.section_titles[section]}:\n{digest}"
+        
+        if not combined_digests:
+            print("No section digests found for abstract generation.")
+            return None
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an expert technical writer specializing in research abstracts."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=400,
-                temperature=0.7
-            )
+        try:
+            messages = self.abstract_messages(combined_digests)
+            print(f"  Prompt size: {self.token_counter.count(messages[-1]['content'])} tokens")
             
-            abstract_content = response.choices[0].message.content
+            abstract_content = chat_completion(self.client, messages=messages, **self.abstract_params)
             
             # Save generated abstract
             output_file = self.output_dir / "abstract.txt"
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write(abstract_content)
-                
-            # Update metadata
-            metadata = self.load_metadata()
-            metadata["abstract"] = {
-                "generated_from_sections": True,
-                "generated_at": datetime.now().isoformat(),
-                "output_file": str(output_file)
-            }
-            self.save_metadata(metadata)
             
-            print("[OK] Generated abstract from existing sections")
+            print("[OK] Generated abstract from section digests")
             return abstract_content
             
         except Exception as e:
             print(f"Error generating abstract: {e}")
+            self.section_errors["abstract"] = str(e)
             return None
     
-    def generate_sections(self) -> List[str]:
-        """Generate content for all sections that need updates."""
-        updated_sections = []
-        
-        # First, generate all regular sections (excluding abstract)
-        regular_sections = [s for s in self.sections if s != "abstract"]
-        
-        for section in regular_sections:
-            if self.needs_regeneration(section):
-                content = self.generate_section_content(section)
-                if content:
-                    updated_sections.append(section)
-        
-        # Generate abstract after other sections if any were updated
-        if updated_sections and "abstract" in self.sections:
-            abstract_content = self.generate_abstract_from_sections()
-            if abstract_content:
-                updated_sections.append("abstract")
-                    
-        return updated_sections
-        """Generate content for all sections that need updates."""
-        updated_sections = []
-        
-        for section in self.sections:
-            if self.needs_regeneration(section):
-                content = self.generate_section_content(section)
-                if content:
-                    updated_sections.append(section)
-                    
-        return updated_sections
+    def is_generated_section(self, name: str) -> bool:
+        """Whether a build node is a section, a section digest or the abstract."""
+        return name in self.sections or name.endswith("_digest")
     
     def create_pdf_styles(self):
         """Create custom styles for the PDF document."""
@@ -671,6 +806,22 @@ class TechnicalReportGenerator:
                 print(f"Error generating PDF: {e}")
                 return False
     
+    def bibtex_messages(self, refs_content: str) -> List[Dict[str, str]]:
+        """Chat messages that convert the references section to BibTeX entries."""
+        prompt = f"""Convert the following references to BibTeX format. 
+            Generate proper BibTeX entries with appropriate citation keys (e.g., powers1973, sutton2018, etc.).
+            Use standard BibTeX entry types (@article, @book, @inbook, @misc, etc.).
+            Ensure all entries are properly formatted and complete.
+            
+            References:
+            {refs_content}
+            
+            Generate only the BibTeX entries, no additional text:"""
+        return [
+            {"role": "system", "content": "You are an expert in bibliographic formatting and BibTeX."},
+            {"role": "user", "content": prompt}
+        ]
+
     def generate_bibtex(self, output_filename: str = "references.bib") -> bool:
         """Generate BibTeX file from references section."""
         references_file = self.output_dir / "references.txt"
@@ -680,16 +831,6 @@ class TechnicalReportGenerator:
         
         bibtex_path = self.output_dir / output_filename
         
-        # Check if BibTeX file already exists and references.txt hasn't changed
-        if bibtex_path.exists():
-            current_hash = self.get_file_hash(references_file)
-            metadata = self.load_metadata()
-            stored_hash = metadata.get("bibtex", {}).get("input_hash", "")
-            
-            if current_hash == stored_hash:
-                print(f"BibTeX file up to date (references.txt unchanged). Skipping regeneration.")
-                return True
-        
         print("Generating BibTeX file...")
         
         try:
@@ -697,27 +838,10 @@ class TechnicalReportGenerator:
                 refs_content = f.read().strip()
             
             # Use OpenAI to convert references to BibTeX format
-            prompt = f"""Convert the following references to BibTeX format. 
-            Generate proper BibTeX entries with appropriate citation keys (e.g., powers1973, sutton2018, etc.).
-            Use standard BibTeX entry types (@article, @book, @inbook, @misc, etc.).
-            Ensure all entries are properly formatted and complete.
+            messages = self.bibtex_messages(refs_content)
+            print(f"  Prompt size: {self.token_counter.count(messages[-1]['content'])} tokens")
             
-            References:
-            {refs_content}
-            
-            Generate only the BibTeX entries, no additional text:"""
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an expert in bibliographic formatting and BibTeX."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=2000,
-                temperature=0.3
-            )
-            
-            bibtex_content = response.choices[0].message.content
+            bibtex_content = chat_completion(self.client, messages=messages, **self.bibtex_params)
             
             # Clean markdown code fences if present
             import re
@@ -728,15 +852,6 @@ class TechnicalReportGenerator:
             with open(bibtex_path, 'w', encoding='utf-8') as f:
                 f.write(bibtex_content)
             
-            # Update metadata to track references.txt hash
-            metadata = self.load_metadata()
-            metadata["bibtex"] = {
-                "input_hash": self.get_file_hash(references_file),
-                "generated_at": datetime.now().isoformat(),
-                "output_file": str(bibtex_path)
-            }
-            self.save_metadata(metadata)
-            
             print(f"[OK] BibTeX file generated: {bibtex_path}")
             return True
             
@@ -757,7 +872,7 @@ class TechnicalReportGenerator:
         subtitle = self.get_report_subtitle()
         org = self.get_report_organization()
         report_number = self.get_report_number()
-        version = self.load_metadata().get("version", "1.0.0")
+        version = self.metadata.get("version", "1.0.0")
         
         # Generate citation key from author last name, year, and report number
         current_year = datetime.now().year
@@ -1471,8 +1586,35 @@ class TechnicalReportGenerator:
         
         return text
     
-    def compile_latex_to_pdf(self, latex_filename: str = "technical_report.tex") -> bool:
-        """Compile LaTeX file to PDF using pdflatex."""
+    def get_image_files(self) -> List[Path]:
+        """Image files in the input directory, which LaTeX figures may include."""
+        image_extensions = ['.png', '.jpg', '.jpeg', '.gif', '.pdf', '.eps']
+        return sorted(path for path in self.input_dir.iterdir() if path.is_file() and path.suffix.lower() in image_extensions)
+
+    def _latex_state(self, build_dir: Path, tex_basename: str) -> Dict[str, str]:
+        """Hashes of the files a pdflatex pass reads back in the next one."""
+        return {ext: self.get_file_hash(build_dir / f"{tex_basename}{ext}") for ext in (".aux", ".bbl", ".toc")}
+
+    def _aux_citations(self, aux_path: Path) -> str:
+        """Fingerprint of the citations, bibliography style and databases recorded in an .aux file, or "" if there are no citations."""
+        if not aux_path.exists():
+            return ""
+        with open(aux_path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = sorted(line.strip() for line in f if line.startswith(("\\citation{", "\\bibdata{", "\\bibstyle{")))
+        if not any(line.startswith("\\citation{") for line in lines):
+            return ""
+        return fingerprint(lines)
+
+    def compile_latex_to_pdf(self, latex_filename: str = "technical_report.tex", max_passes: int = 5) -> bool:
+        """
+        Compile LaTeX file to PDF using pdflatex, rerunning it only as often as needed.
+
+        Like latexmk, pdflatex is rerun until the .aux, .bbl and .toc files are the same after
+        a pass as before it and the log does not ask for a rerun, up to max_passes times.
+        bibtex runs only when the citations in the .aux or references.bib changed since it
+        last ran. Intermediate files are kept in latex_output/build between runs, so an
+        unchanged document usually compiles in a single pass.
+        """
         print("Compiling LaTeX to PDF...")
         
         latex_output_dir = self.output_dir / "latex_output"
@@ -1482,58 +1624,42 @@ class TechnicalReportGenerator:
             print(f"LaTeX file {latex_path} not found. Cannot compile.")
             return False
         
+        import shutil
+        
         # Copy references.bib to latex_output if it exists
         ref_source = self.output_dir / "references.bib"
         ref_dest = latex_output_dir / "references.bib"
         if ref_source.exists():
-            import shutil
             shutil.copy2(ref_source, ref_dest)
         
         # Copy image files from input to latex_output
-        import shutil
-        image_extensions = ['.png', '.jpg', '.jpeg', '.gif', '.pdf', '.eps']
-        for image_file in self.input_dir.iterdir():
-            if image_file.is_file() and image_file.suffix.lower() in image_extensions:
-                dest_file = latex_output_dir / image_file.name
-                shutil.copy2(image_file, dest_file)
-                print(f"  Copied image: {image_file.name}")
+        for image_file in self.get_image_files():
+            dest_file = latex_output_dir / image_file.name
+            shutil.copy2(image_file, dest_file)
+            print(f"  Copied image: {image_file.name}")
         
         try:
+            import re
             import subprocess
             
-            # Run pdflatex -> bibtex -> pdflatex -> pdflatex for bibliography
-            # Run from latex_output directory so all files stay there
-            print(f"  Running pdflatex (pass 1/3)...")
-            result = subprocess.run(
-                ['pdflatex', '-interaction=nonstopmode', latex_filename],
-                capture_output=True,
-                text=True,
-                cwd=str(latex_output_dir)
-            )
-            
-            if result.returncode != 0:
-                print(f"pdflatex error output:")
-                print(result.stdout)
-            
-            # Run bibtex
-            print(f"  Running bibtex...")
+            # Compile into a build directory that holds only what pdflatex and bibtex write,
+            # so the .aux of the last clean build seeds the first pass and no other files interfere
+            build_dir = latex_output_dir / "build"
+            build_dir.mkdir(exist_ok=True)
             tex_basename = Path(latex_filename).stem
-            bibtex_result = subprocess.run(
-                ['bibtex', tex_basename],
-                capture_output=True,
-                text=True,
-                cwd=str(latex_output_dir)
-            )
-            
-            if bibtex_result.returncode != 0:
-                print(f"bibtex warning (may be normal if no citations):")
-                print(bibtex_result.stdout)
+            # bibtex runs in the build directory and finds references.bib next to the source
+            bibtex_env = {**os.environ, "BIBINPUTS": str(latex_output_dir) + os.pathsep}
+            built_pdf = build_dir / f"{tex_basename}.pdf"
+            pdf_path = latex_output_dir / latex_filename.replace('.tex', '.pdf')
+            bibtex_ran = False
+            bibtex_checked = False
             
-            # Run pdflatex two more times to resolve references
-            for run in range(2, 4):
-                print(f"  Running pdflatex (pass {run}/3)...")
+            # Rerun pdflatex until the .aux, .bbl and .toc stop changing and the log asks for no rerun
+            for run in range(1, max_passes + 1):
+                before = self._latex_state(build_dir, tex_basename)
+                print(f"  Running pdflatex (pass {run})...")
                 result = subprocess.run(
-                    ['pdflatex', '-interaction=nonstopmode', latex_filename],
+                    ['pdflatex', '-interaction=nonstopmode', f'-output-directory={build_dir.name}', latex_filename],
                     capture_output=True,
                     text=True,
                     cwd=str(latex_output_dir)
@@ -1542,12 +1668,50 @@ class TechnicalReportGenerator:
                 if result.returncode != 0:
                     print(f"pdflatex error output:")
                     print(result.stdout)
-                    if run == 3:  # Only fail on final run
-                        return False
+                    # Keep whatever PDF was produced, but do not seed the next compilation with
+                    # the output of a failed pass
+                    if built_pdf.exists():
+                        shutil.copy2(built_pdf, pdf_path)
+                    shutil.rmtree(build_dir, ignore_errors=True)
+                    return False
+                
+                # Run bibtex after the first pass, only if the citations or references.bib changed
+                if not bibtex_checked:
+                    bibtex_checked = True
+                    bibtex_inputs = {
+                        "citations": self._aux_citations(build_dir / f"{tex_basename}.aux"),
+                        "references.bib": self.get_file_hash(ref_dest)
+                    }
+                    bbl_exists = (build_dir / f"{tex_basename}.bbl").exists()
+                    if bibtex_inputs["citations"] and (not bbl_exists or self.metadata.get("latex_bibtex") != bibtex_inputs):
+                        print(f"  Running bibtex...")
+                        bibtex_result = subprocess.run(
+                            ['bibtex', tex_basename],
+                            capture_output=True,
+                            text=True,
+                            cwd=str(build_dir),
+                            env=bibtex_env
+                        )
+                        bibtex_ran = True
+                        
+                        if bibtex_result.returncode != 0:
+                            print(f"bibtex warning (may be normal if no citations):")
+                            print(bibtex_result.stdout)
+                        # Exit status 1 means warnings only
+                        if bibtex_result.returncode <= 1:
+                            self.metadata.set("latex_bibtex", bibtex_inputs)
+                
+                log_path = build_dir / f"{tex_basename}.log"
+                log = log_path.read_text(encoding='utf-8', errors='replace') if log_path.exists() else ""
+                rerun = re.search(r"Rerun to get|Please rerun|Rerun LaTeX", log, re.IGNORECASE)
+                if self._latex_state(build_dir, tex_basename) == before and not rerun:
+                    break
+            else:
+                print(f"  Warning: references still changing after {max_passes} passes.")
             
-            pdf_path = latex_output_dir / latex_filename.replace('.tex', '.pdf')
-            if pdf_path.exists():
-                print(f"[OK] LaTeX PDF compiled: {pdf_path}")
+            if built_pdf.exists():
+                shutil.copy2(built_pdf, pdf_path)
+                print(f"[OK] LaTeX PDF compiled: {pdf_path} ({run} pdflatex pass{'es' if run > 1 else ''}, bibtex {'run' if bibtex_ran else 'skipped'})")
                 return True
             else:
                 print("PDF file not created after compilation.")
@@ -1562,8 +1726,232 @@ class TechnicalReportGenerator:
             print(f"Error compiling LaTeX: {e}")
             return False
     
-    def run(self, force_regenerate: bool = False, pdf_only: bool = False, concatenate_only: bool = False, latex: bool = False, compile_latex_only: bool = False) -> bool:
-        """Main execution method."""
+    def section_node(self, section: str) -> BuildNode:
+        """Build node of a section generated from its notes."""
+        input_file = self.input_dir / f"{section}.md"
+
+        def inputs():
+            if not input_file.exists() or not input_file.read_text(encoding='utf-8').strip():
+                return None
+            return {
+                "notes": self.get_file_hash(input_file),
+                "prompt": fingerprint(self.section_messages(section, "")),
+                "model": fingerprint(self.section_params),
+                "environment": fingerprint(self.environment)
+            }
+
+        return BuildNode(
+            section, [], inputs,
+            lambda: self.generate_section_content(section) is not None,
+            [self.output_dir / f"{section}.txt"]
+        )
+
+    def build_graph(self) -> Dict[str, BuildNode]:
+        """
+        Declare every artifact of the report, in dependency order.
+
+        LLM outputs, including the section digests, are fingerprinted by their notes or
+        upstream outputs, prompt, model parameters and environment; documents by the section
+        outputs and title information they are made from; the compiled LaTeX PDF by its
+        source, bibliography and images.
+        """
+        def file_hashes(sections, suffix=".txt"):
+            directory = self.input_dir if suffix == ".md" else self.output_dir
+            return {f"{section}{suffix}": self.get_file_hash(directory / f"{section}{suffix}") for section in sections}
+
+        def digest_inputs(section):
+            output = file_hashes([section])
+            if not any(output.values()):
+                return None
+            return {
+                **output,
+                "prompt": fingerprint(self.digest_messages(section, "")),
+                "model": fingerprint(self.digest_params)
+            }
+
+        def abstract_inputs():
+            outputs = {f"digests/{section}.txt": self.get_file_hash(self.digests_dir / f"{section}.txt") for section in digest_sections}
+            if not any(outputs.values()):
+                return None
+            return {
+                **outputs,
+                "prompt": fingerprint(self.abstract_messages("")),
+                "model": fingerprint(self.abstract_params),
+                "environment": fingerprint(self.environment)
+            }
+
+        def notes_inputs():
+            return {**file_hashes(self.sections, ".md"), "environment": fingerprint(self.environment)}
+
+        def bibtex_inputs():
+            if not (self.output_dir / "references.txt").exists():
+                return None
+            return {
+                **file_hashes(["references"]),
+                "prompt": fingerprint(self.bibtex_messages("")),
+                "model": fingerprint(self.bibtex_params)
+            }
+
+        def document_inputs(sections):
+            outputs = file_hashes(sections)
+            if not any(outputs.values()):
+                return None
+            title = [
+                self.get_report_title(), self.get_report_subtitle(), self.get_author_name(), self.get_author_email(),
+                self.get_report_organization(), self.get_report_number(), self.get_report_url()
+            ]
+            return {**outputs, "title": fingerprint(title)}
+
+        def latex_pdf_inputs():
+            latex_output_dir = self.output_dir / "latex_output"
+            return {
+                "technical_report.tex": self.get_file_hash(latex_output_dir / "technical_report.tex"),
+                "references.bib": self.get_file_hash(self.output_dir / "references.bib"),
+                **{path.name: self.get_file_hash(path) for path in self.get_image_files()}
+            }
+
+        regular_sections = [s for s in self.sections if s != "abstract"]
+        # LaTeX takes the references from references.bib instead of references.txt
+        latex_sections = [s for s in self.sections if s != "references"]
+
+        # The abstract is written from digests of these sections, so edits that leave their
+        # key claims, numbers and figures unchanged do not reach it
+        digest_sections = [s for s in self.abstract_sections if s in regular_sections]
+
+        nodes = [self.section_node(section) for section in regular_sections]
+        nodes += [
+            BuildNode(
+                f"{section}_digest", [section], lambda section=section: digest_inputs(section),
+                lambda section=section: self.generate_section_digest(section) is not None,
+                [self.digests_dir / f"{section}.txt"]
+            )
+            for section in digest_sections
+        ]
+        if "abstract" in self.sections:
+            nodes.append(BuildNode(
+                "abstract", [f"{section}_digest" for section in digest_sections], abstract_inputs,
+                lambda: self.generate_abstract_from_sections() is not None,
+                [self.output_dir / "abstract.txt"]
+            ))
+        nodes += [
+            BuildNode(
+                "concatenated_notes", [], notes_inputs, self.concatenate_input_files,
+                [self.input_dir / "all_sections_notes.md"]
+            ),
+            BuildNode(
+                "bibtex", ["references"], bibtex_inputs, self.generate_bibtex,
+                [self.output_dir / "references.bib"]
+            ),
+            BuildNode(
+                "latex", latex_sections, lambda: document_inputs(latex_sections), self.generate_latex,
+                [self.output_dir / "latex_output" / "technical_report.tex"]
+            ),
+            BuildNode(
+                "latex_pdf", ["latex", "bibtex"], latex_pdf_inputs, self.compile_latex_to_pdf,
+                [self.output_dir / "latex_output" / "technical_report.pdf"]
+            ),
+            BuildNode(
+                "pdf", list(self.sections), lambda: document_inputs(self.sections), self.generate_pdf,
+                [self.output_dir / "technical_report.pdf"]
+            )
+        ]
+        return {node.name: node for node in nodes}
+
+    def build(self, nodes: Dict[str, BuildNode], force: bool = False) -> Dict[str, str]:
+        """
+        Build the stale nodes, running independent ones concurrently.
+
+        A node starts once its dependencies are done; dependencies not in nodes are used as
+        they are on disk. With force every node that has something to build from is rebuilt. Returns the state of each node: "built", "current" (up to date),
+        "skipped" (nothing to build it from), "failed", or "blocked" (a dependency failed).
+        """
+        states: Dict[str, str] = {}
+        waiting = dict(nodes)
+        running = {}
+        self.section_errors = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+            while waiting or running:
+                for name, node in list(waiting.items()):
+                    deps = [dep for dep in node.deps if dep in nodes]
+                    if any(dep not in states for dep in deps):
+                        continue
+                    del waiting[name]
+                    failed = [dep for dep in deps if states[dep] in ("failed", "blocked")]
+                    if failed:
+                        print(f"Not building {name} because {', '.join(failed)} failed.")
+                        states[name] = "blocked"
+                    else:
+                        running[pool.submit(self._build_node, node, force)] = name
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        states[running.pop(future)] = future.result()
+
+        failed = [name for name, state in states.items() if state == "failed"]
+        if failed:
+            print(f"\nFailed: {', '.join(failed)}")
+            for section, error in self.section_errors.items():
+                print(f"  {section}: {error}")
+        return states
+
+    def _build_node(self, node: BuildNode, force: bool) -> str:
+        try:
+            inputs = node.inputs()
+            if inputs is None:
+                return "skipped"
+            reason = "forced" if force else self.stale_reason(node, inputs)
+            if reason is None:
+                print(f"{node.name} is up to date.")
+                return "current"
+            print(f"Building {node.name}: {reason}.")
+            if not node.action():
+                return "failed"
+        except Exception as e:
+            print(f"Error building {node.name}: {e}")
+            if node.name in self.section_titles:
+                self.section_errors[node.name] = str(e)
+            return "failed"
+
+        # Record what the output was built from
+        self.metadata.set(node.name, {"inputs": inputs, "built_at": datetime.now().isoformat()})
+        return "built"
+
+    def print_plan(self, nodes: Dict[str, BuildNode], force: bool = False):
+        """Print what build() would do with the nodes, without building anything."""
+        print("Build plan:")
+        rebuilt = set()
+        for name, node in nodes.items():
+            inputs = node.inputs()
+            upstream = [dep for dep in node.deps if dep in rebuilt]
+            if inputs is not None:
+                reason = "forced" if force else self.stale_reason(node, inputs)
+            elif upstream and self.missing_outputs(node):
+                reason = f"{', '.join(self.missing_outputs(node))} missing"
+            else:
+                reason = None
+            # Otherwise whether a node after a rebuilt one is stale depends on what the rebuild produces
+            if reason:
+                action = "build"
+            elif upstream:
+                action, reason = "maybe", f"if {', '.join(upstream)} change"
+            elif inputs is None:
+                action, reason = "skip", "nothing to build from"
+            else:
+                action, reason = "keep", "up to date"
+            if action in ("build", "maybe"):
+                rebuilt.add(name)
+            print(f"  {action:<6} {name:<28} {reason}")
+
+    def run(self, force_regenerate: bool = False, pdf_only: bool = False, concatenate_only: bool = False, latex: bool = False, compile_latex_only: bool = False, dry_run: bool = False) -> bool:
+        """Main execution method. Metadata changes are written to disk once the run ends, even if it fails, except in a dry run."""
+        try:
+            return self._run(force_regenerate, pdf_only, concatenate_only, latex, compile_latex_only, dry_run)
+        finally:
+            if not dry_run:
+                self.metadata.flush()
+
+    def _run(self, force_regenerate: bool, pdf_only: bool, concatenate_only: bool, latex: bool, compile_latex_only: bool, dry_run: bool) -> bool:
         print("Technical Report Generator")
         print(f"Environment: {self.environment}")
         print("=" * 50)
@@ -1571,67 +1959,44 @@ class TechnicalReportGenerator:
         # Load title information from title.md
         self.load_title_info()
         
-        # If only compiling LaTeX to PDF
+        # Pick the artifacts to bring up to date
+        graph = self.build_graph()
         if compile_latex_only:
-            return self.compile_latex_to_pdf()
-        
-        # If only concatenating input files
-        if concatenate_only:
-            return self.concatenate_input_files()
-        
-        if not pdf_only:
-            if force_regenerate:
-                print("Force regenerating all sections...")
-                # Clear metadata to force regeneration
-                if self.metadata_file.exists():
-                    self.metadata_file.unlink()
-                    
-            updated_sections = self.generate_sections()
-            
+            targets = ["latex_pdf"]
+        elif concatenate_only:
+            targets = ["concatenated_notes"]
+        else:
+            targets = [name for name in graph if latex or name not in ("bibtex", "latex", "latex_pdf")]
+            if pdf_only:
+                # Use the section outputs on disk
+                targets = [name for name in targets if not self.is_generated_section(name)]
+        nodes = {name: graph[name] for name in targets}
+        
+        if force_regenerate:
+            print("Force rebuilding every selected artifact...")
+        
+        if dry_run:
+            self.print_plan(nodes, force_regenerate)
+            return True
+        
+        states = self.build(nodes, force_regenerate)
+        
+        if not (compile_latex_only or concatenate_only or pdf_only):
+            updated_sections = [name for name in self.sections if states.get(name) == "built"]
             if updated_sections:
                 print(f"\nUpdated sections: {', '.join(updated_sections)}")
             else:
                 print("\nNo sections needed updating.")
         
-        # Generate concatenated input file
-        self.concatenate_input_files()
-        
-        # Generate outputs based on flags
-        if not pdf_only:
-            any_sections_exist = any((self.output_dir / f"{section}.txt").exists() for section in self.sections)
-        else:
-            any_sections_exist = True
-            
-        if any_sections_exist:
-            success = True
-            
-            # Generate LaTeX if requested
-            if latex:
-                # Generate BibTeX first
-                bibtex_success = self.generate_bibtex()
-                success = success and bibtex_success
-                
-                # Generate LaTeX
-                latex_success = self.generate_latex()
-                success = success and latex_success
-                
-                # Compile LaTeX to PDF if LaTeX generation succeeded
-                if latex_success:
-                    compile_success = self.compile_latex_to_pdf()
-                    success = success and compile_success
-            
-            # Always generate ReportLab PDF
-            pdf_success = self.generate_pdf()
-            success = success and pdf_success
-            
-            print(f"\n{'=' * 50}")
-            print(f"Completed: {datetime.now().strftime('%B %d, %Y at %H:%M:%S')}")
-            print(f"{'=' * 50}")
-            
-            return success
-        else:
+        if states.get("pdf") == "skipped":
             print("No output sections found. Please ensure input files exist and run generation first.")
             return False
+        
+        print(f"\n{'=' * 50}")
+        print(f"Completed: {datetime.now().strftime('%B %d, %Y at %H:%M:%S')}")
+        print(f"{'=' * 50}")
+        
+        return all(state not in ("failed", "blocked") for state in states.values())
 
 def create_sample_input_files(input_dir: Path):
     """Create sample input files for demonstration."""
@@ -1813,11 +2178,12 @@ def main():
 Examples:
   %(prog)s --create-samples                    Create sample input files
   %(prog)s                                     Smart generation (recommended)
-  %(prog)s --force                            Force regenerate all sections
+  %(prog)s --force                            Force rebuild all sections and the PDF
   %(prog)s --pdf-only                         Generate PDF from existing outputs
   %(prog)s --latex                            Generate LaTeX and compile to PDF
   %(prog)s --compile-latex-only               Compile existing LaTeX to PDF only
   %(prog)s --concatenate-only                 Only concatenate input files
+  %(prog)s --latex --dry-run                  Show what would be rebuilt
   %(prog)s --environment "Lunar Lander"       Specify environment name
   %(prog)s --input-dir notes --output-dir reports    Use custom directories
   
@@ -1836,7 +2202,7 @@ Workflow:
     parser.add_argument("--environment", default="OpenAI Gym",
                         help="Environment name to include in title and content (default: OpenAI Gym)")
     parser.add_argument("--force", action="store_true", 
-                        help="Force regenerate all sections (ignores change detection)")
+                        help="Rebuild every artifact the other flags select, ignoring change detection; also applies to --compile-latex-only and --concatenate-only")
     parser.add_argument("--pdf-only", action="store_true", 
                         help="Only generate PDF from existing output files (no AI generation)")
     parser.add_argument("--latex", action="store_true",
@@ -1847,17 +2213,26 @@ Workflow:
                         help="Only concatenate input files into a single file (no AI generation or PDF)")
     parser.add_argument("--create-samples", action="store_true", 
                         help="Create sample input files with template content")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore cached AI responses and send every request again (same as CHATGPT_CACHE_BYPASS=1)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Maximum number of sections generated at the same time (default: 4)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Print which artifacts are stale and would be rebuilt, without building anything")
     
     args = parser.parse_args()
+    if args.no_cache:
+        get_llm_cache().bypass = True
     
-    generator = TechnicalReportGenerator(args.input_dir, args.output_dir, args.environment)
+    generator = TechnicalReportGenerator(args.input_dir, args.output_dir, args.environment, args.workers)
     
     if args.create_samples:
         create_sample_input_files(generator.input_dir)
         return
     
-    success = generator.run(force_regenerate=args.force, pdf_only=args.pdf_only, concatenate_only=args.concatenate_only, latex=args.latex, compile_latex_only=args.compile_latex_only)
+    success = generator.run(force_regenerate=args.force, pdf_only=args.pdf_only, concatenate_only=args.concatenate_only, latex=args.latex, compile_latex_only=args.compile_latex_only, dry_run=args.dry_run)
     
+    print(get_llm_cache().summary())
     if success:
         print("\n[OK] Report generation completed successfully!")
     else:
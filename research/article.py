@@ -1,25 +1,78 @@
 from openai import OpenAI
 import docx
 import os
-from PyPDF2 import PdfReader
-from tiktoken import encoding_for_model, get_encoding
+import asyncio
 import json
+import threading
+
+from research.chunker import TokenChunker
+from research.cleanup import PageCleaner, cleanup_key
+from research.engine import PROMPT_VERSION, SummarizationEngine, article_key, summary_messages
+from research.extraction import EXTRACTOR_VERSION, iter_units, pdf_pool
+from research.extraction_cache import ExtractionCache
+from research.history import HISTORY_SUMMARY_ROLE, HistoryManager, history_summary_prompt
+from research.journal import SummaryJournal
+from research.retrieval import BM25Index, build_passages
+from research.session_store import SessionStore, session_name
+from utils.batch import BatchRunner, chat_request, custom_id
+from utils.files import file_sha256
+from utils.llm import chat_completion, stream_chat_completion
+from utils.models import estimate_cost, input_budget, plan_chunk_size
+from utils.rate_limit import get_rate_limiter
+from utils.tokens import get_counter, get_encoding
 
 class ArticleQuery:
-    def __init__(self):
+    def __init__(self, max_concurrency=8, cache_extractions=True, pdf_workers=None, parallel_min_pages=64, history_budget=None, journal_summaries=True, model="gpt-4o-mini", clean_pdfs=True, references="keep", dehyphenate=False):
         """
         Initializes the ArticleSummarizer with the OpenAI API key.
 
+        Args:
+            max_concurrency (int): Maximum number of summarization calls in flight at once.
+            cache_extractions (bool): Whether to keep extracted PDF/DOCX text in the on-disk cache.
+            pdf_workers (int): Number of processes used to extract large PDFs, shared by all the
+                files extracted at once. Defaults to the CPU count.
+            parallel_min_pages (int): PDFs with fewer pages are extracted in a single process.
+            history_budget (int): Maximum number of input tokens sent per chat request. Older
+                turns are folded into a rolling summary to stay under it. Defaults to what a
+                request to the model can hold next to its reply.
+            journal_summaries (bool): Whether to record completed summaries so that interrupted
+                runs resume and unchanged articles are not summarized again.
+            model (str): Chat model. Its context window and prices come from utils.models.
+            clean_pdfs (bool): Whether to remove running headers, footers and page numbers from
+                extracted PDF text.
+            references (str): What cleanup does with the references section of a PDF: "keep",
+                "drop" or "compress" to the start of each entry.
+            dehyphenate (bool): Whether cleanup rejoins words hyphenated across line breaks.
         """
         self.client = OpenAI()
-        self.model="gpt-4o-mini"
-        if self.model == "gpt-4o-mini":
-            self.model_limit=200000
+        self.model = model
+        # A single request can exceed neither the context window nor the tokens-per-minute limit
+        self.model_limit = input_budget(self.model, max_request_tokens=int(get_rate_limiter(self.model).tokens.capacity))
+        self.engine = SummarizationEngine(self, max_concurrency=max_concurrency)
+        self.extraction_cache = ExtractionCache() if cache_extractions else None
+        self.journal = SummaryJournal() if journal_summaries else None
+        self.pdf_workers = pdf_workers
+        self._pdf_pool = None
+        self._pdf_pool_lock = threading.Lock()
+        self.parallel_min_pages = parallel_min_pages
+        # Identifies the cleanup settings in summary keys and index sources
+        self.cleanup = cleanup_key(clean_pdfs, references, dehyphenate)
+        self.references = references
+        self.dehyphenate = dehyphenate
+        self.cleanup_stats = {}
+        self.history = HistoryManager(get_counter(self.model), history_budget or self.model_limit, self.summarize_history)
+        self.compactions = []
+        self.sessions = SessionStore()
+        self.saved_messages = 0
+        self.indexes = {}
 
     def read_file_content(self, file_path):
         """
         Reads the content of a file based on its format.
 
+        Text extracted from PDF and DOCX files is cached on disk, so reading the same file
+        again skips parsing.
+
         Args:
             file_path (str): Path to the file.
 
@@ -31,55 +84,169 @@ class ArticleQuery:
         if file_extension.lower() == ".txt":
             with open(file_path, 'r', encoding='utf-8') as file:
                 return file.read()
-        elif file_extension.lower() == ".pdf":
-            reader = PdfReader(file_path)
-            return " ".join(page.extract_text() for page in reader.pages)
-        elif file_extension.lower() == ".docx":
-            doc = docx.Document(file_path)
-            return " ".join(paragraph.text for paragraph in doc.paragraphs)
-        else:
+        return "".join(self.iter_file_content(file_path))
+
+    def iter_file_content(self, file_path, block_size=1024 * 1024):
+        """
+        Reads the content of a file piece by piece, so large documents never have to be held
+        in memory as one string.
+
+        PDFs are read a page at a time and DOCX files a paragraph at a time, through the
+        on-disk extraction cache.
+
+        Args:
+            file_path (str): Path to the file.
+            block_size (int): Number of characters per piece of a text file.
+
+        Yields:
+            str: Pieces whose concatenation is the content returned by read_file_content.
+        """
+        _, file_extension = os.path.splitext(file_path)
+
+        if file_extension.lower() == ".txt":
+            yield from self.iter_file_units(file_path, block_size)
+            return
+
+        for idx, unit in enumerate(self.iter_file_units(file_path)):
+            yield unit if idx == 0 else " " + unit
+
+    def iter_file_units(self, file_path, block_size=1024 * 1024):
+        """
+        Reads a file one unit at a time: PDF pages, DOCX paragraphs or blocks of a text file.
+
+        PDF pages are cleaned up unless clean_pdfs was turned off.
+
+        Args:
+            file_path (str): Path to the file.
+            block_size (int): Number of characters per block of a text file.
+
+        Yields:
+            str: The text of each unit.
+        """
+        _, file_extension = os.path.splitext(file_path)
+
+        if file_extension.lower() == ".txt":
+            with open(file_path, 'r', encoding='utf-8') as file:
+                yield from iter(lambda: file.read(block_size), "")
+            return
+        elif file_extension.lower() not in (".pdf", ".docx"):
             raise ValueError(f"Unsupported file format: {file_extension}")
 
+        units = self.extraction_cache.iter_units(file_path, EXTRACTOR_VERSION) if self.extraction_cache else None
+        if units is None:
+            units = iter_units(file_path, self.pdf_workers, self.parallel_min_pages, self.pdf_pool())
+            if self.extraction_cache:
+                units = self.extraction_cache.record(file_path, EXTRACTOR_VERSION, units)
+        if file_extension.lower() == ".pdf" and self.cleanup != "none":
+            units = self.clean_pages(file_path, units)
+        yield from units
+
+    def pdf_pool(self):
+        """Returns the process pool shared by every PDF this object extracts, starting it on first use."""
+        with self._pdf_pool_lock:
+            if self._pdf_pool is None:
+                self._pdf_pool = pdf_pool(self.pdf_workers)
+            return self._pdf_pool
+
+    def close_pdf_pool(self):
+        """Shuts down the PDF extraction processes. The next extraction starts new ones."""
+        with self._pdf_pool_lock:
+            pool, self._pdf_pool = self._pdf_pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def clean_pages(self, file_path, pages):
+        """
+        Removes repeated headers, footers and page numbers from the pages of a PDF.
 
+        The raw text stays in the extraction cache, so the cleanup settings can change
+        without extracting again. What was removed is printed once the document has been
+        read and kept in self.cleanup_stats.
 
+        Args:
+            file_path (str): Path to the PDF.
+            pages (iterable): The extracted text of each page.
 
-    def summarize_in_chunks(self, content, chunk_size=90000):
+        Yields:
+            str: The cleaned text of each page.
         """
-        Summarizes content in chunks if it exceeds the token limit.
+        cleaner = PageCleaner(get_counter(self.model), references=self.references, dehyphenate=self.dehyphenate)
+        yield from cleaner.clean(pages)
+        self.cleanup_stats[os.path.abspath(file_path)] = cleaner.stats
+        print(cleaner.summary(file_path))
+
+    def summary_key(self, file_path, chunk_size, overlap=0):
+        """
+        Builds the key under which a file's summaries are journaled.
+
+        The key changes whenever the file contents, the extractor, the cleanup settings, the
+        summary prompt, the model or the chunking change, so stale summaries are never reused.
 
         Args:
-            content (str): The content to summarize.
-            chunk_size (int): Approximate size of each chunk in tokens.
+            file_path (str): Path to the file.
+            chunk_size (int): Maximum size of each chunk in tokens.
+            overlap (int): Number of tokens repeated between consecutive chunks.
 
         Returns:
-            str: Combined summary of all chunks.
-        """
-        print(f"Content size: {len(content)} characters")
-        chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
-        summaries = []
-
-        for idx, chunk in enumerate(chunks):
-            print(f"Processing chunk {idx + 1}/{len(chunks)}... (size: {len(chunk)} characters)")
-            system_role = "You are an expert academic specializing in summarizing research papers."
-            user_prompt = (
-                f"Summarize this academic article chunk by identifying its main thesis, key arguments, "
-                f"and any objections or counterarguments it addresses. Provide a clear and concise "
-                f"explanation of the author's reasoning, including any philosophical concepts or theories "
-                f"they rely on. If relevant, highlight the implications of the argument and how it contributes "
-                f"to the broader discussion:\n\n"
-                f"{chunk}"
-            )
+            str: The summary key.
+        """
+        digest = self.extraction_cache.file_digest(file_path) if self.extraction_cache else file_sha256(file_path)
+        return f"{digest}:{EXTRACTOR_VERSION}:{self.cleanup}:{PROMPT_VERSION}:{self.model}:{chunk_size}:{overlap}"
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_role},
-                    {"role": "user", "content": user_prompt}
-                ]
-            )
-            summaries.append(response.choices[0].message.content)
+    def make_chunker(self, chunk_size, overlap=0):
+        """
+        Creates a chunker that splits text on paragraph and sentence boundaries.
+
+        Args:
+            chunk_size (int): Maximum size of each chunk in tokens.
+            overlap (int): Number of tokens repeated between consecutive chunks.
+
+        Returns:
+            TokenChunker: A chunker using the encoding of the model.
+        """
+        return TokenChunker(get_encoding(self.model), chunk_size, overlap)
+
+    def plan_chunk_size(self, content=None, batch=False):
+        """
+        Picks the summary chunk size that needs the fewest requests for the model.
+
+        Each chunk leaves room for the summary instructions and the reply within the model's
+        context window and, for interactive requests, within the tokens-per-minute limit,
+        which a single request cannot exceed.
+
+        Args:
+            content (str or iterable): The content to be summarized. When it is a string the
+                chunks are also evened out; pieces of a file are not counted in advance.
+            batch (bool): Whether the chunks go through the Batch API, which has no
+                per-minute limit.
+
+        Returns:
+            int: Maximum size of each chunk in tokens.
+        """
+        prompt_tokens = self.history.tokens(summary_messages(""))
+        total_tokens = self.get_token_count(content) if isinstance(content, str) else None
+        max_request_tokens = None if batch else int(get_rate_limiter(self.model).tokens.capacity)
+        return plan_chunk_size(self.model, prompt_tokens, total_tokens, max_request_tokens=max_request_tokens)
+
+    def summarize_in_chunks(self, content, chunk_size=None, overlap=0):
+        """
+        Summarizes content in chunks if it exceeds the token limit.
 
-        return "\n\n".join(summaries)
+        The chunks are sent concurrently by the summarization engine, and their summaries are
+        merged in parallel groups, level by level, into one final synthesis.
+
+        Args:
+            content (str or iterable): The content to summarize, or an iterable of pieces of it
+                such as the one returned by iter_file_content.
+            chunk_size (int): Maximum size of each chunk, and of the input of each merge, in
+                tokens. Defaults to the size planned for the model by plan_chunk_size.
+            overlap (int): Number of tokens repeated between consecutive chunks.
+
+        Returns:
+            str: Synthesis of the whole content.
+        """
+        chunk_size = chunk_size or self.plan_chunk_size(content)
+        return asyncio.run(self.engine.summarize_content(content, chunk_size, overlap))
 
     def summarize_article(self, file_path):
         """
@@ -91,26 +258,21 @@ class ArticleQuery:
         Returns:
             str: A string containing the summary and BibTeX citation.
         """
-        article_content = self.read_file_content(file_path)
-
-        # token_count = self.get_token_count(article_content)
-        # print(f"Token count: {token_count}")
-        return self.summarize_in_chunks(article_content)
+        return self.summarize_in_chunks(self.iter_file_content(file_path))
 
     def get_token_count(self, text):
         """
         Calculates the number of tokens in a given text for a specific model.
 
+        Counts are memoized by the shared token counter, so repeated texts are not re-encoded.
+
         Args:
             text (str): The text to tokenize.
-            model (str): The model to use for tokenization.
 
         Returns:
             int: The number of tokens in the text.
         """
-        encoding = encoding_for_model(self.model)
-        # encoding = get_encoding(model)
-        return len(encoding.encode(text))
+        return get_counter(self.model).count(text)
 
 
     def save_to_word(self, results, output_file):
@@ -129,85 +291,395 @@ class ArticleQuery:
 
         doc.save(output_file)
 
-    def process_articles(self, file_paths, output_file):
+    def summarize_files_batch(self, file_paths, chunk_size=None, overlap=0, poll_interval=30):
+        """
+        Summarizes several files through the Batch API instead of interactive requests.
+
+        Every chunk still missing from the summary journal becomes one batch request, with a
+        custom ID derived from the file's summary key and the chunk index, so results are
+        matched back to their chunks even across reruns and partially completed batches.
+        The chunk summaries of each file are then reduced to a synthesis with interactive
+        requests, as there are far fewer of those.
+
+        Args:
+            file_paths (list): Paths of the files to summarize.
+            chunk_size (int): Maximum size of each chunk in tokens. Defaults to the size
+                planned for the model by plan_chunk_size.
+            overlap (int): Number of tokens repeated between consecutive chunks.
+            poll_interval (float): Seconds between batch status checks.
+
+        Returns:
+            list: One entry per file, in input order. Each entry is the summary string, or the
+                exception raised while processing that file.
+        """
+        chunk_size = chunk_size or self.plan_chunk_size(batch=True)
+        outcomes = [None] * len(file_paths)
+        jobs = []
+        requests = []
+        for position, file_path in enumerate(file_paths):
+            try:
+                key = self.summary_key(file_path, chunk_size, overlap)
+                summary = self.journal.article_summary(article_key(key)) if self.journal else None
+                if summary is not None:
+                    print(f"Unchanged, using the journaled summary: {file_path}")
+                    outcomes[position] = summary
+                    continue
+                print(f"Processing: {file_path}")
+                done = self.journal.chunk_summaries(key) if self.journal else {}
+                chunk_count = 0
+                for idx, chunk in enumerate(self.make_chunker(chunk_size, overlap).chunks(self.iter_file_content(file_path))):
+                    chunk_count += 1
+                    if idx not in done:
+                        requests.append(chat_request(custom_id("summary", key, idx), self.model, summary_messages(chunk)))
+                jobs.append((position, file_path, key, chunk_count, done))
+            except Exception as e:
+                outcomes[position] = e
+
+        results = {}
+        if requests:
+            # The job is named after its requests, so an interrupted run finds its batches again
+            name = custom_id("summaries", sorted(request["custom_id"] for request in requests))
+            results = BatchRunner(self.client, name, poll_interval=poll_interval).run(requests)
+
+        for position, file_path, key, chunk_count, done in jobs:
+            summaries = []
+            for idx in range(chunk_count):
+                if idx in done:
+                    summaries.append(done[idx])
+                    continue
+                result = results.get(custom_id("summary", key, idx), {"error": "no result"})
+                if "content" not in result:
+                    outcomes[position] = RuntimeError(f"chunk {idx + 1} failed: {result['error']}")
+                    break
+                if self.journal:
+                    self.journal.record_chunk(key, idx, result["content"])
+                summaries.append(result["content"])
+            else:
+                # The merges and synthesis are few, so they are sent interactively
+                try:
+                    outcomes[position] = asyncio.run(self.engine.reduce_summaries(summaries, chunk_size, key))
+                except Exception as e:
+                    outcomes[position] = e
+                    continue
+                if self.journal and chunk_count:
+                    self.journal.record_article(article_key(key), file_path, outcomes[position], chunk_count)
+        return outcomes
+
+    def process_articles(self, file_paths, output_file, chunk_size=None, batch=False):
         """
         Processes a list of academic articles and saves the results to a Word document.
 
+        Articles are extracted and summarized concurrently by the summarization engine; the
+        results keep the order of file_paths. With the summary journal enabled the document is
+        assembled from the journal, so rerunning after an interruption only summarizes what
+        is missing.
+
         Args:
             file_paths (list): List of file paths to the academic articles.
             output_file (str): Path to the output Word document.
+            chunk_size (int): Maximum size of each chunk in tokens. Defaults to the size
+                planned for the model by plan_chunk_size.
+            batch (bool): Whether to send the chunks through the Batch API, at a lower price
+                and without interactive rate limits, and wait for the batch to finish.
         """
+        chunk_size = chunk_size or self.plan_chunk_size(batch=batch)
+        try:
+            if batch:
+                outcomes = self.summarize_files_batch(file_paths, chunk_size)
+            else:
+                outcomes = asyncio.run(self.engine.summarize_files(file_paths, chunk_size))
+        finally:
+            self.close_pdf_pool()
+
         results = []
-        for file_path in file_paths:
-            print(f"Processing: {file_path}")
-            try:
-                result = self.summarize_article(file_path)
-                results.append(result)
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
+        for file_path, outcome in zip(file_paths, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"Error processing {file_path}: {outcome}")
+            elif self.journal:
+                results.append(self.journal.article_summary(article_key(self.summary_key(file_path, chunk_size))))
+            else:
+                results.append(outcome)
 
         self.save_to_word(results, output_file)
 
 
-    def submit_in_chunks(self, content=None):
+    def submit_in_chunks(self, content=None, overlap=0):
         """
-        Summarizes content in chunks if it exceeds the token limit.
+        Submits content to the conversation in chunks that fit the model's token limit.
 
-        Args:
-            content (str): The content to summarize.
-            chunk_size (int): Approximate size of each chunk in tokens.
+        Chunks are produced lazily, so a document given as an iterable of pieces is never
+        held in memory in full.
 
-        Returns:
-            str: Combined summary of all chunks.
+        Args:
+            content (str or iterable): The content to submit, or an iterable of pieces of it
+                such as the one returned by iter_file_content.
+            overlap (int): Number of tokens repeated between consecutive chunks.
         """
-        tokens = self.get_token_count(content)
-        characters = len(content)
-        print(f"Content size: {characters} characters, {tokens} tokens")
-        chunk_size = min(1000000, int(self.model_limit * characters / tokens))
-        chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
-
-        for idx, chunk in enumerate(chunks):
-            print(f"Processing chunk {idx + 1}/{len(chunks)}... (size: {len(chunk)} characters)")
-            user_prompt = f"Here is part {idx+1} of {len(chunks)} parts of a document: {chunk}"
+        if isinstance(content, str):
+            print(f"Content size: {len(content)} characters")
+        # Each part has to fit in the request next to the recent turns and the rolling summary
+        chunks = self.make_chunker(self.history.recent_tokens - 100, overlap).chunks(content)
+
+        # Look one chunk ahead so the last part can be marked as such
+        chunk = next(chunks, None)
+        idx = 0
+        while chunk is not None:
+            next_chunk = next(chunks, None)
+            print(f"Processing chunk {idx + 1}... (size: {len(chunk)} characters)")
+            if next_chunk is None:
+                user_prompt = f"Here is part {idx+1}, the final part, of a document: {chunk}"
+            else:
+                user_prompt = f"Here is part {idx+1} of a document: {chunk}"
             self.conversation_history.append( {"role": "user", "content": user_prompt})
             self.send_history_request()
+            chunk = next_chunk
+            idx += 1
 
-    def send_history_request(self):
-         # Call the OpenAI API
-        response = self.client.chat.completions.create(
-            model=self.model,  # Choose the model
-            messages=self.conversation_history
-        )
+    def send_history_request(self, messages=None, stream=False):
+        """
+        Sends the conversation and appends the assistant's reply to the history.
+
+        The history is compacted first if it has grown past the history budget.
 
-        # Extract assistant response
-        assistant_reply = response.choices[0].message.content
+        Args:
+            messages (list): Messages to send instead of the conversation history, e.g. the
+                history with retrieved passages added to the last question. The caller is
+                responsible for compacting the history before building them.
+            stream (bool): Whether to print the reply as it arrives. The time to the first
+                token and the token rate are printed once the reply is complete.
+        """
+        if messages is None:
+            self.compact_history()
+        messages = messages or self.conversation_history
+        tokens = self.history.tokens(messages)
+        cost = estimate_cost(self.model, tokens)
+        print(f"Sending {len(messages)} messages ({tokens} tokens" + (f", ${cost:.4f} of input)" if cost is not None else ")"))
+        if tokens > self.history.budget:
+            print(f"Warning: conversation exceeds the history budget of {self.history.budget} tokens")
+
+         # Call the OpenAI API, or reuse the reply to an identical earlier request
+        if stream:
+            assistant_reply, stats = stream_chat_completion(
+                self.client, self.model, messages, on_delta=lambda delta: print(delta, end="", flush=True)
+            )
+            print()
+            if stats["cached"]:
+                print(f"[cached reply, {stats['tokens']} tokens]")
+            else:
+                rate = f"{stats['tokens_per_second']:.1f} tokens/s" if stats["tokens_per_second"] else "n/a tokens/s"
+                print(f"[first token after {stats['time_to_first_token']:.2f}s, {stats['tokens']} tokens at {rate}]")
+        else:
+            assistant_reply = chat_completion(self.client, self.model, messages)
         
         # Append assistant response to conversation history
         self.conversation_history.append({"role": "assistant", "content": assistant_reply})
 
 
-    def chat_with_gpt(self, file_path = "test", user_input = "", system_message = None):
-        history_file = os.path.splitext(file_path)[0] + ".json"
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-               self.conversation_history = json.load(f)
+    def compact_history(self, reserve=0):
+        """
+        Folds older turns of the conversation into a rolling summary if it is over budget.
+
+        What was folded is kept in self.compactions so it can be saved alongside the history.
+
+        Args:
+            reserve (int): Tokens that will be sent on top of the history.
+        """
+        self.conversation_history, record = self.history.compact(self.conversation_history, reserve)
+        if record:
+            print(
+                f"Compacted {record['messages']} messages into the history summary "
+                f"({record['tokens_before']} -> {record['tokens_after']} tokens)"
+            )
+            self.compactions.append(record)
+
+    def summarize_history(self, summary, transcript, max_tokens):
+        """
+        Folds part of the conversation into the running summary.
+
+        Args:
+            summary (str): The summary so far, or an empty string.
+            transcript (str): The messages being folded in.
+            max_tokens (int): Maximum length of the updated summary.
+
+        Returns:
+            str: The updated summary.
+        """
+        return chat_completion(
+            self.client,
+            self.model,
+            [
+                {"role": "system", "content": HISTORY_SUMMARY_ROLE},
+                {"role": "user", "content": history_summary_prompt(summary, transcript)}
+            ],
+            max_tokens=max_tokens
+        )
+
+    def load_retrieval_index(self, file_path, passage_tokens=400):
+        """
+        Loads the passage index of a document, building it if it is missing or out of date.
+
+        The index is stored as <document>.index.json.gz next to the document, with the file's
+        size and mtime and the settings that shape its passages: passage size, tokenizer
+        encoding, extractor version and cleanup. An index written under other settings is
+        rebuilt, since its passage offsets may no longer match.
+
+        Args:
+            file_path (str): Path to the document.
+            passage_tokens (int): Maximum size of a passage in tokens.
+
+        Returns:
+            BM25Index: The index of the document's passages.
+        """
+        index_file = os.path.splitext(file_path)[0] + ".index.json.gz"
+        stat = os.stat(file_path)
+        source = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "passage_tokens": passage_tokens,
+            "encoding": get_encoding(self.model).name,
+            "extractor": EXTRACTOR_VERSION,
+            "cleanup": self.cleanup
+        }
+
+        # Indexes stay loaded for the life of the object, e.g. in the chat daemon
+        index = self.indexes.get(os.path.abspath(file_path))
+        if index and index.source == source:
+            return index
+        if os.path.exists(index_file):
+            index = BM25Index.load(index_file)
+            if index and index.source == source:
+                self.indexes[os.path.abspath(file_path)] = index
+                return index
+
+        print(f"Indexing {file_path}...")
+        is_pdf = os.path.splitext(file_path)[1].lower() == ".pdf"
+        passages = build_passages(
+            self.iter_file_units(file_path),
+            self.make_chunker(passage_tokens, overlap=passage_tokens // 8),
+            group_units=not is_pdf
+        )
+        index = BM25Index(passages, source=source)
+        index.save(index_file)
+        self.indexes[os.path.abspath(file_path)] = index
+        print(f"Indexed {len(passages)} passages to {index_file}")
+        return index
+
+    def retrieval_prompt(self, file_path, user_input, index, top_k=5):
+        """
+        Builds a question that carries the passages of the document most relevant to it.
+
+        Args:
+            file_path (str): Path to the document.
+            user_input (str): The question.
+            index (BM25Index): The index of the document's passages.
+            top_k (int): Number of passages to include.
+
+        Returns:
+            str: The question preceded by the retrieved passages and their locations.
+        """
+        is_pdf = os.path.splitext(file_path)[1].lower() == ".pdf"
+        unit = "page" if is_pdf else "part"
+        excerpts = []
+        for _, passage in index.search(user_input, top_k):
+            if passage["first"] == passage["last"]:
+                location = f"{unit} {passage['first']}"
+            else:
+                location = f"{unit}s {passage['first']}-{passage['last']}"
+            excerpts.append(f"[{location}]\n{passage['text']}")
+        if not excerpts:
+            return user_input
+        return (
+            f"Excerpts from {os.path.basename(file_path)} that may be relevant, with their locations:\n\n"
+            + "\n\n".join(excerpts)
+            + f"\n\nUsing these excerpts, answer the following and cite the locations you rely on:\n{user_input}"
+        )
+
+    def load_session(self, file_path):
+        """
+        Loads the conversation about a document from the session store.
+
+        A conversation saved as <document>.json by older versions is imported the first time
+        the document is used.
+
+        Args:
+            file_path (str): Path to the document.
+
+        Returns:
+            bool: Whether there was an earlier conversation.
+        """
+        name = session_name(file_path)
+        history_file = name + ".json"
+        if not self.sessions.exists(name) and os.path.exists(history_file):
+            count = self.sessions.import_json(name, history_file)
+            print(f"Imported {count} messages from {history_file}")
+        self.conversation_history = self.sessions.load(name)
+        self.saved_messages = len(self.conversation_history)
+        return bool(self.conversation_history)
+
+    def save_session(self, file_path):
+        """
+        Saves the conversation about a document to the session store.
+
+        Only the messages added since it was loaded are written, unless the history was
+        compacted, in which case the compacted history replaces it.
+
+        Args:
+            file_path (str): Path to the document.
+        """
+        name = session_name(file_path)
+        if self.compactions:
+            epoch = self.sessions.replace(name, self.conversation_history)
+            for record in self.compactions:
+                record["epoch"] = epoch
+        else:
+            self.sessions.append(name, self.conversation_history[self.saved_messages:])
+        self.saved_messages = len(self.conversation_history)
+
+    def chat_with_gpt(self, file_path = "test", user_input = "", system_message = None, retrieval = False, top_k = 5, stream = False):
+        """
+        Asks a question about a document, keeping the conversation in the session store.
+
+        By default the first call submits the whole document to the conversation and later
+        calls resend it with every question. In retrieval mode the document is indexed
+        instead, and each question is sent with only the top_k most relevant passages.
+
+        Args:
+            file_path (str): Path to the document.
+            user_input (str): The question.
+            system_message (str): Optional system message to add to the conversation.
+            retrieval (bool): Whether to send retrieved passages instead of the whole document.
+            top_k (int): Number of passages sent with each question in retrieval mode.
+            stream (bool): Whether to print the answer as it arrives.
+        """
+        # The daemon reuses this object, so drop anything a failed question left behind
+        self.compactions = []
+        has_history = self.load_session(file_path)
+        if retrieval:
             if system_message:
                 self.conversation_history.append({"role": "system", "content": system_message})
+            index = self.load_retrieval_index(file_path)
+            question = {"role": "user", "content": self.retrieval_prompt(file_path, user_input, index, top_k)}
+            self.compact_history(reserve=self.history.message_tokens(question))
+            # Only the plain question is kept, so the passages are not resent with later questions
             self.conversation_history.append({"role": "user", "content": user_input})
-            self.send_history_request()
+            self.send_history_request(self.conversation_history[:-1] + [question], stream=stream)
+        elif has_history:
+            if system_message:
+                self.conversation_history.append({"role": "system", "content": system_message})
+            self.conversation_history.append({"role": "user", "content": user_input})
+            self.send_history_request(stream=stream)
         else:
             # Append user input to conversation history
             self.conversation_history = [
             {"role": "system", "content": system_message}
             ]
-            document = self.read_file_content(file_path)
-            self.submit_in_chunks(document)
-            # tokens = self.get_token_count(document)
-            # print(f"Token count: {tokens}")
-
-         # Save updated history to file
-        with open(history_file, "w") as history_file:
-            json.dump(self.conversation_history, history_file, indent=4)
+            self.submit_in_chunks(self.iter_file_content(file_path))
 
-    
+        self.save_session(file_path)
 
+        # Log each compaction on one line; the folded turns stay in the earlier epoch of the session
+        if self.compactions:
+            with open(os.path.splitext(file_path)[0] + ".compactions.jsonl", "a", encoding="utf-8") as f:
+                for record in self.compactions:
+                    f.write(json.dumps(record) + "\n")
+            self.compactions = []
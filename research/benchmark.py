@@ -0,0 +1,426 @@
+"""
+Benchmarks the research pipeline on synthetic documents against the local stand-in API.
+
+    python -m research.benchmark --pages 40 --documents 4 --latency 0.2 --error_rate 0.05 -o run.json
+    python -m research.benchmark --pages 40 --documents 4 --latency 0.2 --error_rate 0.05 --compare run.json
+
+Each run generates PDF and DOCX files of the requested size, starts utils.fake_openai with the
+requested latency and error rate, and times read_file_content, get_token_count,
+summarize_in_chunks, chat_with_gpt and process_articles with every cache starting empty. The
+report lists wall time, throughput and the peak RSS sampled during each stage (where
+/proc/self/statm can be read), with the process high-water mark for the whole run, and is
+saved as JSON, so two runs can be compared stage by stage.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import docx
+
+from utils.fake_openai import serve
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+WORDS = (
+    "the of and to in a is that for it as was with be by on not he this are or his from at which "
+    "but have an they you were her she there been one all we their has would when if so no will "
+    "more can out other into some time could than my then these two may first any like now only "
+    "its over such our also new after most made what where over memory neuron signal model cortex "
+    "learning behaviour response stimulus network analysis result effect control sample method "
+    "trial measure evidence activity pattern feature theory data figure table section"
+).split()
+
+
+def synthetic_text(words, rng):
+    """
+    Generates prose-like filler text.
+
+    Args:
+        words (int): Number of words.
+        rng (random.Random): Source of randomness.
+
+    Returns:
+        str: Sentences of 8 to 24 words grouped into paragraphs of 3 to 7 sentences.
+    """
+    paragraphs = []
+    sentences = []
+    remaining = words
+    while remaining > 0:
+        length = min(remaining, rng.randint(8, 24))
+        sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+        remaining -= length
+        if len(sentences) >= rng.randint(3, 7):
+            paragraphs.append(" ".join(sentences))
+            sentences = []
+    if sentences:
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+
+def _wrap(text, width):
+    lines = []
+    for paragraph in text.split("\n\n"):
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+        lines.append("")
+    return lines
+
+
+def write_pdf(path, pages):
+    """
+    Writes a PDF with one page of Helvetica text per string, without a PDF library.
+
+    Args:
+        path (str): Path of the PDF.
+        pages (list): Text of each page.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in pages:
+        lines = _wrap(text, 95)
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET"
+        stream = stream.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{idx} 0 R" for idx in page_ids).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for idx, obj in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % idx + obj + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def write_docx(path, text):
+    """
+    Writes a DOCX with one paragraph per blank-line-separated block of text.
+
+    Args:
+        path (str): Path of the DOCX.
+        text (str): The text.
+    """
+    document = docx.Document()
+    for paragraph in text.split("\n\n"):
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def make_documents(folder, count, pages, words_per_page, seed=0):
+    """
+    Generates synthetic documents, alternating between PDF and DOCX.
+
+    Args:
+        folder (str): Folder to write them to.
+        count (int): Number of documents.
+        pages (int): Pages per document; a DOCX holds as many words as a PDF of this length.
+        words_per_page (int): Words per page.
+        seed (int): Seed of the generated text.
+
+    Returns:
+        list: Paths of the documents.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for idx in range(count):
+        texts = [synthetic_text(words_per_page, rng) for _ in range(pages)]
+        if idx % 2 == 0:
+            path = os.path.join(folder, f"document{idx}.pdf")
+            write_pdf(path, texts)
+        else:
+            path = os.path.join(folder, f"document{idx}.docx")
+            write_docx(path, "\n\n".join(texts))
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of the process so far in MiB, or None where unavailable.
+
+    This is a high-water mark over the whole process, not over any one stage.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    """Returns the current resident set size of the process in MiB, or None where unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class RssSampler:
+    """
+    Samples the resident set size on a background thread to find the peak within a stage.
+
+    Short spikes between samples are missed, so the peak is a lower bound. Where the current
+    RSS cannot be read the peak is None.
+    """
+
+    def __init__(self, interval=0.005):
+        """
+        Args:
+            interval (float): Seconds between samples.
+        """
+        self.interval = interval
+        self.peak = current_rss_mb()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        """Starts sampling."""
+        if self.peak is not None:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops sampling.
+
+        Returns:
+            float: The highest RSS seen since start in MiB, or None where unavailable.
+        """
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._record()
+        return self.peak
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            self._record()
+
+    def _record(self):
+        rss = current_rss_mb()
+        if rss is not None and self.peak is not None:
+            self.peak = max(self.peak, rss)
+
+
+class StageTimer:
+    """Records the wall time, peak RSS and throughput of each stage of a run."""
+
+    def __init__(self, api, verbose=False):
+        """
+        Args:
+            api (FakeOpenAI): State of the stand-in API, for request and error counts.
+            verbose (bool): Whether to let the stages print their progress.
+        """
+        self.api = api
+        self.verbose = verbose
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, **work):
+        """
+        Times a stage.
+
+        Args:
+            name (str): Name of the stage.
+            **work: Amounts of work done by the stage, e.g. pages=40, reported per second.
+
+        Yields:
+            dict: The stage's record; work amounts only known afterwards can be added to
+                record["work"].
+        """
+        record = {"work": dict(work)}
+        requests, errors = self.api.requests, self.api.errors
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        print(f"{name}...", end=" ", flush=True)
+        sampler = RssSampler().start()
+        start = time.perf_counter()
+        try:
+            with output:
+                yield record
+        finally:
+            peak = sampler.stop()
+        seconds = time.perf_counter() - start
+        record.update({
+            "seconds": seconds,
+            "peak_rss_mb": peak,
+            "requests": self.api.requests - requests,
+            "injected_errors": self.api.errors - errors
+        })
+        record["throughput"] = {f"{unit}_per_second": amount / seconds for unit, amount in record["work"].items() if seconds > 0}
+        self.stages[name] = record
+        print(f"{seconds:.3f}s")
+
+
+def run(args):
+    """
+    Runs the benchmark.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+
+    Returns:
+        dict: The report.
+    """
+    workdir = tempfile.mkdtemp(prefix="research-benchmark-")
+    # Every cache, the journal and the sessions start empty in the scratch directory
+    os.environ["CHATGPT_CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["CHATGPT_CACHE_BYPASS"] = "1"
+    server = serve(0, latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    if args.rpm:
+        os.environ["OPENAI_RPM"] = str(args.rpm)
+    if args.tpm:
+        os.environ["OPENAI_TPM"] = str(args.tpm)
+
+    run_start = time.perf_counter()
+    timer = StageTimer(server.api, args.verbose)
+    with timer.stage("generate_documents", documents=args.documents, pages=args.documents * args.pages):
+        paths = make_documents(workdir, args.documents, args.pages, args.words_per_page, args.seed)
+
+    with timer.stage("import"):
+        from research.article import ArticleQuery
+        query = ArticleQuery(
+            max_concurrency=args.concurrency, cache_extractions=False,
+            history_budget=args.history_budget, journal_summaries=False
+        )
+
+    contents = []
+    for path in paths[:2]:
+        kind = os.path.splitext(path)[1][1:]
+        with timer.stage(f"read_file_content.{kind}", pages=args.pages) as record:
+            content = query.read_file_content(path)
+            record["work"]["characters"] = len(content)
+        contents.append(content)
+
+    with timer.stage("get_token_count") as record:
+        tokens = sum(query.get_token_count(content) for content in contents)
+        record["work"]["tokens"] = tokens
+
+    with timer.stage("summarize_in_chunks", tokens=query.get_token_count(contents[0])):
+        query.summarize_in_chunks(contents[0], chunk_size=args.chunk_size)
+
+    with timer.stage("chat_with_gpt.submit", pages=args.pages):
+        query.chat_with_gpt(paths[0], "Here is a document for review.", "You are a benchmark.", stream=False)
+    with timer.stage("chat_with_gpt.question", questions=args.questions):
+        for idx in range(args.questions):
+            query.chat_with_gpt(paths[0], f"What does section {idx} say about memory?", stream=False)
+    with timer.stage("chat_with_gpt.retrieval", questions=args.questions):
+        for idx in range(args.questions):
+            query.chat_with_gpt(paths[1], f"What does section {idx} say about memory?", retrieval=True, stream=False)
+
+    with timer.stage("process_articles", documents=len(paths), pages=len(paths) * args.pages):
+        query.process_articles(paths, os.path.join(workdir, "summaries.docx"), chunk_size=args.chunk_size)
+
+    server.shutdown()
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {name: value for name, value in vars(args).items() if name not in ("output", "compare", "verbose")},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "commit": _git_commit()
+        },
+        "wall_seconds": time.perf_counter() - run_start,
+        "peak_rss_mb": peak_rss_mb(),
+        "requests": server.api.requests,
+        "injected_errors": server.api.errors,
+        "stages": timer.stages
+    }
+
+
+def compare(report, baseline):
+    """
+    Prints the time of each stage next to a baseline run.
+
+    Args:
+        report (dict): This run's report.
+        baseline (dict): The report to compare with.
+    """
+    print(f"\n{'stage':<28}{'baseline':>12}{'this run':>12}{'change':>10}")
+    for name, stage in report["stages"].items():
+        before = baseline["stages"].get(name, {}).get("seconds")
+        after = stage["seconds"]
+        change = f"{(after - before) / before:+.0%}" if before else ""
+        before = f"{before:.3f}s" if before is not None else "-"
+        print(f"{name:<28}{before:>12}{after:>11.3f}s{change:>10}")
+    print(f"{'total':<28}{baseline['wall_seconds']:>11.3f}s{report['wall_seconds']:>11.3f}s"
+          f"{(report['wall_seconds'] - baseline['wall_seconds']) / baseline['wall_seconds']:>+10.0%}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the research pipeline against a local stand-in API.")
+    parser.add_argument("--documents", type=int, default=4, help="Number of synthetic documents, alternately PDF and DOCX (at least 2).")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per document.")
+    parser.add_argument("--words_per_page", type=int, default=500, help="Words per page.")
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds each chat completion takes.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of chat completions that fail with a 429 or a 500.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the documents and of the error injection.")
+    parser.add_argument("--chunk_size", type=int, default=4000, help="Chunk size for summarization, in tokens.")
+    parser.add_argument("--history_budget", type=int, default=16000, help="History budget for chat, in tokens.")
+    parser.add_argument("--questions", type=int, default=3, help="Questions asked in each chat stage.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum summarization requests in flight.")
+    parser.add_argument("--rpm", type=int, help="Requests per minute allowed by the client-side rate limiter.")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute allowed by the client-side rate limiter.")
+    parser.add_argument("-o", "--output", help="Where to save the report as JSON.")
+    parser.add_argument("--compare", help="Report of an earlier run to compare with.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the output of each stage.")
+    args = parser.parse_args()
+    if args.documents < 2:
+        parser.error("--documents must be at least 2, so that both a PDF and a DOCX are read")
+
+    report = run(args)
+    rss = f"{report['peak_rss_mb']:.1f} MiB" if report["peak_rss_mb"] is not None else "n/a"
+    print(f"Total {report['wall_seconds']:.3f}s, peak RSS over the run {rss}, "
+          f"{report['requests']} requests ({report['injected_errors']} injected errors)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        print(f"Report saved to {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
@@ -1,5 +1,8 @@
 import argparse
-from research.article import ArticleQuery
+import os
+import sys
+
+from research.daemon import send_request
 
 """
 
@@ -13,15 +16,47 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--file", required=True, help="Path to the file to process.")
     parser.add_argument("-u", "--user_input", required=True, help="User input for the GPT interaction.")
     parser.add_argument("-s", "--system_message", required=False, help="System message for the GPT interaction.")
+    parser.add_argument("-r", "--retrieval", action="store_true", help="Send only the passages most relevant to the question instead of the whole document.")
+    parser.add_argument("-k", "--top_k", type=int, default=5, help="Number of passages sent with each question in retrieval mode.")
+    parser.add_argument("--no_stream", action="store_true", help="Wait for the complete answer instead of printing it as it arrives.")
+    parser.add_argument("--no_daemon", action="store_true", help="Answer in this process even if the chat daemon (python -m research.daemon) is running.")
+    parser.add_argument("--references", choices=("keep", "drop", "compress"), default="keep", help="What to do with the references section of PDFs.")
+    parser.add_argument("--no_cleanup", action="store_true", help="Keep the running headers, footers and page numbers of PDFs.")
+    parser.add_argument("--dehyphenate", action="store_true", help="Rejoin words that PDFs hyphenate across line breaks.")
+    parser.add_argument("-m", "--model", default="gpt-4o-mini", help="Chat model; see utils/models.py for the known models.")
+    parser.add_argument("-b", "--history_budget", type=int, required=False, help="Maximum number of input tokens per request; older turns are summarized to stay under it.")
+
+    parser.add_argument("--no-cache", action="store_true", help="Ignore cached responses and send every request again. Setting CHATGPT_CACHE_BYPASS=1 does the same.")
 
     # Parse the arguments
     args = parser.parse_args()
 
-    # Create an instance of ArticleQuery
-    article = ArticleQuery()
-
-    # Call the chat_with_gpt method from ArticleQuery
-    article.chat_with_gpt(file_path=args.file, user_input=args.user_input, system_message=args.system_message)
-
-
-
+    options = {"history_budget": args.history_budget, "model": args.model, "clean_pdfs": not args.no_cleanup, "references": args.references, "dehyphenate": args.dehyphenate}
+    chat_args = {
+        "file_path": os.path.abspath(args.file),
+        "user_input": args.user_input,
+        "system_message": args.system_message,
+        "retrieval": args.retrieval,
+        "top_k": args.top_k,
+        "stream": not args.no_stream
+    }
+
+    # Ask the warm daemon if one is running, so this process only parses arguments
+    try:
+        handled = not args.no_daemon and send_request({"command": "chat", "options": options, "args": chat_args, "no_cache": args.no_cache})
+    except RuntimeError as e:
+        sys.exit(f"The daemon failed to answer:\n{e}")
+
+    if not handled:
+        # Imported here so the client does not pay for it when the daemon answers
+        from research.article import ArticleQuery
+        from utils.llm_cache import get_llm_cache
+
+        if args.no_cache:
+            get_llm_cache().bypass = True
+
+        # Create an instance of ArticleQuery
+        article = ArticleQuery(**options)
+
+        # Call the chat_with_gpt method from ArticleQuery
+        article.chat_with_gpt(**chat_args)
@@ -0,0 +1,160 @@
+import re
+from bisect import bisect_left, bisect_right
+
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+WHITESPACE = re.compile(r"\s+")
+
+
+class TokenChunker:
+    """
+    Splits text into chunks with an exact token budget.
+
+    Every piece of text is encoded once. Chunk ends are snapped to the last paragraph break
+    that fits the budget, falling back to a sentence end, then to whitespace, and only then
+    to a hard cut at the budget. Chunks are yielded one at a time, and text given as an
+    iterable of pieces is consumed lazily, so only about one chunk of text is held at a time.
+    """
+
+    def __init__(self, encoding, max_tokens, overlap=0):
+        """
+        Args:
+            encoding (tiktoken.Encoding): Encoding used to count tokens.
+            max_tokens (int): Maximum number of tokens in a chunk.
+            overlap (int): Number of tokens at the end of a chunk that are repeated at the
+                start of the next one.
+        """
+        if max_tokens <= 0:
+            raise ValueError(f"max_tokens must be positive, got {max_tokens}")
+        if not 0 <= overlap < max_tokens:
+            raise ValueError(f"overlap must be between 0 and max_tokens - 1, got {overlap}")
+        self.encoding = encoding
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    def chunks(self, content):
+        """
+        Yields the chunks of a text.
+
+        Args:
+            content (str or iterable): The text to split, or an iterable of pieces (such as
+                pages) whose concatenation is the text.
+
+        Yields:
+            str: Consecutive chunks of at most max_tokens tokens each.
+        """
+        pieces = [content] if isinstance(content, str) else content
+        window = _Window()
+        for piece in pieces:
+            window.append(piece, self.encoding)
+            while len(window) > self.max_tokens:
+                yield self._take_chunk(window)
+        while len(window) > self.max_tokens:
+            yield self._take_chunk(window)
+        if len(window):
+            yield window.text_until(len(window))
+
+    def _take_chunk(self, window):
+        """Cuts the next chunk from the front of the window and drops it, keeping the overlap."""
+        end = self._cut(window)
+        chunk = window.text_until(end)
+        window.drop(self._next_start(end, window))
+        return chunk
+
+    def _cut(self, window):
+        """Latest break in the second half of the budget, preferring paragraphs over sentences over words."""
+        lowest = window.start + self.max_tokens // 2
+        highest = window.start + self.max_tokens
+        for positions, first in zip(window.breaks, window.first_breaks):
+            idx = bisect_right(positions, highest, first) - 1
+            if idx >= first and positions[idx] > lowest:
+                return positions[idx] - window.start
+        return self.max_tokens
+
+    def _next_start(self, end, window):
+        """Start of the next chunk, moved back by the overlap and snapped to a sentence or word start."""
+        if not self.overlap:
+            return end
+        earliest = window.start + end - self.overlap
+        for positions, first in zip(window.breaks[1:], window.first_breaks[1:]):
+            idx = bisect_left(positions, earliest, first)
+            if idx < len(positions) and positions[idx] < window.start + end:
+                return max(positions[idx] - window.start, 1)
+        return max(end - self.overlap, 1)
+
+
+class _Window:
+    """
+    Text not yet emitted as a chunk, with the start offset of each token and the break positions.
+
+    Token offsets and break positions are absolute. Dropping a chunk only moves the start
+    cursor; the emitted prefix is discarded once it makes up most of the buffer, so chunking
+    stays linear in the length of the text.
+    """
+
+    # Emitted tokens kept before the buffers are compacted
+    COMPACT_MIN = 4096
+
+    def __init__(self):
+        self.text = ""
+        self.offsets = []
+        self.breaks = ([], [], [])
+        self.start = 0
+        self.first_breaks = [0, 0, 0]
+
+    def __len__(self):
+        return len(self.offsets) - self.start
+
+    def text_until(self, token_count):
+        """Text of the first token_count tokens of the window."""
+        end = self.offsets[self.start + token_count] if self.start + token_count < len(self.offsets) else len(self.text)
+        return self.text[self.offsets[self.start]:end]
+
+    def append(self, piece, encoding):
+        tokens = encoding.encode(piece, disallowed_special=())
+        if not tokens:
+            return
+        _, offsets = encoding.decode_with_offsets(tokens)
+        base_char = len(self.text)
+        base_token = len(self.offsets)
+        for positions, pattern in zip(self.breaks, (PARAGRAPH_BREAK, SENTENCE_END, WHITESPACE)):
+            positions.extend(base_token + idx for idx in _token_breaks(pattern, piece, offsets))
+        self.text += piece
+        self.offsets.extend(base_char + offset for offset in offsets)
+
+    def drop(self, token_count):
+        self.start += token_count
+        self.first_breaks = [
+            bisect_right(positions, self.start, first) for positions, first in zip(self.breaks, self.first_breaks)
+        ]
+        if self.start >= self.COMPACT_MIN and self.start * 2 >= len(self.offsets):
+            self._compact()
+
+    def _compact(self):
+        """Discards the emitted prefix of the buffers."""
+        char_count = self.offsets[self.start]
+        self.text = self.text[char_count:]
+        self.offsets = [offset - char_count for offset in self.offsets[self.start:]]
+        self.breaks = tuple(
+            [position - self.start for position in positions[first:]]
+            for positions, first in zip(self.breaks, self.first_breaks)
+        )
+        self.start = 0
+        self.first_breaks = [0, 0, 0]
+
+
+def _token_breaks(pattern, text, offsets):
+    """
+    Token indices at which text matching pattern gives way to a new unit.
+
+    Encodings attach leading whitespace to the following word, so the cut goes at the last
+    token that starts inside or right after the match.
+    """
+    positions = []
+    for match in pattern.finditer(text):
+        idx = bisect_right(offsets, match.end()) - 1
+        if idx < 0 or offsets[idx] < match.start():
+            idx = bisect_left(offsets, match.end())
+        positions.append(idx)
+    return positions
@@ -0,0 +1,324 @@
+import itertools
+import math
+import re
+from collections import Counter
+
+
+# Bump whenever cleanup changes so summaries and indexes of the old output are not reused
+CLEANUP_VERSION = "2"
+REFERENCE_MODES = ("keep", "drop", "compress")
+REFERENCE_HEADING = re.compile(
+    r"^\s*(?:\d+\.?\s*)?(?:references|bibliography|literature cited|works cited|reference list)\s*:?\s*$", re.IGNORECASE
+)
+# Sections that usually follow the references and are worth keeping
+AFTER_REFERENCES = re.compile(
+    r"^\s*(?:[A-Z]\.?\s+|\d+\.?\s*)?(?:appendix|appendices|supplementary|supporting information|acknowledg)", re.IGNORECASE
+)
+PAGE_NUMBER = re.compile(r"^\W*(?:page\s*)?(\d+)(?:\s*(?:of|/)\s*\d+)?\W*$", re.IGNORECASE)
+HYPHENATED = re.compile(r"(\w+)-\n[ \t]*([a-z]\w*)")
+TRAILING_FRAGMENT = re.compile(r"(\w+)-\s*$")
+LEADING_FRAGMENT = re.compile(r"\s*([a-z]\w*)")
+VOCABULARY_WORD = re.compile(r"[a-z]+")
+ENTRY_START = re.compile(r"^\s*(?:\[\d+\]|\d+\.\s|[A-Z][\w'\-]+,\s+(?:[A-Z]\.|[A-Z][a-z]+))")
+LINK = re.compile(r"\s*(?:https?://\S+|doi:\s*\S+|\S*doi\.org/\S+)", re.IGNORECASE)
+WORD = re.compile(r"[a-z#]+")
+
+
+def cleanup_key(clean_pdfs=True, references="keep", dehyphenate=False):
+    """
+    Identifies a set of cleanup settings, for keys of anything built from cleaned text.
+
+    Args:
+        clean_pdfs (bool): Whether PDFs are cleaned at all.
+        references (str): What cleanup does with the references section.
+        dehyphenate (bool): Whether hyphenated words are rejoined.
+
+    Returns:
+        str: The key, which changes with CLEANUP_VERSION.
+    """
+    if not clean_pdfs:
+        return "none"
+    return f"{CLEANUP_VERSION}-{references}{'-dehyphenate' if dehyphenate else ''}"
+
+
+class PageCleaner:
+    """
+    Removes text that PDF extraction repeats on every page, without changing the page count.
+
+    Running headers, journal footers and page numbers are found by shingle frequency: the
+    lines at the top and bottom of the first pages are split into word shingles, with digits
+    masked so that "Page 3" and "Page 4" agree, and a line at the edge of a page is dropped
+    when most of its shingles recur on a good share of the sampled pages. A line holding only
+    a number is dropped as a page number when it counts up from the previous page or equals
+    the page index, so years and equation numbers stay. Optionally, words hyphenated across
+    a line or page break are rejoined when the document uses the joined word elsewhere and
+    not the left fragment on its own, so compounds like "well-known" keep their hyphen. The
+    references section can be kept, dropped, or compressed to the start of each entry
+    without links. Counts of what was removed and of the tokens before and after are kept
+    in stats.
+    """
+
+    def __init__(self, counter=None, references="keep", sample_pages=30, edge_lines=4, min_fraction=0.3, shingle_size=3, dehyphenate=False):
+        """
+        Args:
+            counter (TokenCounter): Counter used to report the tokens saved. Without one, only
+                lines and characters are counted.
+            references (str): What to do with the references section: "keep", "drop" or
+                "compress".
+            sample_pages (int): Number of leading pages used to learn the repeated lines. Only
+                these pages are held in memory at once.
+            edge_lines (int): Number of lines at the top and at the bottom of each page where
+                headers and footers are looked for.
+            min_fraction (float): Share of the sampled pages a shingle has to appear on to be
+                considered boilerplate. Alternating left and right page headers each appear on
+                half of the pages.
+            shingle_size (int): Number of words per shingle.
+            dehyphenate (bool): Whether to rejoin words hyphenated across line and page breaks.
+        """
+        if references not in REFERENCE_MODES:
+            raise ValueError(f"references must be one of {REFERENCE_MODES}, got {references!r}")
+        self.counter = counter
+        self.references = references
+        self.sample_pages = sample_pages
+        self.edge_lines = edge_lines
+        self.min_fraction = min_fraction
+        self.shingle_size = shingle_size
+        self.dehyphenate = dehyphenate
+        self.boilerplate = set()
+        self.vocabulary = set()
+        self.in_references = False
+        # Numbers found at the edges of the previous page, which the next page number follows
+        self._previous_numbers = set()
+        self.stats = {
+            "pages": 0,
+            "boilerplate_lines": 0,
+            "page_numbers": 0,
+            "reference_lines": 0,
+            "hyphenations": 0,
+            "hyphens_kept": 0,
+            "characters_before": 0,
+            "characters_after": 0,
+            "tokens_before": 0,
+            "tokens_after": 0
+        }
+
+    def clean(self, pages):
+        """
+        Cleans the pages of a document.
+
+        Args:
+            pages (iterable): The text of each page, in order.
+
+        Yields:
+            str: The cleaned text of each page. A page may come out empty, but every page
+                yields exactly one string.
+        """
+        pages = iter(pages)
+        sample = list(itertools.islice(pages, self.sample_pages))
+        self.boilerplate = self.learn(sample)
+        for text in sample:
+            self._add_vocabulary(text or "")
+
+        # Hold one page back so a word hyphenated across the page break can be rejoined
+        previous = None
+        for text in itertools.chain(sample, pages):
+            text = self.clean_page(text or "")
+            if previous is not None:
+                previous, text = self._join_pages(previous, text)
+                yield self._count_after(previous)
+            previous = text
+        if previous is not None:
+            yield self._count_after(previous)
+
+    def learn(self, pages):
+        """
+        Finds the shingles that recur at the edges of pages.
+
+        Pages too short to have body lines between their edges are skipped, since everything
+        on them would otherwise look like a header or footer. Lines holding only a number are left to
+        the page number check.
+
+        Args:
+            pages (list): The text of the sampled pages.
+
+        Returns:
+            set: The boilerplate shingles. Empty when there are too few pages to tell.
+        """
+        frequency = Counter()
+        learned = 0
+        for text in pages:
+            lines = (text or "").split("\n")
+            edges = self._edges(lines)
+            if not edges:
+                continue
+            shingles = set()
+            for idx in edges:
+                if not PAGE_NUMBER.match(lines[idx]):
+                    shingles.update(self.shingles(lines[idx]))
+            frequency.update(shingles)
+            learned += 1
+        if learned < 3:
+            return set()
+        threshold = max(2, math.ceil(self.min_fraction * learned))
+        return {shingle for shingle, count in frequency.items() if count >= threshold}
+
+    def shingles(self, line):
+        """Returns the word shingles of a line, with digits masked; short lines are one shingle."""
+        words = WORD.findall(re.sub(r"\d+", "#", line.lower()))
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)} if words else set()
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def is_boilerplate(self, line):
+        """Whether a line is mostly made of boilerplate shingles."""
+        shingles = self.shingles(line)
+        if not shingles or not self.boilerplate:
+            return False
+        return len(shingles & self.boilerplate) >= 0.8 * len(shingles)
+
+    def clean_page(self, text):
+        """
+        Cleans one page with the boilerplate learned so far.
+
+        Args:
+            text (str): The extracted text of the page.
+
+        Returns:
+            str: The cleaned text.
+        """
+        self.stats["pages"] += 1
+        self.stats["characters_before"] += len(text)
+        if self.counter:
+            self.stats["tokens_before"] += self.counter.count(text)
+
+        lines = text.split("\n")
+        edges = self._edges(lines)
+        numbers = set()
+        kept = []
+        references = []
+        for idx, line in enumerate(lines):
+            number = PAGE_NUMBER.match(line) if idx in edges else None
+            if number:
+                value = int(number.group(1))
+                numbers.add(value)
+                if value == self.stats["pages"] or value - 1 in self._previous_numbers:
+                    self.stats["page_numbers"] += 1
+                    continue
+            elif idx in edges and self.is_boilerplate(line):
+                self.stats["boilerplate_lines"] += 1
+                continue
+            if self.references != "keep":
+                if REFERENCE_HEADING.match(line):
+                    self.in_references = True
+                    if self.references == "compress":
+                        kept.append(line)
+                    continue
+                if self.in_references and AFTER_REFERENCES.match(line):
+                    self.in_references = False
+                    kept.extend(self._compressed(references))
+                    references = []
+                if self.in_references:
+                    self.stats["reference_lines"] += 1
+                    references.append(line)
+                    continue
+            kept.append(line)
+        kept.extend(self._compressed(references))
+        self._previous_numbers = numbers
+
+        text = "\n".join(kept)
+        self._add_vocabulary(text)
+        return HYPHENATED.sub(self._rejoin, text)
+
+    def joins(self, left, right):
+        """Whether a word split as left-right across a break is one word rather than a compound."""
+        if not self.dehyphenate:
+            return False
+        left = left.lower()
+        return left not in self.vocabulary and (left + right).lower() in self.vocabulary
+
+    def summary(self, name):
+        """Returns a one-line description of what was removed from a document."""
+        stats = self.stats
+        removed = [
+            f"{stats['boilerplate_lines']} header/footer lines",
+            f"{stats['page_numbers']} page numbers",
+            f"{stats['hyphenations']} hyphenations joined",
+            f"{stats['hyphens_kept']} kept"
+        ]
+        if self.references != "keep":
+            removed.append(f"{stats['reference_lines']} reference lines {'compressed' if self.references == 'compress' else 'dropped'}")
+        if self.counter and stats["tokens_before"]:
+            saved = stats["tokens_before"] - stats["tokens_after"]
+            result = f"{saved} of {stats['tokens_before']} tokens saved ({saved / stats['tokens_before']:.1%})"
+        else:
+            result = f"{stats['characters_before'] - stats['characters_after']} characters saved"
+        return f"Cleaned {name}: {', '.join(removed)}; {result}"
+
+    def _compressed(self, references):
+        return compress_references(references) if references and self.references == "compress" else []
+
+    def _edges(self, lines):
+        # Indices of the first and last non-blank lines. On a short page only the first and
+        # the last line count, or nothing would be left of the body.
+        filled = [idx for idx, line in enumerate(lines) if line.strip()]
+        if len(filled) <= 2:
+            return set()
+        if len(filled) <= 2 * self.edge_lines:
+            return {filled[0], filled[-1]}
+        return set(filled[:self.edge_lines] + filled[-self.edge_lines:])
+
+    def _add_vocabulary(self, text):
+        # Hyphenated fragments are left out so that they do not count as words
+        if self.dehyphenate:
+            text = TRAILING_FRAGMENT.sub(" ", HYPHENATED.sub(" ", text))
+            self.vocabulary.update(VOCABULARY_WORD.findall(text.lower()))
+
+    def _rejoin(self, match):
+        if self.joins(match.group(1), match.group(2)):
+            self.stats["hyphenations"] += 1
+            return match.group(1) + match.group(2)
+        self.stats["hyphens_kept"] += 1
+        return match.group(0)
+
+    def _join_pages(self, previous, text):
+        match = TRAILING_FRAGMENT.search(previous)
+        start = LEADING_FRAGMENT.match(text)
+        if not (match and start):
+            return previous, text
+        if self.joins(match.group(1), start.group(1)):
+            self.stats["hyphenations"] += 1
+            return previous[:match.start()].rstrip(), match.group(1) + text.lstrip()
+        self.stats["hyphens_kept"] += 1
+        return previous, text
+
+    def _count_after(self, text):
+        self.stats["characters_after"] += len(text)
+        if self.counter:
+            self.stats["tokens_after"] += self.counter.count(text)
+        return text
+
+
+def compress_references(lines, words=12):
+    """
+    Shortens reference entries to their first words, which carry the authors, year and title.
+
+    Args:
+        lines (list): Lines of the references section.
+        words (int): Words kept per entry.
+
+    Returns:
+        list: One line per entry, without links or DOIs.
+    """
+    entries = []
+    for line in lines:
+        if not line.strip():
+            continue
+        if ENTRY_START.match(line) or not entries:
+            entries.append(line.strip())
+        else:
+            entries[-1] += " " + line.strip()
+    shortened = []
+    for entry in entries:
+        entry_words = LINK.sub("", entry).split()
+        shortened.append(" ".join(entry_words[:words]) + (" ..." if len(entry_words) > words else ""))
+    return shortened
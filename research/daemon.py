@@ -0,0 +1,206 @@
+"""
+Optional warm process that answers chat_with_article questions over a Unix socket.
+
+Starting a fresh process per question pays for importing openai, PyPDF2, docx and tiktoken,
+loading the BPE ranks, opening a TLS connection and loading the retrieval index. The daemon
+pays for these once and keeps the client, encoders, indexes and session store open:
+
+    python -m research.daemon &
+    python -m research.chat_with_article -f paper.pdf -u "What is the main thesis?"
+    python -m research.daemon --stop
+
+chat_with_article sends its arguments to the daemon when one is listening and runs the
+question itself otherwise. Requests are handled one at a time, and everything the question
+prints is streamed back to the client. The socket is $CHATGPT_DAEMON_SOCKET, or chat.sock in
+the shared cache directory. Platforms without Unix sockets always run in process.
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import traceback
+
+from utils.files import cache_dir
+
+
+def socket_path():
+    """Returns the path of the daemon's socket."""
+    return os.getenv("CHATGPT_DAEMON_SOCKET") or os.path.join(cache_dir("daemon"), "chat.sock")
+
+
+def connect(path=None):
+    """
+    Connects to the daemon.
+
+    Args:
+        path (str): Path of the socket. Defaults to socket_path().
+
+    Returns:
+        socket.socket: The connection, or None if no daemon is listening.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path or socket_path())
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+
+def send_request(request, out=None, path=None):
+    """
+    Runs a request in the daemon, copying its output as it arrives.
+
+    Args:
+        request (dict): The request: {"command": "chat", "options": {...}, "args": {...}},
+            where options are ArticleQuery arguments and args are chat_with_gpt arguments,
+            or {"command": "stop"}. A chat request with "no_cache" set bypasses the
+            response cache.
+        out (file): Where the output goes. Defaults to sys.stdout.
+        path (str): Path of the socket. Defaults to socket_path().
+
+    Returns:
+        bool: Whether a daemon handled the request. False means the caller should run it
+            itself.
+
+    Raises:
+        RuntimeError: If the request failed in the daemon.
+    """
+    out = out or sys.stdout
+    sock = connect(path)
+    if sock is None:
+        return False
+    with sock, sock.makefile("rwb") as stream:
+        stream.write(json.dumps(request).encode("utf-8") + b"\n")
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if "output" in message:
+                out.write(message["output"])
+                out.flush()
+            elif "error" in message:
+                raise RuntimeError(message["error"])
+            else:
+                break
+    return True
+
+
+class _StreamWriter:
+    """File-like object that forwards writes to the client as output messages."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        if text:
+            self.stream.write(json.dumps({"output": text}).encode("utf-8") + b"\n")
+            self.stream.flush()
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class ChatDaemon(socketserver.UnixStreamServer):
+    """
+    Unix socket server that runs chat_with_gpt in a long-lived process.
+
+    One ArticleQuery is kept per set of constructor options, so its client, history manager
+    and loaded indexes are reused by every question that asks for the same options.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): Path of the socket. Defaults to socket_path().
+        """
+        path = path or socket_path()
+        if os.path.exists(path):
+            sock = connect(path)
+            if sock is not None:
+                sock.close()
+                raise RuntimeError(f"A daemon is already listening on {path}")
+            # Left behind by a daemon that did not shut down cleanly
+            os.remove(path)
+        # Imported here so the thin client does not pay for it
+        from research.article import ArticleQuery
+        self.query_class = ArticleQuery
+        self.queries = {}
+        self.stopping = False
+        super().__init__(path, _Handler)
+
+    def query(self, options):
+        """Returns the ArticleQuery for a set of constructor options, creating it on first use."""
+        key = json.dumps(options, sort_keys=True)
+        if key not in self.queries:
+            self.queries[key] = self.query_class(**options)
+        return self.queries[key]
+
+    def server_close(self):
+        super().server_close()
+        for query in self.queries.values():
+            query.close_pdf_pool()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.server_address)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        if request.get("command") == "stop":
+            self.server.stopping = True
+            self.reply({"done": True})
+            return
+        from utils.llm_cache import get_llm_cache
+
+        # Requests are handled one at a time, so the shared cache can be bypassed for just this one
+        cache = get_llm_cache()
+        bypass = cache.bypass
+        cache.bypass = bypass or bool(request.get("no_cache"))
+        try:
+            with contextlib.redirect_stdout(_StreamWriter(self.wfile)):
+                query = self.server.query(request.get("options") or {})
+                query.chat_with_gpt(**request["args"])
+        except Exception:
+            self.reply({"error": traceback.format_exc()})
+        else:
+            self.reply({"done": True})
+        finally:
+            cache.bypass = bypass
+
+    def reply(self, message):
+        self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+def serve(path=None):
+    """
+    Runs the daemon until it is sent a stop request.
+
+    Args:
+        path (str): Path of the socket. Defaults to socket_path().
+    """
+    with ChatDaemon(path) as server:
+        print(f"Listening on {server.server_address}")
+        while not server.stopping:
+            server.handle_request()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep a warm process for chat_with_article.")
+    parser.add_argument("--socket", help="Path of the Unix socket. Defaults to $CHATGPT_DAEMON_SOCKET or the cache directory.")
+    parser.add_argument("--stop", action="store_true", help="Stop the running daemon.")
+    args = parser.parse_args()
+
+    if args.stop:
+        if not send_request({"command": "stop"}, path=args.socket):
+            print("No daemon is running.")
+    elif not hasattr(socket, "AF_UNIX"):
+        sys.exit("Unix sockets are not available on this platform.")
+    else:
+        serve(args.socket)
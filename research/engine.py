@@ -0,0 +1,333 @@
+import asyncio
+from functools import partial
+
+from openai import AsyncOpenAI
+
+from utils.llm import achat_completion
+from utils.tokens import get_counter
+
+
+# Bump whenever a prompt changes so journaled summaries from the old prompt are not reused.
+# Each level has its own version, so a new synthesis prompt does not redo the chunk summaries.
+PROMPT_VERSION = "1"
+MERGE_PROMPT_VERSION = "1"
+SYNTHESIS_PROMPT_VERSION = "1"
+# Maximum number of summaries merged by one request
+MERGE_FAN_IN = 8
+SUMMARY_SYSTEM_ROLE = "You are an expert academic specializing in summarizing research papers."
+
+
+def summary_prompt(chunk):
+    """
+    Builds the user prompt that asks for a summary of one article chunk.
+
+    Args:
+        chunk (str): The chunk of article text.
+
+    Returns:
+        str: The user prompt.
+    """
+    return (
+        f"Summarize this academic article chunk by identifying its main thesis, key arguments, "
+        f"and any objections or counterarguments it addresses. Provide a clear and concise "
+        f"explanation of the author's reasoning, including any philosophical concepts or theories "
+        f"they rely on. If relevant, highlight the implications of the argument and how it contributes "
+        f"to the broader discussion:\n\n"
+        f"{chunk}"
+    )
+
+
+def summary_messages(chunk):
+    """
+    Builds the chat messages that ask for a summary of one article chunk.
+
+    Args:
+        chunk (str): The chunk of article text.
+
+    Returns:
+        list: The system and user messages.
+    """
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_ROLE},
+        {"role": "user", "content": summary_prompt(chunk)}
+    ]
+
+
+def merge_prompt(summaries):
+    """
+    Builds the user prompt that merges summaries of consecutive parts of an article.
+
+    Args:
+        summaries (list): Summaries of consecutive parts, in document order.
+
+    Returns:
+        str: The user prompt.
+    """
+    parts = "\n\n".join(f"Part {idx + 1}:\n{summary}" for idx, summary in enumerate(summaries))
+    return (
+        f"The following are summaries of consecutive parts of one academic article. Merge them "
+        f"into a single summary of those parts that keeps the main thesis, key arguments, "
+        f"objections and counterarguments, and the concepts or theories the author relies on, "
+        f"without repeating points that appear in several parts:\n\n"
+        f"{parts}"
+    )
+
+
+def synthesis_prompt(summaries):
+    """
+    Builds the user prompt for the final synthesis of a whole article.
+
+    Args:
+        summaries (list): Summaries of consecutive parts that together cover the article.
+
+    Returns:
+        str: The user prompt.
+    """
+    parts = "\n\n".join(f"Part {idx + 1}:\n{summary}" for idx, summary in enumerate(summaries))
+    return (
+        f"The following are summaries of consecutive parts of one academic article. Write a "
+        f"synthesis of the whole article: its main thesis, how the key arguments build on each "
+        f"other, the objections or counterarguments it addresses, the philosophical concepts or "
+        f"theories it relies on, and the implications of the argument for the broader "
+        f"discussion:\n\n"
+        f"{parts}"
+    )
+
+
+def reduce_messages(prompt):
+    """Wraps a merge or synthesis prompt in chat messages."""
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_ROLE},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def article_key(key):
+    """
+    Builds the journal key of a complete article summary from the key of its chunk summaries.
+
+    Args:
+        key (str): The summary key of the article's chunks.
+
+    Returns:
+        str: The key, which also changes with the merge and synthesis prompts.
+    """
+    return f"{key}:{MERGE_PROMPT_VERSION}:{SYNTHESIS_PROMPT_VERSION}"
+
+
+class SummarizationEngine:
+    """
+    Summarizes articles with concurrent chat completion calls.
+
+    All chunk calls share one concurrency limit. Documents are read and chunked lazily in
+    worker threads: the next chunk is only produced once a call slot is free, so file parsing
+    overlaps the network round trips and at most max_concurrency chunks per article are held
+    in memory. Results always come back in input order.
+
+    Chunk summaries are then tree-reduced: consecutive summaries are merged in parallel in
+    groups that fit the chunk budget, level by level, until one group covers the whole
+    article, which gets a final synthesis.
+
+    When the article query has a summary journal, file summaries are resumable: completed
+    chunks and merges are recorded as they finish and are not sent again, and files whose
+    summary is already complete are not even read. Because every level is journaled on its
+    own, changing the synthesis prompt only redoes the final call of each article.
+    """
+
+    def __init__(self, article_query, max_concurrency=8, max_articles=None):
+        """
+        Args:
+            article_query (ArticleQuery): Supplies the model and the file reader.
+            max_concurrency (int): Maximum number of API calls in flight at once.
+            max_articles (int): Maximum number of articles being extracted or summarized at
+                once. Defaults to max_concurrency.
+        """
+        self.article_query = article_query
+        self.max_concurrency = max_concurrency
+        self.max_articles = max_articles or max_concurrency
+        self.in_flight = 0
+
+    async def summarize_content(self, content, chunk_size, overlap=0):
+        """
+        Summarizes one document, sending all of its chunks concurrently.
+
+        Args:
+            content (str or iterable): The content to summarize, or an iterable of pieces of it.
+            chunk_size (int): Maximum size of each chunk in tokens.
+            overlap (int): Number of tokens repeated between consecutive chunks.
+
+        Returns:
+            str: Synthesis of the chunk summaries.
+        """
+        call_limit = asyncio.Semaphore(self.max_concurrency)
+        async with AsyncOpenAI() as client:
+            summaries = await self._summarize_content(client, call_limit, content, chunk_size, overlap)
+            return await self._reduce(client, call_limit, summaries, chunk_size)
+
+    async def reduce_summaries(self, summaries, chunk_size, key=None):
+        """
+        Tree-reduces chunk summaries into one synthesis.
+
+        Args:
+            summaries (list): Chunk summaries in document order.
+            chunk_size (int): Maximum size of the input of each merge in tokens.
+            key (str): Summary key under which merges are journaled, if any.
+
+        Returns:
+            str: Synthesis of the summaries.
+        """
+        call_limit = asyncio.Semaphore(self.max_concurrency)
+        async with AsyncOpenAI() as client:
+            return await self._reduce(client, call_limit, summaries, chunk_size, key)
+
+    async def summarize_files(self, file_paths, chunk_size, overlap=0):
+        """
+        Summarizes several files concurrently.
+
+        Args:
+            file_paths (list): Paths of the files to summarize.
+            chunk_size (int): Maximum size of each chunk in tokens.
+            overlap (int): Number of tokens repeated between consecutive chunks.
+
+        Returns:
+            list: One entry per file, in input order. Each entry is the summary string, or the
+                exception raised while processing that file.
+        """
+        call_limit = asyncio.Semaphore(self.max_concurrency)
+        article_limit = asyncio.Semaphore(self.max_articles)
+        async with AsyncOpenAI() as client:
+            tasks = [
+                self._summarize_file(client, call_limit, article_limit, file_path, chunk_size, overlap)
+                for file_path in file_paths
+            ]
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _summarize_file(self, client, call_limit, article_limit, file_path, chunk_size, overlap):
+        async with article_limit:
+            journal = self.article_query.journal
+            key = None
+            if journal:
+                key = await asyncio.to_thread(self.article_query.summary_key, file_path, chunk_size, overlap)
+                summary = journal.article_summary(article_key(key))
+                if summary is not None:
+                    print(f"Unchanged, using the journaled summary: {file_path}")
+                    return summary
+            print(f"Processing: {file_path}")
+            content = self.article_query.iter_file_content(file_path)
+            summaries = await self._summarize_content(client, call_limit, content, chunk_size, overlap, key)
+            summary = await self._reduce(client, call_limit, summaries, chunk_size, key)
+            # A document without text has nothing worth journaling
+            if journal and summaries:
+                journal.record_article(article_key(key), file_path, summary, len(summaries))
+            return summary
+
+    async def _summarize_content(self, client, call_limit, content, chunk_size, overlap, key=None):
+        if isinstance(content, str):
+            print(f"Content size: {len(content)} characters")
+        chunks = self.article_query.make_chunker(chunk_size, overlap).chunks(content)
+        done = self.article_query.journal.chunk_summaries(key) if key else {}
+        tasks = []
+        try:
+            while True:
+                # Wait for a free slot before producing the next chunk, so chunks are never
+                # read far ahead of the calls that consume them
+                await call_limit.acquire()
+                try:
+                    chunk = await asyncio.to_thread(next, chunks, None)
+                except BaseException:
+                    call_limit.release()
+                    raise
+                if chunk is None:
+                    call_limit.release()
+                    break
+                idx = len(tasks)
+                if idx in done:
+                    call_limit.release()
+                    journaled = asyncio.get_running_loop().create_future()
+                    journaled.set_result(done[idx])
+                    tasks.append(journaled)
+                    continue
+                messages = summary_messages(chunk)
+                label = f"chunk {idx + 1} (size: {len(chunk)} characters)"
+                record = partial(self.article_query.journal.record_chunk, key, idx) if key else None
+                tasks.append(asyncio.create_task(self._complete(client, call_limit, messages, label, record)))
+            summaries = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        if done:
+            print(f"Reused {len(done)} of {len(summaries)} chunk summaries from the journal")
+        return summaries
+
+    async def _reduce(self, client, call_limit, summaries, chunk_size, key=None):
+        """Merges summaries level by level until one group fits, then synthesizes it."""
+        if not summaries:
+            return ""
+        if len(summaries) == 1:
+            return summaries[0]
+        merge_key = f"{key}:{MERGE_PROMPT_VERSION}" if key else None
+        done = self.article_query.journal.merge_summaries(merge_key) if merge_key else {}
+        counter = get_counter(self.article_query.model)
+        level = 1
+        while True:
+            groups = self._group(summaries, chunk_size, counter)
+            if len(groups) == 1:
+                await call_limit.acquire()
+                label = f"final synthesis of {len(summaries)} summaries"
+                return await self._complete(client, call_limit, reduce_messages(synthesis_prompt(summaries)), label)
+
+            tasks = []
+            try:
+                for idx, group in enumerate(groups):
+                    if (level, idx) in done:
+                        journaled = asyncio.get_running_loop().create_future()
+                        journaled.set_result(done[(level, idx)])
+                        tasks.append(journaled)
+                        continue
+                    await call_limit.acquire()
+                    record = partial(self.article_query.journal.record_merge, merge_key, level, idx) if merge_key else None
+                    label = f"merge {idx + 1} of {len(groups)} at level {level} ({len(group)} summaries)"
+                    tasks.append(asyncio.create_task(
+                        self._complete(client, call_limit, reduce_messages(merge_prompt(group)), label, record)
+                    ))
+                summaries = await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+            level += 1
+
+    def _group(self, summaries, chunk_size, counter):
+        """Packs consecutive summaries into groups of at most chunk_size tokens and MERGE_FAN_IN summaries."""
+        groups = [[]]
+        used = 0
+        for summary in summaries:
+            tokens = counter.count(summary)
+            group = groups[-1]
+            if group and (used + tokens > chunk_size or len(group) == MERGE_FAN_IN):
+                groups.append([])
+                used = 0
+            groups[-1].append(summary)
+            used += tokens
+        if len(groups) == len(summaries) and len(groups) > 1:
+            # Every summary fills a group on its own; pair them up so each level still shrinks
+            groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+        return groups
+
+    async def _complete(self, client, call_limit, messages, label, record=None):
+        """
+        Sends one request in a call slot already acquired by the caller, and frees the slot.
+
+        The result is passed to record, when given, as soon as it arrives.
+        """
+        self.in_flight += 1
+        print(f"Processing {label}... ({self.in_flight} in flight)")
+        try:
+            summary = await achat_completion(client, self.article_query.model, messages)
+        finally:
+            self.in_flight -= 1
+            call_limit.release()
+        if record:
+            record(summary)
+        return summary
@@ -0,0 +1,111 @@
+import contextlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import docx
+from PyPDF2 import PdfReader
+
+
+# Bump whenever extraction changes so cached text from the old extractor is not reused
+EXTRACTOR_VERSION = "1"
+
+
+def pdf_pool(workers=None):
+    """
+    Creates a process pool for extracting PDFs.
+
+    Workers are spawned rather than forked, since extraction runs in threads next to an
+    event loop and forking a multithreaded process can deadlock the child.
+
+    Args:
+        workers (int): Number of worker processes. Defaults to the CPU count.
+
+    Returns:
+        ProcessPoolExecutor: The pool. The caller shuts it down.
+    """
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+
+
+def extract_units(file_path, workers=None, parallel_min_pages=64, pool=None):
+    """
+    Extracts the text of a PDF or DOCX file.
+
+    Args:
+        file_path (str): Path to the file.
+        workers (int): Number of worker processes for PDF extraction. Defaults to the CPU count.
+        parallel_min_pages (int): PDFs with fewer pages are extracted in-process.
+        pool (ProcessPoolExecutor): Pool from pdf_pool to extract large PDFs on. Without one,
+            a pool is created for the file.
+
+    Returns:
+        list: The text of each PDF page or DOCX paragraph.
+    """
+    return list(iter_units(file_path, workers, parallel_min_pages, pool))
+
+
+def iter_units(file_path, workers=None, parallel_min_pages=64, pool=None):
+    """
+    Yields the text of a PDF or DOCX file one page or paragraph at a time.
+
+    Args:
+        file_path (str): Path to the file.
+        workers (int): Number of worker processes for PDF extraction. Defaults to the CPU count.
+        parallel_min_pages (int): PDFs with fewer pages are extracted in-process.
+        pool (ProcessPoolExecutor): Pool from pdf_pool to extract large PDFs on. Without one,
+            a pool is created for the file.
+
+    Yields:
+        str: The text of each PDF page or DOCX paragraph.
+    """
+    _, file_extension = os.path.splitext(file_path)
+
+    if file_extension.lower() == ".pdf":
+        yield from iter_pdf_pages(file_path, workers, parallel_min_pages, pool)
+    elif file_extension.lower() == ".docx":
+        doc = docx.Document(file_path)
+        for paragraph in doc.paragraphs:
+            yield paragraph.text
+    else:
+        raise ValueError(f"Unsupported file format: {file_extension}")
+
+
+def iter_pdf_pages(file_path, workers=None, parallel_min_pages=64, pool=None):
+    """
+    Yields the text of every page of a PDF, splitting large files across processes.
+
+    Each worker opens the PDF itself and extracts one contiguous page range; the ranges are
+    yielded in page order as they become available. Files extracted concurrently can share
+    one pool, which bounds the number of processes for the whole run.
+
+    Args:
+        file_path (str): Path to the PDF.
+        workers (int): Number of worker processes. Defaults to the CPU count.
+        parallel_min_pages (int): PDFs with fewer pages are extracted in-process.
+        pool (ProcessPoolExecutor): Pool from pdf_pool to extract on. Without one, a pool is
+            created for the file and shut down when it is done.
+
+    Yields:
+        str: The text of each page.
+    """
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages)
+    workers = min(workers or os.cpu_count() or 1, page_count)
+
+    if workers <= 1 or page_count < parallel_min_pages:
+        for page in reader.pages:
+            yield page.extract_text()
+        return
+
+    # A few ranges per worker keeps the pool busy when some pages are much slower than others
+    range_count = min(workers * 4, page_count)
+    bounds = [page_count * i // range_count for i in range(range_count + 1)]
+    print(f"Extracting {page_count} pages with {workers} processes")
+    with contextlib.nullcontext(pool) if pool else pdf_pool(workers) as pool:
+        for page_texts in pool.map(_extract_page_range, [file_path] * range_count, bounds[:-1], bounds[1:]):
+            yield from page_texts
+
+
+def _extract_page_range(file_path, start, stop):
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
@@ -0,0 +1,204 @@
+import codecs
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from utils.files import cache_dir, file_sha256
+
+
+UNIT_SEPARATOR = "\f"
+# Backslashes and separators inside a unit are escaped, so units round-trip exactly
+ESCAPED = re.compile(r"\\(.)", re.DOTALL)
+
+
+class ExtractionCache:
+    """
+    Persistent, content-addressed cache of text extracted from documents.
+
+    Entries are keyed by the SHA-256 of the file contents plus the extractor version, so a
+    renamed or copied file still hits and a changed extractor never serves stale text. The
+    file hash itself is remembered against the file's path, size, mtime and inode, which lets
+    an unchanged file skip hashing altogether. Text is stored zlib-compressed in SQLite and
+    the least recently used entries are evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, path=None, max_bytes=512 * 1024 * 1024):
+        """
+        Args:
+            path (str): Path of the SQLite database. Defaults to extractions.sqlite in the
+                shared cache directory.
+            max_bytes (int): Maximum total size of the compressed entries.
+        """
+        self.path = path or os.path.join(cache_dir("extractions"), "extractions.sqlite")
+        self.max_bytes = max_bytes
+        # One connection shared by all threads; closing the last connection to a WAL database
+        # checkpoints it, which would otherwise cost an fsync on every lookup
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # A lost last_used update after a crash is harmless, so skip the fsync on every commit
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, digest TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                "key TEXT PRIMARY KEY, data BLOB, size INTEGER, last_used REAL, units INTEGER)"
+            )
+            # Entries written before units were counted replaced separators instead of escaping
+            # them; they have no count and are treated as misses until they are evicted
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(extractions)")]
+            if "units" not in columns:
+                conn.execute("ALTER TABLE extractions ADD COLUMN units INTEGER")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock, self._conn:
+            yield self._conn
+
+    def file_digest(self, file_path):
+        """
+        Returns the SHA-256 of a file, reusing the stored hash when the file is unchanged.
+
+        Args:
+            file_path (str): Path to the file.
+
+        Returns:
+            str: Hex digest of the file contents.
+        """
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT digest FROM files WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                (path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        digest = file_sha256(path)
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, digest) VALUES (?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, stat.st_ino, digest)
+            )
+        return digest
+
+    def get(self, file_path, version):
+        """
+        Looks up the extracted text of a file.
+
+        Args:
+            file_path (str): Path to the file.
+            version (str): Version of the extractor that produced the text.
+
+        Returns:
+            list: The extracted text units (pages or paragraphs), or None on a miss.
+        """
+        units = self.iter_units(file_path, version)
+        return None if units is None else list(units)
+
+    def iter_units(self, file_path, version):
+        """
+        Looks up the extracted text of a file without decompressing it all at once.
+
+        Args:
+            file_path (str): Path to the file.
+            version (str): Version of the extractor that produced the text.
+
+        Returns:
+            generator: Yields the extracted text units (pages or paragraphs), or None on a miss.
+        """
+        key = f"{self.file_digest(file_path)}:{version}"
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT data, units FROM extractions WHERE key = ? AND units IS NOT NULL", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE extractions SET last_used = ? WHERE key = ?", (time.time(), key))
+        return self._decompress_units(*row)
+
+    def _decompress_units(self, data, units, block_size=64 * 1024):
+        if not units:
+            return
+        decompressor = zlib.decompressobj()
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        pending = ""
+        for i in range(0, len(data), block_size):
+            pending += decoder.decode(decompressor.decompress(data[i:i + block_size]))
+            *complete, pending = pending.split(UNIT_SEPARATOR)
+            yield from (_unescape(unit) for unit in complete)
+        pending += decoder.decode(decompressor.flush(), final=True)
+        yield from (_unescape(unit) for unit in pending.split(UNIT_SEPARATOR))
+
+    def put(self, file_path, version, units):
+        """
+        Stores the extracted text of a file and evicts old entries if the cache is too big.
+
+        Args:
+            file_path (str): Path to the file.
+            version (str): Version of the extractor that produced the text.
+            units (list): The extracted text units (pages or paragraphs).
+        """
+        for _ in self.record(file_path, version, units):
+            pass
+
+    def record(self, file_path, version, units):
+        """
+        Passes extracted text units through, compressing them as they go, and stores them
+        once the last unit has been consumed.
+
+        Nothing is stored if the consumer stops early.
+
+        Args:
+            file_path (str): Path to the file.
+            version (str): Version of the extractor that produced the text.
+            units (iterable): The extracted text units (pages or paragraphs).
+
+        Yields:
+            str: The same units, unchanged.
+        """
+        key = f"{self.file_digest(file_path)}:{version}"
+        compressor = zlib.compressobj(6)
+        blocks = []
+        count = 0
+        for unit in units:
+            text = _escape(unit)
+            if count:
+                text = UNIT_SEPARATOR + text
+            blocks.append(compressor.compress(text.encode("utf-8")))
+            count += 1
+            yield unit
+        blocks.append(compressor.flush())
+        data = b"".join(blocks)
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, data, size, last_used, units) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), time.time(), count)
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM extractions ORDER BY last_used").fetchall():
+            conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+def _escape(unit):
+    return unit.replace("\\", "\\\\").replace(UNIT_SEPARATOR, "\\f")
+
+
+def _unescape(unit):
+    return ESCAPED.sub(lambda match: UNIT_SEPARATOR if match.group(1) == "f" else match.group(1), unit)
@@ -0,0 +1,158 @@
+import time
+
+from research.session_store import content_hash
+
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+HISTORY_SUMMARY_ROLE = (
+    "You maintain the running summary of a long conversation about a document. Merge the "
+    "earlier summary and the new messages into one updated summary. Keep every fact, figure, "
+    "name, question and answer that a later question could depend on, and drop pleasantries "
+    "and repetition."
+)
+# Role, separators and priming added by the API to every message
+MESSAGE_OVERHEAD = 4
+
+
+def history_summary_prompt(summary, transcript):
+    """
+    Builds the request that folds messages into the running summary.
+
+    Args:
+        summary (str): The summary so far, or an empty string.
+        transcript (str): The messages being folded in, one "role: content" block each.
+
+    Returns:
+        str: The user prompt.
+    """
+    return (
+        f"Earlier summary:\n{summary or '(none)'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        "Write the updated summary."
+    )
+
+
+class HistoryManager:
+    """
+    Keeps a conversation under an input token budget by folding old turns into a summary.
+
+    System messages and the most recent turns are always sent verbatim. Once the
+    conversation grows past threshold * budget, the turns before the recent ones are folded
+    into a single rolling summary message, which is itself folded again the next time the
+    conversation grows. Messages too long to summarize in one request are folded a batch at
+    a time, so even a history holding a whole document can be compacted.
+    """
+
+    def __init__(self, counter, budget, summarize, recent_tokens=None, summary_tokens=None, threshold=0.8):
+        """
+        Args:
+            counter (TokenCounter): Counter for the model the conversation is sent to.
+            budget (int): Maximum number of input tokens in a request.
+            summarize (callable): summarize(summary, transcript, max_tokens) returning the
+                updated summary as a string.
+            recent_tokens (int): Tokens of recent turns kept verbatim. Defaults to half the budget.
+            summary_tokens (int): Maximum length of the summary. Defaults to an eighth of the
+                budget, at most 4000.
+            threshold (float): Fraction of the budget past which the history is compacted.
+        """
+        self.counter = counter
+        self.budget = budget
+        self.summarize = summarize
+        self.recent_tokens = recent_tokens or budget // 2
+        self.summary_tokens = summary_tokens or min(4000, budget // 8)
+        self.threshold = threshold
+
+    def message_tokens(self, message):
+        """Returns the number of tokens a message takes up in a request."""
+        return self.counter.count(message["content"] or "") + MESSAGE_OVERHEAD
+
+    def tokens(self, messages):
+        """
+        Returns the number of tokens a list of messages takes up in a request.
+
+        Args:
+            messages (list): Chat messages.
+
+        Returns:
+            int: The total token count.
+        """
+        counts = self.counter.count_many(message["content"] or "" for message in messages)
+        return sum(counts) + MESSAGE_OVERHEAD * len(counts)
+
+    def compact(self, messages, reserve=0):
+        """
+        Folds old turns into the rolling summary if the conversation is over the threshold.
+
+        Args:
+            messages (list): The conversation history.
+            reserve (int): Tokens that will be added to the request on top of the history,
+                such as retrieved passages.
+
+        Returns:
+            tuple: The history to use from now on, and a record of what was compacted or
+                None if nothing was. The record refers to the summary and the folded
+                messages by their session store content hashes; the messages themselves stay
+                in the session's earlier epoch.
+        """
+        tokens_before = self.tokens(messages)
+        if tokens_before + reserve <= self.budget * self.threshold:
+            return messages, None
+
+        instructions = [m for m in messages if m["role"] == "system" and not is_summary(m)]
+        summaries = [m for m in messages if is_summary(m)]
+        turns = [m for m in messages if m["role"] != "system"]
+
+        # Keep the most recent turns that fit, and always the last one
+        recent_budget = min(
+            self.recent_tokens,
+            self.budget - reserve - self.summary_tokens - MESSAGE_OVERHEAD - self.tokens(instructions)
+        )
+        split = len(turns)
+        used = 0
+        while split > 0:
+            used += self.message_tokens(turns[split - 1])
+            if used > recent_budget and split < len(turns):
+                break
+            split -= 1
+        old, recent = turns[:split], turns[split:]
+        if not old:
+            return messages, None
+
+        summary = summaries[-1]["content"][len(SUMMARY_PREFIX):] if summaries else ""
+        for batch in self._batches(old):
+            summary = self.summarize(summary, batch, self.summary_tokens)
+        summary_message = {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+        compacted = instructions + [summary_message] + recent
+        record = {
+            "time": time.time(),
+            "messages": len(old),
+            "tokens_before": tokens_before,
+            "tokens_after": self.tokens(compacted),
+            "summary": content_hash(summary_message["content"]),
+            "compacted": [content_hash(m["content"]) for m in old]
+        }
+        return compacted, record
+
+    def _batches(self, messages):
+        """Transcripts of the messages, split so each fits in one summarization request."""
+        limit = self.budget - 2 * self.summary_tokens - 500
+        batch = []
+        used = 0
+        for message in messages:
+            text = f"{message['role']}: {message['content'] or ''}"
+            tokens = self.counter.encoding.encode(text, disallowed_special=())
+            for start in range(0, len(tokens), limit):
+                piece = tokens[start:start + limit]
+                if batch and used + len(piece) > limit:
+                    yield "\n\n".join(batch)
+                    batch, used = [], 0
+                batch.append(text if len(piece) == len(tokens) else self.counter.encoding.decode(piece))
+                used += len(piece)
+        if batch:
+            yield "\n\n".join(batch)
+
+
+def is_summary(message):
+    """Whether a message is the rolling summary written by HistoryManager."""
+    return message["role"] == "system" and (message["content"] or "").startswith(SUMMARY_PREFIX)
@@ -0,0 +1,136 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.files import cache_dir
+
+
+class SummaryJournal:
+    """
+    Durable record of completed chunk, merge and article summaries.
+
+    Every chunk and merge summary is committed as soon as its request returns, and the
+    article summary once the article has been reduced to a synthesis. Entries are keyed by a
+    summary key built from the file hash, extractor and prompt versions, model and chunking
+    parameters (see ArticleQuery.summary_key), so an interrupted run resumes at the first
+    missing chunk and a rerun skips articles whose inputs have not changed.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): Path of the SQLite database. Defaults to journal.sqlite in the shared
+                cache directory.
+        """
+        self.path = path or os.path.join(cache_dir("summaries"), "journal.sqlite")
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "key TEXT, idx INTEGER, summary TEXT, created REAL, PRIMARY KEY (key, idx))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS merges ("
+                "key TEXT, level INTEGER, idx INTEGER, summary TEXT, created REAL, PRIMARY KEY (key, level, idx))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS articles ("
+                "key TEXT PRIMARY KEY, path TEXT, summary TEXT, chunk_count INTEGER, created REAL)"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock, self._conn:
+            yield self._conn
+
+    def chunk_summaries(self, key):
+        """
+        Returns the chunk summaries already completed for an article.
+
+        Args:
+            key (str): The article's summary key.
+
+        Returns:
+            dict: Chunk summaries by chunk index.
+        """
+        with self._transaction() as conn:
+            return dict(conn.execute("SELECT idx, summary FROM chunks WHERE key = ?", (key,)))
+
+    def record_chunk(self, key, idx, summary):
+        """
+        Records a completed chunk summary.
+
+        Args:
+            key (str): The article's summary key.
+            idx (int): Index of the chunk in the article.
+            summary (str): The chunk summary.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO chunks (key, idx, summary, created) VALUES (?, ?, ?, ?)",
+                (key, idx, summary, time.time())
+            )
+
+    def merge_summaries(self, key):
+        """
+        Returns the merged summaries already completed while reducing an article.
+
+        Args:
+            key (str): The article's merge key.
+
+        Returns:
+            dict: Merged summaries by (level, index) within the level.
+        """
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT level, idx, summary FROM merges WHERE key = ?", (key,)).fetchall()
+        return {(level, idx): summary for level, idx, summary in rows}
+
+    def record_merge(self, key, level, idx, summary):
+        """
+        Records a completed merge of chunk summaries.
+
+        Args:
+            key (str): The article's merge key.
+            level (int): Level of the reduction tree, starting at 1 above the chunk summaries.
+            idx (int): Index of the merge within its level.
+            summary (str): The merged summary.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO merges (key, level, idx, summary, created) VALUES (?, ?, ?, ?, ?)",
+                (key, level, idx, summary, time.time())
+            )
+
+    def article_summary(self, key):
+        """
+        Looks up a completed article summary.
+
+        Args:
+            key (str): The article's key, as built by engine.article_key.
+
+        Returns:
+            str: The summary, or None if the article has not been completed.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT summary FROM articles WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def record_article(self, key, path, summary, chunk_count):
+        """
+        Records a completed article summary.
+
+        Args:
+            key (str): The article's key, as built by engine.article_key.
+            path (str): Path of the article when it was summarized.
+            summary (str): The final synthesis.
+            chunk_count (int): Number of chunks the summary was built from.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO articles (key, path, summary, chunk_count, created) VALUES (?, ?, ?, ?, ?)",
+                (key, os.path.abspath(path), summary, chunk_count, time.time())
+            )
@@ -0,0 +1,274 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from research.chunker import TokenChunker
+from research.cleanup import PageCleaner, cleanup_key
+from research.extraction import EXTRACTOR_VERSION, iter_units
+from research.extraction_cache import ExtractionCache
+from research.retrieval import build_passages, terms
+from utils.files import cache_dir
+from utils.tokens import get_encoding
+
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+
+class LibraryIndex:
+    """
+    Persistent full-text index over a folder of documents, stored in SQLite FTS5.
+
+    Each document is split into the same passages as retrieval mode uses and every passage is
+    a row of an FTS5 table ranked with BM25. PDFs are cleaned up like they are for the
+    summarizer first, so running headers and footers do not weigh on the ranking. Updates are incremental: files whose size and
+    mtime are unchanged are skipped without being read, and a file that was touched but whose
+    contents hash the same is not re-indexed. Text comes from the extraction cache, so indexing
+    a folder that has already been summarized or chatted with does not re-parse any PDF.
+
+    Queries return ranked documents with their best passages in milliseconds, which makes the
+    index usable as a pre-filter for deciding which files to send to ArticleQuery.
+    """
+
+    def __init__(self, path=None, extraction_cache=None, passage_tokens=400, model="gpt-4o-mini", clean_pdfs=True, references="keep"):
+        """
+        Args:
+            path (str): Path of the SQLite database. Defaults to library.sqlite in the shared
+                cache directory.
+            extraction_cache (ExtractionCache): Cache of extracted text. Defaults to the shared one.
+            passage_tokens (int): Maximum size of a passage in tokens.
+            model (str): Model whose encoding is used to size passages.
+            clean_pdfs (bool): Whether to remove running headers, footers and page numbers from
+                PDF text before indexing it.
+            references (str): What cleanup does with the references section of a PDF: "keep",
+                "drop" or "compress".
+        """
+        self.path = path or os.path.join(cache_dir("library"), "library.sqlite")
+        self.extraction_cache = extraction_cache or ExtractionCache()
+        self.passage_tokens = passage_tokens
+        self.model = model
+        self.references = references
+        self.cleanup = cleanup_key(clean_pdfs, references)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime_ns INTEGER, "
+                "digest TEXT, passage_tokens INTEGER, indexed_at REAL)"
+            )
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5("
+                "text, document_id UNINDEXED, first UNINDEXED, last UNINDEXED, "
+                "tokenize='porter unicode61')"
+            )
+            # Documents indexed before cleanup have no cleanup key and are indexed again
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(documents)")]
+            if "cleanup" not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN cleanup TEXT")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock, self._conn:
+            yield self._conn
+
+    def update(self, folder, recursive=False):
+        """
+        Brings the index up to date with a folder, indexing only new or changed files.
+
+        Documents under the folder whose files no longer exist are removed from the index.
+
+        Args:
+            folder (str): Folder containing the documents.
+            recursive (bool): Whether to include subfolders.
+
+        Returns:
+            dict: Number of documents added, updated, removed, unchanged and failed.
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0}
+        folder = os.path.abspath(folder)
+        seen = set()
+        for file_path in self._list_files(folder, recursive):
+            seen.add(file_path)
+            try:
+                stats[self.update_file(file_path)] += 1
+            except Exception as e:
+                print(f"Error reading {file_path}: {e}")
+                stats["failed"] += 1
+
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT id, path FROM documents").fetchall()
+            for document_id, path in rows:
+                in_folder = os.path.dirname(path) == folder or (recursive and path.startswith(folder + os.sep))
+                if in_folder and path not in seen:
+                    self._delete(conn, document_id)
+                    stats["removed"] += 1
+        return stats
+
+    def update_file(self, file_path):
+        """
+        Indexes one document if it is new or has changed since it was last indexed, or was
+        indexed with other passage or cleanup settings.
+
+        Args:
+            file_path (str): Path to the document.
+
+        Returns:
+            str: "added", "updated" or "unchanged".
+        """
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id, size, mtime_ns, digest, passage_tokens, cleanup FROM documents WHERE path = ?", (path,)
+            ).fetchone()
+        same_settings = row and row[4:6] == (self.passage_tokens, self.cleanup)
+        if same_settings and row[1:3] == (stat.st_size, stat.st_mtime_ns):
+            return "unchanged"
+
+        digest = self.extraction_cache.file_digest(path)
+        if same_settings and row[3] == digest:
+            with self._transaction() as conn:
+                conn.execute(
+                    "UPDATE documents SET size = ?, mtime_ns = ? WHERE id = ?",
+                    (stat.st_size, stat.st_mtime_ns, row[0])
+                )
+            return "unchanged"
+
+        is_pdf = path.lower().endswith(".pdf")
+        chunker = TokenChunker(get_encoding(self.model), self.passage_tokens, self.passage_tokens // 8)
+        passages = build_passages(self._iter_units(path), chunker, group_units=not is_pdf)
+        with self._transaction() as conn:
+            if row:
+                self._delete(conn, row[0])
+            document_id = conn.execute(
+                "INSERT INTO documents (path, size, mtime_ns, digest, passage_tokens, cleanup, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, digest, self.passage_tokens, self.cleanup, time.time())
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO passages (text, document_id, first, last) VALUES (?, ?, ?, ?)",
+                ((passage["text"], document_id, passage["first"], passage["last"]) for passage in passages)
+            )
+        return "updated" if row else "added"
+
+    def search(self, query, limit=10, passages_per_document=3, paths=None, candidates=1000):
+        """
+        Finds the documents that best match a query, with their best passages.
+
+        Documents are ranked by their best passage among the top candidates, so a common term
+        costs no more than a rare one however large the library is.
+
+        Args:
+            query (str): Keywords or a question.
+            limit (int): Maximum number of documents to return.
+            passages_per_document (int): Maximum number of passages returned per document.
+            paths (list): Only search these documents. Defaults to the whole index.
+            candidates (int): Number of best matching passages the documents are ranked from.
+
+        Returns:
+            list: Dicts with the document "path", its "score" (higher is better), the number of
+                "matches" among the candidates and its best "passages", best first. Each
+                passage has "first", "last", "score" and "text".
+        """
+        match = self._match_expression(query)
+        if not match:
+            return []
+        documents = self._document_ids(paths)
+        if documents is not None and not documents:
+            return []
+        where, params = "passages MATCH ?", [match]
+        if documents is not None:
+            where += f" AND document_id IN ({', '.join('?' * len(documents))})"
+            params += sorted(documents)
+        with self._transaction() as conn:
+            # bm25() is lower for better matches. FTS5 cannot aggregate bm25() directly, so the
+            # best candidates are collected first and then grouped by document; their passages
+            # are the ones returned, and only their text is read
+            rows = conn.execute(
+                "WITH candidates AS ("
+                f"SELECT rowid AS passage_id, document_id, bm25(passages) AS score FROM passages WHERE {where} "
+                "ORDER BY rank LIMIT ?), "
+                "ranked AS (SELECT document_id, MIN(score) AS best, COUNT(*) AS matches FROM candidates "
+                "GROUP BY document_id ORDER BY best LIMIT ?), "
+                "positions AS (SELECT passage_id, document_id, score, "
+                "ROW_NUMBER() OVER (PARTITION BY document_id ORDER BY score) AS position FROM candidates) "
+                "SELECT ranked.document_id, documents.path, ranked.best, ranked.matches, "
+                "positions.score, passages.first, passages.last, passages.text "
+                "FROM ranked JOIN documents ON documents.id = ranked.document_id "
+                "LEFT JOIN positions ON positions.document_id = ranked.document_id AND positions.position <= ? "
+                "LEFT JOIN passages ON passages.rowid = positions.passage_id "
+                "ORDER BY ranked.best, positions.position",
+                (*params, candidates, limit, passages_per_document)
+            ).fetchall()
+        results = {}
+        for document_id, path, best, matches, score, first, last, text in rows:
+            result = results.setdefault(document_id, {"path": path, "score": -best, "matches": matches, "passages": []})
+            if score is not None:
+                result["passages"].append({"first": first, "last": last, "score": -score, "text": text})
+        return list(results.values())
+
+    def filter_paths(self, query, limit=10, paths=None):
+        """
+        Picks the documents worth sending to the model for a query.
+
+        Args:
+            query (str): Keywords or a question.
+            limit (int): Maximum number of paths to return.
+            paths (list): Candidate documents. Defaults to the whole index.
+
+        Returns:
+            list: Paths of the best matching documents, best first.
+        """
+        return [result["path"] for result in self.search(query, limit, 0, paths)]
+
+    def document_count(self):
+        """Returns the number of indexed documents."""
+        with self._transaction() as conn:
+            return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def _iter_units(self, path):
+        if path.lower().endswith(".txt"):
+            with open(path, "r", encoding="utf-8") as f:
+                yield from iter(lambda: f.read(1024 * 1024), "")
+            return
+        units = self.extraction_cache.iter_units(path, EXTRACTOR_VERSION)
+        if units is None:
+            units = self.extraction_cache.record(path, EXTRACTOR_VERSION, iter_units(path))
+        if path.lower().endswith(".pdf") and self.cleanup != "none":
+            units = PageCleaner(references=self.references).clean(units)
+        yield from units
+
+    def _document_ids(self, paths):
+        if paths is None:
+            return None
+        with self._transaction() as conn:
+            return {
+                row[0] for path in paths
+                for row in conn.execute("SELECT id FROM documents WHERE path = ?", (os.path.abspath(path),))
+            }
+
+    @staticmethod
+    def _match_expression(query):
+        # Quoting every term keeps FTS5 syntax in free text from being interpreted
+        return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms(query)))
+
+    @staticmethod
+    def _list_files(folder, recursive):
+        if recursive:
+            walk = ((root, names) for root, _, names in os.walk(folder))
+        else:
+            walk = [(folder, os.listdir(folder))]
+        for root, names in walk:
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                if name.lower().endswith(SUPPORTED_EXTENSIONS) and os.path.isfile(path):
+                    yield path
+
+    @staticmethod
+    def _delete(conn, document_id):
+        conn.execute("DELETE FROM passages WHERE document_id = ?", (document_id,))
+        conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
@@ -0,0 +1,160 @@
+import gzip
+import heapq
+import json
+import math
+import re
+from collections import Counter
+
+
+INDEX_VERSION = 1
+TERM_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be been but by can did do does for from had has have how i if in into is "
+    "it its may more no not of on or our so such than that the their them then there these they "
+    "this those to was we were what when where which while who why will with would you your".split()
+)
+
+
+def terms(text):
+    """
+    Splits text into lower-case index terms, leaving out stopwords.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list: The terms in order of appearance.
+    """
+    return [term for term in TERM_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def build_passages(units, chunker, group_units=True):
+    """
+    Splits a document into passages small enough to be sent a few at a time.
+
+    Args:
+        units (iterable): The text of each page, paragraph or block of the document.
+        chunker (TokenChunker): Chunker whose max_tokens is the passage size.
+        group_units (bool): Whether consecutive short units may share a passage. Leave it off
+            for PDF pages so each passage refers to a single page.
+
+    Returns:
+        list: Dicts with the passage text and the first and last unit numbers it comes from.
+    """
+    passages = []
+    group = []
+    group_tokens = 0
+    first = 1
+
+    def flush(last):
+        for text in chunker.chunks(" ".join(group)):
+            if text.strip():
+                passages.append({"first": first, "last": last, "text": text})
+
+    for number, unit in enumerate(units, 1):
+        if not group:
+            first = number
+        group.append(unit)
+        # A rough size is enough here; the chunker enforces the exact budget
+        group_tokens += len(unit) // 4
+        if not group_units or group_tokens >= chunker.max_tokens:
+            flush(number)
+            group, group_tokens = [], 0
+    if group:
+        flush(number)
+    return passages
+
+
+class BM25Index:
+    """
+    Okapi BM25 index over the passages of one document.
+
+    The index is small enough to be stored as gzipped JSON next to the conversation history
+    and loaded on every question.
+    """
+
+    def __init__(self, passages, postings=None, lengths=None, k1=1.5, b=0.75, source=None):
+        """
+        Args:
+            passages (list): Dicts with "text", "first" and "last" keys, as returned by build_passages.
+            postings (dict): Precomputed postings, as stored by save(). Built from passages when omitted.
+            lengths (list): Precomputed number of terms in each passage. Counted when omitted.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 length normalization.
+            source (dict): Description of the indexed file, used to detect that it changed.
+        """
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.source = source or {}
+        self.lengths = lengths or [len(terms(passage["text"])) for passage in passages]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        if postings is None:
+            postings = {}
+            for idx, passage in enumerate(passages):
+                for term, count in Counter(terms(passage["text"])).items():
+                    postings.setdefault(term, []).extend((idx, count))
+        # Postings are flat [passage, count, passage, count, ...] lists to keep the file compact
+        self.postings = postings
+
+    def search(self, query, top_k=5):
+        """
+        Finds the passages that best match a query.
+
+        Args:
+            query (str): The question or keywords.
+            top_k (int): Maximum number of passages to return.
+
+        Returns:
+            list: (score, passage) tuples, best first.
+        """
+        scores = {}
+        passage_count = len(self.passages)
+        for term in set(terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            frequency = len(postings) // 2
+            idf = math.log(1 + (passage_count - frequency + 0.5) / (frequency + 0.5))
+            for i in range(0, len(postings), 2):
+                idx, count = postings[i], postings[i + 1]
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[idx] / self.average_length)
+                scores[idx] = scores.get(idx, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(score, self.passages[idx]) for idx, score in best]
+
+    def save(self, path):
+        """
+        Writes the index to a gzipped JSON file.
+
+        Args:
+            path (str): Path of the index file.
+        """
+        data = {
+            "version": INDEX_VERSION,
+            "source": self.source,
+            "k1": self.k1,
+            "b": self.b,
+            "passages": self.passages,
+            "lengths": self.lengths,
+            "postings": self.postings
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads an index written by save().
+
+        Args:
+            path (str): Path of the index file.
+
+        Returns:
+            BM25Index: The index, or None if the file was written by another index version.
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            return None
+        return cls(data["passages"], data["postings"], data["lengths"], data["k1"], data["b"], data["source"])
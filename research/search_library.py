@@ -0,0 +1,47 @@
+import argparse
+import time
+from research.library_index import LibraryIndex
+
+
+if __name__ == "__main__":
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Search a folder of articles with a persistent full-text index.")
+    parser.add_argument("-q", "--query", required=False, help="Keywords or a question to search for.")
+    parser.add_argument("-d", "--folder", required=False, help="Folder to index before searching. Only new or changed files are read.")
+    parser.add_argument("-R", "--recursive", action="store_true", help="Include subfolders when indexing.")
+    parser.add_argument("-n", "--limit", type=int, default=10, help="Maximum number of documents to show.")
+    parser.add_argument("-p", "--passages", type=int, default=2, help="Number of passages to show per document.")
+    parser.add_argument("--paths_only", action="store_true", help="Print only the paths of the matching documents, e.g. to pass them on to summarise or chat.")
+
+    # Parse the arguments
+    args = parser.parse_args()
+    if not args.query and not args.folder:
+        parser.error("give a --query, a --folder to index, or both")
+
+    index = LibraryIndex()
+
+    if args.folder:
+        start = time.perf_counter()
+        stats = index.update(args.folder, args.recursive)
+        print(
+            f"Indexed {args.folder} in {time.perf_counter() - start:.1f}s: {stats['added']} added, "
+            f"{stats['updated']} updated, {stats['removed']} removed, {stats['unchanged']} unchanged, "
+            f"{stats['failed']} failed ({index.document_count()} documents in the index)"
+        )
+
+    if args.query:
+        start = time.perf_counter()
+        results = index.search(args.query, args.limit, 0 if args.paths_only else args.passages)
+        elapsed = (time.perf_counter() - start) * 1000
+        for result in results:
+            if args.paths_only:
+                print(result["path"])
+                continue
+            print(f"{result['score']:.2f}  {result['path']}  ({result['matches']} matching passages)")
+            unit = "page" if result["path"].lower().endswith(".pdf") else "part"
+            for passage in result["passages"]:
+                location = f"{unit} {passage['first']}" if passage["first"] == passage["last"] else f"{unit}s {passage['first']}-{passage['last']}"
+                text = " ".join(passage["text"].split())
+                print(f"    [{location}] {text[:200]}")
+        if not args.paths_only:
+            print(f"{len(results)} documents in {elapsed:.1f} ms")
@@ -0,0 +1,178 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.files import cache_dir
+
+
+def content_hash(content):
+    """Returns the key a message's content is stored under, or None for an empty message."""
+    if content is None:
+        return None
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def session_name(file_path):
+    """
+    Returns the name of the conversation about a document.
+
+    Args:
+        file_path (str): Path to the document.
+
+    Returns:
+        str: The absolute path of the document without its extension, which is also where
+            older versions kept the conversation as <name>.json.
+    """
+    return os.path.abspath(os.path.splitext(file_path)[0])
+
+
+class SessionStore:
+    """
+    Append-only store of chat conversations.
+
+    Each message is one row that refers to its content by hash, and each distinct content is
+    stored once, so the document chunks at the start of a conversation are written a single
+    time however many questions follow, and a document discussed in several sessions is not
+    duplicated. Appending a turn writes only that turn. When the history is compacted the
+    session moves to a new epoch holding the compacted messages; earlier epochs are kept.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): Path of the SQLite database. Defaults to sessions.sqlite in the shared
+                cache directory.
+        """
+        self.path = path or os.path.join(cache_dir("sessions"), "sessions.sqlite")
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "name TEXT PRIMARY KEY, epoch INTEGER, length INTEGER, created REAL, updated REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS contents (hash TEXT PRIMARY KEY, content TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                "session TEXT, epoch INTEGER, seq INTEGER, role TEXT, hash TEXT, created REAL, "
+                "PRIMARY KEY (session, epoch, seq))"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock, self._conn:
+            yield self._conn
+
+    def exists(self, name):
+        """Whether a session has been stored under a name."""
+        with self._transaction() as conn:
+            return conn.execute("SELECT 1 FROM sessions WHERE name = ?", (name,)).fetchone() is not None
+
+    def load(self, name):
+        """
+        Returns the messages of a session.
+
+        Args:
+            name (str): Name of the session.
+
+        Returns:
+            list: Chat messages, empty if the session does not exist.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT epoch FROM sessions WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return []
+            rows = conn.execute(
+                "SELECT turns.role, contents.content FROM turns LEFT JOIN contents ON contents.hash = turns.hash "
+                "WHERE turns.session = ? AND turns.epoch = ? ORDER BY turns.seq",
+                (name, row[0])
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append(self, name, messages):
+        """
+        Adds messages to the end of a session, creating it if needed.
+
+        Args:
+            name (str): Name of the session.
+            messages (list): Chat messages to add.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT epoch, length FROM sessions WHERE name = ?", (name,)).fetchone()
+            epoch, length = row or (0, 0)
+            self._insert(conn, name, epoch, length, messages, now)
+            conn.execute(
+                "INSERT INTO sessions (name, epoch, length, created, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET length = excluded.length, updated = excluded.updated",
+                (name, epoch, length + len(messages), now, now)
+            )
+
+    def replace(self, name, messages):
+        """
+        Starts a new epoch of a session holding the given messages, e.g. after compaction.
+
+        Args:
+            name (str): Name of the session.
+            messages (list): The complete new list of chat messages.
+
+        Returns:
+            int: The new epoch.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT epoch FROM sessions WHERE name = ?", (name,)).fetchone()
+            epoch = row[0] + 1 if row else 0
+            self._insert(conn, name, epoch, 0, messages, now)
+            conn.execute(
+                "INSERT INTO sessions (name, epoch, length, created, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET epoch = excluded.epoch, length = excluded.length, updated = excluded.updated",
+                (name, epoch, len(messages), now, now)
+            )
+        return epoch
+
+    def import_json(self, name, json_file):
+        """
+        Imports a conversation saved as a JSON list of messages by older versions.
+
+        Args:
+            name (str): Name of the session to create or replace.
+            json_file (str): Path of the JSON history.
+
+        Returns:
+            int: Number of messages imported.
+        """
+        with open(json_file, "r", encoding="utf-8") as f:
+            messages = json.load(f)
+        self.replace(name, [{"role": message["role"], "content": message.get("content")} for message in messages])
+        return len(messages)
+
+    def _insert(self, conn, name, epoch, start, messages, now):
+        hashes = [content_hash(message["content"]) for message in messages]
+        conn.executemany(
+            "INSERT OR IGNORE INTO contents (hash, content) VALUES (?, ?)",
+            [(digest, message["content"]) for digest, message in zip(hashes, messages) if digest]
+        )
+        conn.executemany(
+            "INSERT INTO turns (session, epoch, seq, role, hash, created) VALUES (?, ?, ?, ?, ?, ?)",
+            [(name, epoch, start + idx, message["role"], digest, now)
+             for idx, (digest, message) in enumerate(zip(hashes, messages))]
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import conversation histories saved as <document>.json into the session store.")
+    parser.add_argument("files", nargs="+", help="JSON histories to import.")
+    args = parser.parse_args()
+
+    store = SessionStore()
+    for json_file in args.files:
+        count = store.import_json(session_name(json_file), json_file)
+        print(f"Imported {count} messages from {json_file}")
@@ -1,9 +1,23 @@
 
+import argparse
 from research.article import ArticleQuery
+from utils.llm_cache import get_llm_cache
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize articles into a Word document.")
+    parser.add_argument("--batch", action="store_true", help="Send the requests through the OpenAI Batch API and wait for the results.")
+    parser.add_argument("--references", choices=("keep", "drop", "compress"), default="keep", help="What to do with the references section of PDFs.")
+    parser.add_argument("--no_cleanup", action="store_true", help="Keep the running headers, footers and page numbers of PDFs.")
+    parser.add_argument("--dehyphenate", action="store_true", help="Rejoin words that PDFs hyphenate across line breaks.")
+    parser.add_argument("-m", "--model", default="gpt-4o-mini", help="Chat model; see utils/models.py for the known models.")
+    parser.add_argument("--chunk_size", type=int, help="Maximum size of each chunk in tokens. Defaults to the fewest chunks the model accepts.")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore cached responses and send every request again. Setting CHATGPT_CACHE_BYPASS=1 does the same.")
+    args = parser.parse_args()
+    if args.no_cache:
+        get_llm_cache().bypass = True
+
     # Example usage
-    summarizer = ArticleQuery()
+    summarizer = ArticleQuery(model=args.model, clean_pdfs=not args.no_cleanup, references=args.references, dehyphenate=args.dehyphenate)
 
     article_paths = [
         # "G:/My Drive/newideas/2024.12.06.627286v2.full.pdf"
@@ -27,5 +41,5 @@ if __name__ == "__main__":
 
     ]
     output_doc = "/tmp/summaries.docx"
-    summarizer.process_articles(article_paths, output_doc)
+    summarizer.process_articles(article_paths, output_doc, chunk_size=args.chunk_size, batch=args.batch)
     print(f"Summaries saved to {output_doc}")
\ No newline at end of file
@@ -0,0 +1,24 @@
+import pytest
+import tiktoken
+
+from utils import tokens
+
+
+# Byte-level encoding built in process, so the tests never download BPE ranks
+OFFLINE_ENCODING = tiktoken.Encoding(
+    name="offline-bytes",
+    pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={}
+)
+
+
+@pytest.fixture(autouse=True)
+def offline_encoding(monkeypatch):
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: OFFLINE_ENCODING)
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: OFFLINE_ENCODING)
+    tokens.get_encoding.cache_clear()
+    tokens.get_counter.cache_clear()
+    yield
+    tokens.get_encoding.cache_clear()
+    tokens.get_counter.cache_clear()
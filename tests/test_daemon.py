@@ -0,0 +1,73 @@
+import io
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from research import daemon
+from research.article import ArticleQuery
+from utils.fake_openai import serve
+
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="the daemon needs Unix sockets")
+
+
+@pytest.fixture
+def running_daemon(tmp_path, monkeypatch):
+    api = serve(0)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{api.server_port}/v1")
+    monkeypatch.setenv("CHATGPT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("CHATGPT_CACHE_BYPASS", "1")
+    path = str(tmp_path / "chat.sock")
+    thread = threading.Thread(target=daemon.serve, args=(path,), daemon=True)
+    thread.start()
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.05)
+    yield path
+    daemon.send_request({"command": "stop"}, out=io.StringIO(), path=path)
+    thread.join(5)
+    api.shutdown()
+
+
+def ask(path, file_path, question):
+    request = {"command": "chat", "options": {}, "args": {"file_path": str(file_path), "user_input": question}}
+    return daemon.send_request(request, out=io.StringIO(), path=path)
+
+
+def test_failed_question_does_not_leak_into_the_next(running_daemon, tmp_path, monkeypatch):
+    first = tmp_path / "first.txt"
+    second = tmp_path / "second.txt"
+    first.write_text("The first document is about control loops.")
+    second.write_text("The second document is about reinforcement learning.")
+    assert ask(running_daemon, second, "What is it about?")
+
+    # Fail once, after the history was compacted
+    send_history_request = ArticleQuery.send_history_request
+    failed = []
+
+    def fail_once(self, *args, **kwargs):
+        if not failed:
+            failed.append(True)
+            self.compactions.append({"messages": 1, "tokens_before": 10, "tokens_after": 5})
+            raise RuntimeError("rate limited")
+        return send_history_request(self, *args, **kwargs)
+
+    monkeypatch.setattr(ArticleQuery, "send_history_request", fail_once)
+    with pytest.raises(RuntimeError, match="rate limited"):
+        ask(running_daemon, first, "What is it about?")
+    assert ask(running_daemon, second, "And what else?")
+
+    # The follow-up was appended to the same epoch, not written as a compacted history
+    with sqlite3.connect(tmp_path / "cache" / "sessions" / "sessions.sqlite") as conn:
+        epoch, length = conn.execute(
+            "SELECT epoch, length FROM sessions WHERE name = ?", (os.path.splitext(second)[0],)
+        ).fetchone()
+    assert epoch == 0
+    assert length > 2
+    assert not (tmp_path / "second.compactions.jsonl").exists()
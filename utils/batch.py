@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+from utils.files import cache_dir
+
+
+CHAT_COMPLETIONS = "/v1/chat/completions"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+# Limits of a single batch input file
+MAX_REQUESTS = 50000
+MAX_BYTES = 190 * 1024 * 1024
+
+
+def custom_id(prefix, *parts):
+    """
+    Builds a stable custom ID for a batch request.
+
+    The same parts always give the same ID, so results can be matched back to their
+    requests across reruns and partial batches.
+
+    Args:
+        prefix (str): Readable prefix, e.g. the name of the job.
+        *parts: Values that identify the request, such as a file hash and a chunk index.
+
+    Returns:
+        str: An ID of the form "<prefix>-<hash>".
+    """
+    digest = hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()[:24]
+    return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', prefix)[:32]}-{digest}"
+
+
+def chat_request(request_id, model, messages, **params):
+    """
+    Builds one line of a batch input file for a chat completion.
+
+    Args:
+        request_id (str): The request's custom ID.
+        model (str): Model name.
+        messages (list): Chat messages.
+        **params: Other chat completion parameters, such as max_tokens.
+
+    Returns:
+        dict: The batch request.
+    """
+    return {
+        "custom_id": request_id,
+        "method": "POST",
+        "url": CHAT_COMPLETIONS,
+        "body": {"model": model, "messages": messages, **params}
+    }
+
+
+class BatchRunner:
+    """
+    Runs chat completion requests through the OpenAI Batch API.
+
+    Requests are written to JSONL input files, uploaded and submitted, and the batches are
+    polled until they finish. Everything is kept in a job directory: the submitted batch IDs,
+    so an interrupted run picks up the batches it already submitted instead of paying for
+    them again, and every result received, so a rerun only submits the requests that have
+    no result yet (for example after a batch expired part way through).
+
+    Point the client at a local stand-in such as utils/fake_openai.py to exercise the whole
+    flow without the real API.
+    """
+
+    def __init__(self, client, name, job_dir=None, poll_interval=30, completion_window="24h"):
+        """
+        Args:
+            client (OpenAI): Client used for the Files and Batches APIs.
+            name (str): Name of the job. Runs with the same name share state.
+            job_dir (str): Directory for the job's files. Defaults to a directory named after
+                the job in the shared cache directory.
+            poll_interval (float): Seconds between status checks.
+            completion_window (str): Completion window requested for each batch.
+        """
+        self.client = client
+        self.name = name
+        self.job_dir = job_dir or os.path.join(cache_dir("batches"), name)
+        os.makedirs(self.job_dir, exist_ok=True)
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.state_file = os.path.join(self.job_dir, "state.json")
+        self.results_file = os.path.join(self.job_dir, "results.jsonl")
+
+    def run(self, requests):
+        """
+        Gets a result for every request, submitting batches only for those without one.
+
+        Args:
+            requests (list): Batch requests as built by chat_request, with unique custom IDs.
+
+        Returns:
+            dict: For each custom ID, {"content": str} on success or {"error": str} on failure.
+                Requests whose batch failed or expired without a result are left out.
+        """
+        results = self._load_results()
+        state = self._load_state()
+
+        # Resume batches submitted by an earlier run before deciding what is still missing
+        for batch_id in list(state["pending"]):
+            self._collect(self._wait(batch_id), results)
+            state["pending"].remove(batch_id)
+            self._save_state(state)
+
+        missing = [request for request in requests if request["custom_id"] not in results]
+        if missing:
+            print(f"Submitting {len(missing)} of {len(requests)} requests as a batch job")
+        for part, lines in enumerate(self._split(missing)):
+            input_file = os.path.join(self.job_dir, f"input-{int(time.time())}-{part}.jsonl")
+            with open(input_file, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+            with open(input_file, "rb") as f:
+                uploaded = self.client.files.create(file=f, purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=uploaded.id,
+                endpoint=CHAT_COMPLETIONS,
+                completion_window=self.completion_window
+            )
+            print(f"Submitted batch {batch.id} with {len(lines)} requests")
+            state["pending"].append(batch.id)
+            self._save_state(state)
+
+        for batch_id in list(state["pending"]):
+            self._collect(self._wait(batch_id), results)
+            state["pending"].remove(batch_id)
+            self._save_state(state)
+
+        return {request["custom_id"]: results[request["custom_id"]]
+                for request in requests if request["custom_id"] in results}
+
+    def _wait(self, batch_id):
+        """Polls a batch until it reaches a final status."""
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            progress = f" ({counts.completed + counts.failed}/{counts.total})" if counts else ""
+            print(f"Batch {batch_id}: {batch.status}{progress}")
+            if batch.status in FINAL_STATUSES:
+                return batch
+            time.sleep(self.poll_interval)
+
+    def _collect(self, batch, results):
+        """Downloads the output and error files of a finished batch and records each result."""
+        with open(self.results_file, "a", encoding="utf-8") as out:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                for line in self.client.files.content(file_id).text.splitlines():
+                    if not line.strip():
+                        continue
+                    result = _parse_result(json.loads(line))
+                    results[result["custom_id"]] = result
+                    out.write(json.dumps(result) + "\n")
+
+    def _split(self, requests):
+        """Serializes requests into input files that respect the batch size limits."""
+        lines, size = [], 0
+        for request in requests:
+            line = json.dumps(request) + "\n"
+            if lines and (len(lines) >= MAX_REQUESTS or size + len(line.encode("utf-8")) > MAX_BYTES):
+                yield lines
+                lines, size = [], 0
+            lines.append(line)
+            size += len(line.encode("utf-8"))
+        if lines:
+            yield lines
+
+    def _load_results(self):
+        results = {}
+        if os.path.exists(self.results_file):
+            with open(self.results_file, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        result = json.loads(line)
+                        # A later success replaces an earlier error for the same request
+                        if "content" in result or result["custom_id"] not in results:
+                            results[result["custom_id"]] = result
+        # Errors are retried on the next run
+        return {key: result for key, result in results.items() if "content" in result}
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            with open(self.state_file, encoding="utf-8") as f:
+                return json.load(f)
+        return {"pending": []}
+
+    def _save_state(self, state):
+        with open(self.state_file, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+
+def _parse_result(line):
+    """Reduces a line of a batch output or error file to the reply text or an error message."""
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        error = line.get("error") or body.get("error") or {}
+        message = error.get("message") if isinstance(error, dict) else str(error)
+        return {"custom_id": line["custom_id"], "error": message or f"status {response.get('status_code')}"}
+    return {"custom_id": line["custom_id"], "content": body["choices"][0]["message"]["content"]}
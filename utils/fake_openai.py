@@ -0,0 +1,271 @@
+"""
+Local stand-in for the parts of the OpenAI API the scripts use, for testing without a key.
+
+Run it and point the client at it:
+
+    python -m utils.fake_openai --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=test python -m research.summarise --batch
+
+Chat completions reply with a short echo of the last message, streamed word by word when
+the request asks for a stream. A fraction of them can be failed with a 429 or a 500 to
+exercise retries. Files can be uploaded and downloaded, and batches run their requests
+through the same echo after a delay.
+"""
+import argparse
+import email.parser
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def echo_reply(body):
+    """Reply used for every chat completion: the model name and the end of the last message."""
+    content = body["messages"][-1]["content"] or ""
+    return f"[{body.get('model')}] reply to: {' '.join(content.split())[-80:]}"
+
+
+class FakeOpenAI:
+    """In-memory state of the stand-in API: uploaded files, batches and request counts."""
+
+    def __init__(self, latency=0.0, batch_delay=1.0, error_rate=0.0, seed=None):
+        """
+        Args:
+            latency (float): Seconds each chat completion takes.
+            batch_delay (float): Seconds a batch stays in progress before it completes.
+            error_rate (float): Fraction of chat completions that fail, alternately with a
+                429 carrying a short retry-after and with a 500.
+            seed (int): Seed of the error injection, for repeatable runs.
+        """
+        self.latency = latency
+        self.batch_delay = batch_delay
+        self.error_rate = error_rate
+        self.files = {}
+        self.batches = {}
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def new_id(self, prefix):
+        with self._lock:
+            return f"{prefix}-{next(self._ids)}"
+
+    def injected_error(self):
+        """
+        Counts a chat completion request and decides whether it fails.
+
+        Returns:
+            tuple: (status, headers) of the error to send, or None to answer normally.
+        """
+        with self._lock:
+            self.requests += 1
+            if self._random.random() >= self.error_rate:
+                return None
+            self.errors += 1
+            if self.errors % 2:
+                return 429, {"retry-after-ms": "50"}
+            return 500, {}
+
+    def chat_completion(self, body):
+        time.sleep(self.latency)
+        return self.completion(body)
+
+    def completion(self, body):
+        content = echo_reply(body)
+        prompt_tokens = sum(len((m["content"] or "").split()) for m in body["messages"])
+        return {
+            "id": self.new_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content.split()),
+                "total_tokens": prompt_tokens + len(content.split())
+            }
+        }
+
+    def add_file(self, filename, purpose, data):
+        file_id = self.new_id("file")
+        self.files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "data": data
+        }
+        return file_id
+
+    def create_batch(self, body):
+        batch_id = self.new_id("batch")
+        lines = [json.loads(line) for line in self.files[body["input_file_id"]]["data"].decode("utf-8").splitlines() if line.strip()]
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0}
+        }
+        threading.Thread(target=self._run_batch, args=(batch_id, lines), daemon=True).start()
+        return self.batches[batch_id]
+
+    def _run_batch(self, batch_id, lines):
+        time.sleep(self.batch_delay)
+        output = []
+        for line in lines:
+            response = self.completion(line["body"])
+            output.append(json.dumps({
+                "id": self.new_id("batch_req"),
+                "custom_id": line["custom_id"],
+                "response": {"status_code": 200, "request_id": self.new_id("req"), "body": response},
+                "error": None
+            }))
+        batch = self.batches[batch_id]
+        batch["output_file_id"] = self.add_file("output.jsonl", "batch_output", "\n".join(output).encode("utf-8"))
+        batch["request_counts"]["completed"] = len(lines)
+        batch["status"] = "completed"
+
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, data, status=200, headers=None):
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def send_stream(self, completion, body):
+            """Sends a completion as server-sent events, one word per chunk."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+            words = re.findall(r"\S+\s*", completion["choices"][0]["message"]["content"])
+            for idx, word in enumerate(words):
+                delta = {"role": "assistant", "content": word} if idx == 0 else {"content": word}
+                chunk = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(api.latency / max(len(words), 1))
+            chunk = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": completion["choices"][0]["finish_reason"]}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunk = {**base, "choices": [], "usage": completion["usage"]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def read_body(self):
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def do_POST(self):
+            path = self.path.split("?")[0].rstrip("/")
+            if path.endswith("/chat/completions"):
+                body = json.loads(self.read_body())
+                error = api.injected_error()
+                if error:
+                    status, headers = error
+                    message = "Rate limit reached" if status == 429 else "The server had an error"
+                    self.send_json({"error": {"message": message, "type": "injected", "code": None}}, status, headers)
+                elif body.get("stream"):
+                    self.send_stream(api.completion(body), body)
+                else:
+                    self.send_json(api.chat_completion(body))
+            elif path.endswith("/files"):
+                fields = _parse_multipart(self.headers["Content-Type"], self.read_body())
+                filename, data = fields["file"]
+                file_id = api.add_file(filename, fields["purpose"][1].decode("utf-8"), data)
+                self.send_json({k: v for k, v in api.files[file_id].items() if k != "data"})
+            elif path.endswith("/batches"):
+                self.send_json(api.create_batch(json.loads(self.read_body())))
+            else:
+                self.send_json({"error": {"message": f"Unknown endpoint {self.path}"}}, 404)
+
+        def do_GET(self):
+            path = self.path.split("?")[0].rstrip("/")
+            match = re.search(r"/files/([^/]+)/content$", path)
+            if match and match.group(1) in api.files:
+                data = api.files[match.group(1)]["data"]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            match = re.search(r"/batches/([^/]+)$", path)
+            if match and match.group(1) in api.batches:
+                self.send_json(api.batches[match.group(1)])
+                return
+            self.send_json({"error": {"message": f"Not found: {self.path}"}}, 404)
+
+    return Handler
+
+
+def _parse_multipart(content_type, body):
+    """Parses a multipart/form-data body into {name: (filename, bytes)}."""
+    message = email.parser.BytesParser().parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body
+    )
+    return {
+        part.get_param("name", header="content-disposition"): (part.get_filename(), part.get_payload(decode=True))
+        for part in message.get_payload()
+    }
+
+
+def serve(port=8765, latency=0.0, batch_delay=1.0, error_rate=0.0, seed=None):
+    """
+    Starts the stand-in API in a background thread.
+
+    Args:
+        port (int): Port to listen on; 0 picks a free port.
+        latency (float): Seconds each chat completion takes.
+        batch_delay (float): Seconds a batch stays in progress before it completes.
+        error_rate (float): Fraction of chat completions that fail.
+        seed (int): Seed of the error injection.
+
+    Returns:
+        ThreadingHTTPServer: The running server; its base URL is
+            f"http://127.0.0.1:{server.server_port}/v1" and its FakeOpenAI state is
+            server.api. Call shutdown() to stop it.
+    """
+    api = FakeOpenAI(latency, batch_delay, error_rate, seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(api))
+    server.api = api
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI API.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds each chat completion takes.")
+    parser.add_argument("--batch_delay", type=float, default=1.0, help="Seconds before a batch completes.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of chat completions that fail with a 429 or a 500.")
+    parser.add_argument("--seed", type=int, help="Seed of the error injection.")
+    args = parser.parse_args()
+
+    api = FakeOpenAI(args.latency, args.batch_delay, args.error_rate, args.seed)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(api))
+    print(f"Serving on http://127.0.0.1:{server.server_port}/v1")
+    server.serve_forever()
@@ -1,7 +1,45 @@
+import hashlib
 import os
 import re
 from datetime import datetime
 
+
+def cache_dir(name):
+    """
+    Returns a directory for persistent caches, creating it if needed.
+
+    The root is $CHATGPT_CACHE_DIR, or ~/.cache/chatgpt when that is not set.
+
+    Args:
+        name (str): Name of the cache, used as the subdirectory name.
+
+    Returns:
+        str: Path of the cache directory.
+    """
+    root = os.getenv("CHATGPT_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "chatgpt")
+    path = os.path.join(root, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    """
+    Hashes a file's contents without reading it into memory at once.
+
+    Args:
+        file_path (str): Path to the file.
+        block_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hex SHA-256 digest of the file contents.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
 class LaTeXSplitter:
     def __init__(self, input_file, output_dir):
         self.input_file = input_file
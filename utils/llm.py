@@ -0,0 +1,283 @@
+import asyncio
+import itertools
+import time
+
+import openai
+
+from utils.llm_cache import get_llm_cache, request_key
+from utils.rate_limit import RETRY_STATUSES, backoff_delay, get_rate_limiter
+from utils.tokens import get_counter
+
+
+MAX_RETRIES = 6
+# Reply length assumed when a request does not set max_tokens
+DEFAULT_REPLY_TOKENS = 1000
+
+
+def chat_completion(client, model, messages, cache=None, **params):
+    """
+    Sends a chat completion request, answering from the response cache when possible.
+
+    Requests are paced by the model's rate limiter and retried with jittered exponential
+    backoff on rate-limit, timeout and server errors.
+
+    Args:
+        client (OpenAI): The client to send the request with on a cache miss.
+        model (str): Model name.
+        messages (list): Chat messages.
+        cache (LLMCache): Response cache. Defaults to the shared one.
+        **params: Other request parameters, such as temperature and max_tokens.
+
+    Returns:
+        str: The content of the reply.
+    """
+    cache = cache or get_llm_cache()
+    key = request_key(model, messages, **params)
+    content = cache.get(key)
+    if content is not None:
+        return content
+
+    response = create_chat_completion(client, model, messages, **params)
+    content = response.choices[0].message.content
+    if is_cacheable(content, response.choices[0].finish_reason):
+        cache.put(key, model, content)
+    return content
+
+
+async def achat_completion(client, model, messages, cache=None, **params):
+    """
+    Sends a chat completion request with an async client, answering from the response cache
+    when possible.
+
+    Requests are paced by the model's rate limiter and retried with jittered exponential
+    backoff on rate-limit, timeout and server errors.
+
+    Args:
+        client (AsyncOpenAI): The client to send the request with on a cache miss.
+        model (str): Model name.
+        messages (list): Chat messages.
+        cache (LLMCache): Response cache. Defaults to the shared one.
+        **params: Other request parameters, such as temperature and max_tokens.
+
+    Returns:
+        str: The content of the reply.
+    """
+    cache = cache or get_llm_cache()
+    key = request_key(model, messages, **params)
+    content = await cache.aget(key)
+    if content is not None:
+        return content
+
+    response = await acreate_chat_completion(client, model, messages, **params)
+    content = response.choices[0].message.content
+    if is_cacheable(content, response.choices[0].finish_reason):
+        await cache.aput(key, model, content)
+    return content
+
+
+def stream_chat_completion(client, model, messages, on_delta=None, cache=None, **params):
+    """
+    Streams a chat completion, passing each piece of the reply to on_delta as it arrives.
+
+    Requests go through the response cache and the model's rate limiter like
+    chat_completion. Failures are retried only until the first piece has arrived; a cached
+    reply is passed to on_delta in one piece.
+
+    Args:
+        client (OpenAI): The client to send the request with on a cache miss.
+        model (str): Model name.
+        messages (list): Chat messages.
+        on_delta (callable): Called with each piece of text as it arrives.
+        cache (LLMCache): Response cache. Defaults to the shared one.
+        **params: Other request parameters, such as temperature and max_tokens.
+
+    Returns:
+        tuple: The content of the reply, and a dict with the "time_to_first_token" in
+            seconds, the number of reply "tokens", the "tokens_per_second" after the first
+            token and whether the reply was "cached".
+    """
+    on_delta = on_delta or (lambda delta: None)
+    cache = cache or get_llm_cache()
+    key = request_key(model, messages, **params)
+    start = time.perf_counter()
+    content = cache.get(key)
+    if content is not None:
+        on_delta(content)
+        stats = {"time_to_first_token": time.perf_counter() - start, "tokens": get_counter(model).count(content)}
+        return content, {**stats, "tokens_per_second": None, "cached": True}
+
+    limiter = get_rate_limiter(model)
+    estimated = estimate_request_tokens(model, messages, params.get("max_tokens"))
+    client = client.with_options(max_retries=0)
+    for attempt in itertools.count(1):
+        time.sleep(limiter.reserve(estimated))
+        start = time.perf_counter()
+        first = None
+        usage = None
+        finish_reason = None
+        pieces = []
+        try:
+            raw = client.chat.completions.with_raw_response.create(
+                model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **params
+            )
+            limiter.update_from_headers(raw.headers)
+            for chunk in raw.parse():
+                usage = chunk.usage or usage
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if first is None:
+                        first = time.perf_counter()
+                    pieces.append(delta)
+                    on_delta(delta)
+        except openai.APIError as e:
+            # Part of the reply has already been shown, so it cannot be quietly replaced
+            if pieces or attempt > MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = retry_delay(e, limiter, attempt)
+            print(f"{describe_error(e)} from {model}, retrying in {delay:.1f}s (attempt {attempt} of {MAX_RETRIES})")
+            time.sleep(delay)
+            continue
+        break
+    end = time.perf_counter()
+
+    content = "".join(pieces)
+    limiter.settle(estimated, usage.total_tokens if usage else None)
+    if is_cacheable(content, finish_reason):
+        cache.put(key, model, content)
+    tokens = usage.completion_tokens if usage else get_counter(model).count(content)
+    first = first or end
+    return content, {
+        "time_to_first_token": first - start,
+        "tokens": tokens,
+        "tokens_per_second": tokens / (end - first) if end > first else None,
+        "cached": False
+    }
+
+
+def is_cacheable(content, finish_reason):
+    """
+    Checks whether a reply is worth caching.
+
+    Empty replies and replies cut off by max_tokens or a content filter would otherwise be
+    replayed until they expire.
+
+    Args:
+        content (str): The content of the reply.
+        finish_reason (str): Why the model stopped, as reported by the API.
+
+    Returns:
+        bool: True if the reply is non-empty and the model finished it.
+    """
+    return bool(content) and finish_reason == "stop"
+
+
+def create_chat_completion(client, model, messages, **params):
+    """
+    Sends a chat completion request within the model's rate limits, retrying failures.
+
+    Args:
+        client (OpenAI): The client to send the request with.
+        model (str): Model name.
+        messages (list): Chat messages.
+        **params: Other request parameters.
+
+    Returns:
+        ChatCompletion: The API response.
+    """
+    limiter = get_rate_limiter(model)
+    estimated = estimate_request_tokens(model, messages, params.get("max_tokens"))
+    # Retries are scheduled here, where they can see the shared rate-limit state
+    client = client.with_options(max_retries=0)
+    for attempt in itertools.count(1):
+        time.sleep(limiter.reserve(estimated))
+        try:
+            raw = client.chat.completions.with_raw_response.create(model=model, messages=messages, **params)
+        except openai.APIError as e:
+            if attempt > MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = retry_delay(e, limiter, attempt)
+            print(f"{describe_error(e)} from {model}, retrying in {delay:.1f}s (attempt {attempt} of {MAX_RETRIES})")
+            time.sleep(delay)
+            continue
+        return _settle(limiter, estimated, raw)
+
+
+async def acreate_chat_completion(client, model, messages, **params):
+    """
+    Sends a chat completion request with an async client within the model's rate limits,
+    retrying failures.
+
+    Args:
+        client (AsyncOpenAI): The client to send the request with.
+        model (str): Model name.
+        messages (list): Chat messages.
+        **params: Other request parameters.
+
+    Returns:
+        ChatCompletion: The API response.
+    """
+    limiter = get_rate_limiter(model)
+    estimated = estimate_request_tokens(model, messages, params.get("max_tokens"))
+    client = client.with_options(max_retries=0)
+    for attempt in itertools.count(1):
+        await asyncio.sleep(limiter.reserve(estimated))
+        try:
+            raw = await client.chat.completions.with_raw_response.create(model=model, messages=messages, **params)
+        except openai.APIError as e:
+            if attempt > MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = retry_delay(e, limiter, attempt)
+            print(f"{describe_error(e)} from {model}, retrying in {delay:.1f}s (attempt {attempt} of {MAX_RETRIES})")
+            await asyncio.sleep(delay)
+            continue
+        return _settle(limiter, estimated, raw)
+
+
+def estimate_request_tokens(model, messages, max_tokens=None):
+    """
+    Estimates the tokens a request counts against the tokens-per-minute limit.
+
+    Args:
+        model (str): Model name.
+        messages (list): Chat messages.
+        max_tokens (int): Maximum reply length, or None.
+
+    Returns:
+        int: Estimated prompt tokens plus the maximum reply length.
+    """
+    counter = get_counter(model)
+    prompt = sum(counter.estimate(message["content"] or "") + 4 for message in messages)
+    return prompt + (max_tokens or DEFAULT_REPLY_TOKENS)
+
+
+def is_retryable(error):
+    """Whether a failed request is worth sending again."""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if not isinstance(error, openai.APIStatusError) or error.status_code not in RETRY_STATUSES:
+        return False
+    # An exhausted quota is reported as a 429 but does not clear by waiting
+    return getattr(error, "code", None) != "insufficient_quota"
+
+
+def retry_delay(error, limiter, attempt):
+    """Seconds to wait before retrying: the server's retry-after if it sent one, else backoff."""
+    response = getattr(error, "response", None)
+    retry_after = limiter.update_from_headers(response.headers) if response is not None else None
+    return retry_after if retry_after is not None else backoff_delay(attempt)
+
+
+def describe_error(error):
+    status = getattr(error, "status_code", None)
+    return f"{type(error).__name__}" + (f" ({status})" if status else "")
+
+
+def _settle(limiter, estimated, raw):
+    """Updates the limiter from a successful response and returns the parsed completion."""
+    limiter.update_from_headers(raw.headers)
+    response = raw.parse()
+    usage = getattr(response, "usage", None)
+    limiter.settle(estimated, usage.total_tokens if usage else None)
+    return response
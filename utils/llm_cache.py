@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from utils.files import cache_dir
+
+
+@lru_cache(maxsize=None)
+def get_llm_cache():
+    """
+    Returns the response cache shared by every script in the process.
+
+    Setting $CHATGPT_CACHE_BYPASS to 1 starts it in bypass mode.
+
+    Returns:
+        LLMCache: The shared cache.
+    """
+    return LLMCache(bypass=os.getenv("CHATGPT_CACHE_BYPASS", "") not in ("", "0"))
+
+
+def request_key(model, messages, temperature=None, max_tokens=None, **params):
+    """
+    Builds the cache key of a chat completion request.
+
+    The key is a hash of a canonical JSON encoding, so requests that differ only in
+    dictionary order or whitespace between JSON tokens share a key.
+
+    Args:
+        model (str): Model name.
+        messages (list): Chat messages.
+        temperature (float): Sampling temperature, or None for the API default.
+        max_tokens (int): Maximum reply length, or None for the API default.
+        **params: Any other request parameters that affect the reply.
+
+    Returns:
+        str: Hex SHA-256 of the request.
+    """
+    request = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens, **params}
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Persistent cache of chat completion replies, shared by all scripts.
+
+    Replies are stored in SQLite under the hash of their request. Entries older than ttl are
+    treated as misses, and once the stored replies grow past max_bytes the least recently
+    used ones are evicted. In bypass mode lookups always miss but replies are still stored,
+    which refreshes the cache. Hit and miss counts are kept for the life of the object.
+    aget and aput run the same lookups on a worker thread so they do not block an event loop.
+    """
+
+    def __init__(self, path=None, ttl=30 * 24 * 3600, max_bytes=256 * 1024 * 1024, bypass=False):
+        """
+        Args:
+            path (str): Path of the SQLite database. Defaults to responses.sqlite in the shared
+                cache directory.
+            ttl (float): Seconds a reply stays valid, or None to keep replies until evicted.
+            max_bytes (int): Maximum total size of the stored replies.
+            bypass (bool): Whether lookups skip the cache.
+        """
+        self.path = path or os.path.join(cache_dir("llm"), "responses.sqlite")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, content TEXT, size INTEGER, created REAL, last_used REAL)"
+            )
+            self._bytes = self._total_size(conn)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock, self._conn:
+            yield self._conn
+
+    def get(self, key):
+        """
+        Looks up a reply.
+
+        Args:
+            key (str): The request key, as built by request_key.
+
+        Returns:
+            str: The cached reply, or None on a miss.
+        """
+        if self.bypass:
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT content, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl is not None and now - row[1] > self.ttl:
+                self._delete(conn, key)
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return row[0]
+
+    def put(self, key, model, content):
+        """
+        Stores a reply and evicts old entries if the cache is too big.
+
+        Args:
+            key (str): The request key, as built by request_key.
+            model (str): Model that produced the reply.
+            content (str): The reply.
+        """
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._transaction() as conn:
+            self._delete(conn, key)
+            conn.execute(
+                "INSERT INTO responses (key, model, content, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, size, now, now)
+            )
+            self._bytes += size
+            self._evict(conn)
+
+    async def aget(self, key):
+        """
+        Looks up a reply without blocking the event loop.
+
+        Args:
+            key (str): The request key, as built by request_key.
+
+        Returns:
+            str: The cached reply, or None on a miss.
+        """
+        if self.bypass:
+            self.misses += 1
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key, model, content):
+        """
+        Stores a reply without blocking the event loop.
+
+        Args:
+            key (str): The request key, as built by request_key.
+            model (str): Model that produced the reply.
+            content (str): The reply.
+        """
+        await asyncio.to_thread(self.put, key, model, content)
+
+    def stats(self):
+        """
+        Returns the hit and miss counts and the size of the cache.
+
+        Returns:
+            dict: "hits", "misses", "entries" and "bytes".
+        """
+        with self._transaction() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            size = self._bytes = self._total_size(conn)
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def summary(self):
+        """Returns a one-line description of the hit and miss counts."""
+        return f"LLM cache: {self.hits} hits, {self.misses} misses"
+
+    def _total_size(self, conn):
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _delete(self, conn, key):
+        row = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._bytes -= row[0]
+
+    def _evict(self, conn):
+        # The running total misses writes from other processes sharing the file, so it is
+        # resynced before evicting anything on its word.
+        if self._bytes <= self.max_bytes:
+            return
+        self._bytes = self._total_size(conn)
+        if self._bytes <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._bytes -= size
+            if self._bytes <= self.max_bytes:
+                break
@@ -0,0 +1,114 @@
+import math
+
+
+# Context window and maximum reply length in tokens, and prices in USD per million tokens
+MODELS = {
+    "gpt-4o": {"context_window": 128000, "max_output": 16384, "input_price": 2.50, "output_price": 10.00},
+    "gpt-4o-mini": {"context_window": 128000, "max_output": 16384, "input_price": 0.15, "output_price": 0.60},
+    "gpt-4.1": {"context_window": 1047576, "max_output": 32768, "input_price": 2.00, "output_price": 8.00},
+    "gpt-4.1-mini": {"context_window": 1047576, "max_output": 32768, "input_price": 0.40, "output_price": 1.60},
+    "gpt-4.1-nano": {"context_window": 1047576, "max_output": 32768, "input_price": 0.10, "output_price": 0.40},
+    "gpt-4-turbo": {"context_window": 128000, "max_output": 4096, "input_price": 10.00, "output_price": 30.00},
+    "gpt-4": {"context_window": 8192, "max_output": 8192, "input_price": 30.00, "output_price": 60.00},
+    "gpt-3.5-turbo": {"context_window": 16385, "max_output": 4096, "input_price": 0.50, "output_price": 1.50},
+    "o1": {"context_window": 200000, "max_output": 100000, "input_price": 15.00, "output_price": 60.00},
+    "o3-mini": {"context_window": 200000, "max_output": 100000, "input_price": 1.10, "output_price": 4.40},
+}
+# Assumed for models missing from MODELS: small enough to be safe, no known prices
+FALLBACK_MODEL = {"context_window": 16385, "max_output": 4096, "input_price": None, "output_price": None}
+# Tokens kept free for the reply when planning requests that do not set max_tokens
+DEFAULT_REPLY_TOKENS = 4096
+# Chunks are split on paragraph and sentence boundaries, so they come out somewhat smaller
+# than the target; this much headroom keeps an even split from spilling into an extra chunk
+PACKING_SLACK = 0.1
+
+
+def get_model_info(model):
+    """
+    Looks up a model's capabilities and prices.
+
+    Dated snapshots such as "gpt-4o-mini-2024-07-18" resolve to the longest registered name
+    they start with.
+
+    Args:
+        model (str): Model name.
+
+    Returns:
+        dict: "context_window", "max_output", "input_price" and "output_price", from MODELS or
+            FALLBACK_MODEL.
+    """
+    if model in MODELS:
+        return MODELS[model]
+    prefixes = [name for name in MODELS if model.startswith(name + "-")]
+    return MODELS[max(prefixes, key=len)] if prefixes else FALLBACK_MODEL
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens=0):
+    """
+    Estimates the price of a request.
+
+    Args:
+        model (str): Model name.
+        prompt_tokens (int): Input tokens.
+        completion_tokens (int): Output tokens.
+
+    Returns:
+        float: The price in USD, or None if the model's prices are not known.
+    """
+    info = get_model_info(model)
+    if info["input_price"] is None:
+        return None
+    return (prompt_tokens * info["input_price"] + completion_tokens * info["output_price"]) / 1_000_000
+
+
+def input_budget(model, reply_tokens=None, max_request_tokens=None):
+    """
+    Returns how many input tokens a request to a model can carry.
+
+    Args:
+        model (str): Model name.
+        reply_tokens (int): Tokens kept free for the reply. Defaults to DEFAULT_REPLY_TOKENS,
+            at most the model's maximum reply length.
+        max_request_tokens (int): Limit on prompt plus reply imposed by something other than
+            the model, such as the account's tokens-per-minute limit.
+
+    Returns:
+        int: The input token budget.
+    """
+    info = get_model_info(model)
+    if reply_tokens is None:
+        reply_tokens = min(DEFAULT_REPLY_TOKENS, info["max_output"])
+    total = info["context_window"]
+    if max_request_tokens:
+        total = min(total, max_request_tokens)
+    return total - reply_tokens
+
+
+def plan_chunk_size(model, prompt_tokens, total_tokens=None, reply_tokens=None, max_request_tokens=None):
+    """
+    Picks the chunk size that splits a document into the fewest requests a model accepts.
+
+    Each chunk is sent with prompt_tokens of instructions and needs room for the reply. When
+    the length of the document is known the chunks are also evened out, so that a document
+    slightly over one chunk is split into two halves rather than a full chunk and a sliver.
+
+    Args:
+        model (str): Model name.
+        prompt_tokens (int): Tokens of the instructions sent with each chunk.
+        total_tokens (int): Length of the document in tokens, if known.
+        reply_tokens (int): Tokens kept free for the reply. See input_budget.
+        max_request_tokens (int): Other limit on prompt plus reply. See input_budget.
+
+    Returns:
+        int: Maximum chunk size in tokens.
+
+    Raises:
+        ValueError: If the prompt and reply leave no room for a chunk.
+    """
+    available = input_budget(model, reply_tokens, max_request_tokens) - prompt_tokens
+    if available <= 0:
+        raise ValueError(f"The prompt and reply do not leave room for a chunk within the limits of {model}")
+    if not total_tokens or total_tokens <= available:
+        return available
+    count = math.ceil(total_tokens / available)
+    return min(available, math.ceil(total_tokens / count * (1 + PACKING_SLACK)))
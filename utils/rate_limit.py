@@ -0,0 +1,224 @@
+import os
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+
+
+# Requests and tokens per minute assumed until the API reports the account's real limits
+DEFAULT_LIMITS = {
+    "gpt-4o": (500, 30000),
+    "gpt-4o-mini": (500, 200000),
+}
+FALLBACK_LIMITS = (500, 30000)
+RETRY_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(model):
+    """
+    Returns the rate limiter shared by every request to a model in the process.
+
+    The starting limits can be set with $OPENAI_RPM and $OPENAI_TPM; otherwise they come from
+    DEFAULT_LIMITS and are corrected from the rate-limit headers of the first response.
+
+    Args:
+        model (str): Model name.
+
+    Returns:
+        RateLimiter: The model's limiter.
+    """
+    rpm, tpm = DEFAULT_LIMITS.get(model, FALLBACK_LIMITS)
+    return RateLimiter(int(os.getenv("OPENAI_RPM", rpm)), int(os.getenv("OPENAI_TPM", tpm)))
+
+
+def parse_duration(value):
+    """
+    Parses a reset or retry duration such as "1s", "6m0s", "250ms" or "2.5".
+
+    Args:
+        value (str): The header value. Plain numbers are seconds.
+
+    Returns:
+        float: The duration in seconds, or None if the value cannot be parsed.
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """
+    Returns a randomized delay before retry number attempt ("full jitter" backoff).
+
+    Args:
+        attempt (int): Number of failed attempts so far, starting at 1.
+        base (float): Delay scale in seconds.
+        cap (float): Maximum delay in seconds.
+
+    Returns:
+        float: Seconds to wait.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """
+    Bucket that refills continuously up to a capacity, with reservations.
+
+    A reservation takes its amount from the bucket immediately, letting the level go
+    negative, and returns how long the caller has to wait until the amount would have been
+    available. Callers are therefore served in the order they reserve, and the same bucket
+    works for threads (time.sleep) and coroutines (asyncio.sleep).
+    """
+
+    def __init__(self, capacity, refill_per_second):
+        """
+        Args:
+            capacity (float): Maximum level of the bucket.
+            refill_per_second (float): Amount added back per second.
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def reserve(self, amount):
+        """
+        Takes an amount from the bucket.
+
+        Args:
+            amount (float): The amount to take. Amounts above the capacity are capped so that
+                they can still be served once the bucket is full.
+
+        Returns:
+            float: Seconds to wait before using the amount.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level -= min(amount, self.capacity)
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.refill_per_second
+
+    def refund(self, amount):
+        """
+        Gives back part of a reservation, e.g. when a request used fewer tokens than estimated.
+
+        Args:
+            amount (float): The amount to give back.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level + amount)
+
+    def update(self, limit=None, remaining=None):
+        """
+        Corrects the bucket from the limits reported by the server.
+
+        Args:
+            limit (float): The server's capacity per minute.
+            remaining (float): What the server says is left.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if limit:
+                self.capacity = limit
+                self.refill_per_second = limit / 60
+            if remaining is not None:
+                self.level = min(self.level, remaining)
+
+
+class RateLimiter:
+    """
+    Client-side scheduler for one model's requests-per-minute and tokens-per-minute limits.
+
+    Each request reserves one request and its estimated tokens before it is sent and waits
+    until both buckets allow it. The buckets are corrected from the x-ratelimit-* headers of
+    every response, and a retry-after from the server pauses all requests to the model.
+    """
+
+    def __init__(self, rpm, tpm):
+        """
+        Args:
+            rpm (int): Requests per minute.
+            tpm (int): Tokens per minute.
+        """
+        self.requests = TokenBucket(rpm, rpm / 60)
+        self.tokens = TokenBucket(tpm, tpm / 60)
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """
+        Reserves capacity for one request.
+
+        Args:
+            tokens (int): Estimated tokens of the request, prompt plus maximum reply.
+
+        Returns:
+            float: Seconds to wait before sending the request.
+        """
+        delay = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        with self._lock:
+            return max(delay, self.paused_until - time.monotonic())
+
+    def settle(self, estimated, used):
+        """
+        Gives back the tokens a request reserved but did not use.
+
+        Args:
+            estimated (int): Tokens reserved for the request.
+            used (int): Tokens the request actually used.
+        """
+        if used is not None and used < estimated:
+            self.tokens.refund(estimated - used)
+
+    def pause(self, seconds):
+        """
+        Holds back every request to the model for a while.
+
+        Args:
+            seconds (float): How long to pause.
+        """
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """
+        Corrects the buckets from the rate-limit headers of a response.
+
+        Args:
+            headers (Mapping): Response headers.
+
+        Returns:
+            float: Seconds the server asked to wait (retry-after), or None.
+        """
+        def number(name):
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        self.requests.update(number("x-ratelimit-limit-requests"), number("x-ratelimit-remaining-requests"))
+        self.tokens.update(number("x-ratelimit-limit-tokens"), number("x-ratelimit-remaining-tokens"))
+        retry_after = parse_duration(headers.get("retry-after-ms"))
+        retry_after = retry_after / 1000 if retry_after is not None else parse_duration(headers.get("retry-after"))
+        if retry_after is not None:
+            self.pause(retry_after)
+        return retry_after
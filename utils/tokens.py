@@ -0,0 +1,179 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import tiktoken
+
+
+DEFAULT_ENCODING = "o200k_base"
+
+# Batches with fewer characters than this are counted on the calling thread; handing them to
+# the pool costs more than encoding them.
+INLINE_CHARS = 16384
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """
+    Returns the shared thread pool for a worker count, creating it on first use.
+
+    Args:
+        workers (int): Maximum number of threads, or None for the executor default.
+
+    Returns:
+        ThreadPoolExecutor: A pool that lives for the rest of the process.
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tokens")
+        return pool
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    Returns the tiktoken encoding for a model, loading each encoding only once.
+
+    Args:
+        model (str): Model name, e.g. "gpt-4o-mini".
+
+    Returns:
+        tiktoken.Encoding: The model's encoding, or o200k_base for models tiktoken does not know.
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+@lru_cache(maxsize=None)
+def get_counter(model):
+    """
+    Returns the shared TokenCounter for a model.
+
+    Args:
+        model (str): Model name.
+
+    Returns:
+        TokenCounter: A counter whose memoized counts are shared by every caller in the process.
+    """
+    return TokenCounter(model)
+
+
+class TokenCounter:
+    """
+    Counts tokens for one model with memoization and a calibrated fast estimate.
+
+    Exact counts are memoized by a hash of the text and evicted least recently used first.
+    Every exact count also refines the characters-per-token ratio used by estimate(), so
+    fits() only needs to encode texts whose estimate lands close to the limit.
+    """
+
+    def __init__(self, model, max_entries=4096, chars_per_token=4.0, workers=None):
+        """
+        Args:
+            model (str): Model name used to pick the encoding.
+            max_entries (int): Maximum number of memoized counts.
+            chars_per_token (float): Initial characters-per-token ratio for estimates.
+            workers (int): Number of threads used by count_many. Defaults to the executor default.
+        """
+        self.model = model
+        self.max_entries = max_entries
+        self.workers = workers
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+        self._sampled_chars = 0
+        self._sampled_tokens = 0
+        self._initial_ratio = chars_per_token
+
+    @property
+    def encoding(self):
+        """The model's encoding, loaded on first use."""
+        return get_encoding(self.model)
+
+    @property
+    def chars_per_token(self):
+        """Characters per token observed in exact counts so far."""
+        if not self._sampled_tokens:
+            return self._initial_ratio
+        return self._sampled_chars / self._sampled_tokens
+
+    def count(self, text):
+        """
+        Returns the exact number of tokens in a text.
+
+        Args:
+            text (str): The text to tokenize.
+
+        Returns:
+            int: The number of tokens in the text.
+        """
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                return self._counts[key]
+
+        tokens = len(self.encoding.encode(text, disallowed_special=()))
+
+        with self._lock:
+            self._counts[key] = tokens
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+            if tokens:
+                self._sampled_chars += len(text)
+                self._sampled_tokens += tokens
+        return tokens
+
+    def count_many(self, texts):
+        """
+        Returns the exact token counts of several texts, encoding large batches on a shared thread pool.
+
+        Args:
+            texts (list): The texts to tokenize.
+
+        Returns:
+            list: Token counts in the same order as texts.
+        """
+        texts = list(texts)
+        if len(texts) < 2 or sum(len(text) for text in texts) < INLINE_CHARS:
+            return [self.count(text) for text in texts]
+        return list(_get_pool(self.workers).map(self.count, texts))
+
+    def estimate(self, text):
+        """
+        Estimates the number of tokens in a text without encoding it.
+
+        Args:
+            text (str): The text to measure.
+
+        Returns:
+            int: Estimated token count based on the calibrated characters-per-token ratio.
+        """
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def fits(self, text, limit, margin=0.15):
+        """
+        Checks whether a text fits a token limit, counting exactly only near the limit.
+
+        Args:
+            text (str): The text to measure.
+            limit (int): Maximum number of tokens.
+            margin (float): Relative distance from the limit within which the estimate is not
+                trusted and the text is counted exactly.
+
+        Returns:
+            bool: True if the text has at most limit tokens.
+        """
+        estimate = self.estimate(text)
+        if estimate < limit * (1 - margin):
+            return True
+        if estimate > limit * (1 + margin):
+            return False
+        return self.count(text) <= limit
@@ -1,8 +1,12 @@
 
 from openai import OpenAI
+import argparse
 import os  
 import json
 
+from utils.llm import chat_completion
+from utils.llm_cache import get_llm_cache
+
 
 def read_file(file_path):     
   	with open(file_path, 'r') as file:
@@ -25,19 +29,21 @@ def is_json(myjson):
 def make_chatgpt_request(system_content, user_content, text_content):     
 	# return text_content
 
-	response = client.chat.completions.create(
-		 model="gpt-4o",
-		 messages=[ 
+	# Identical requests from an earlier run are answered from the shared response cache
+	return chat_completion(client, "gpt-4o", [ 
 			 {"role": "system", "content": system_content},
 			 {"role": "user", "content": user_content +  text_content}
-			 ])     	
-	
-	# print(response.choices[0].message.content)
-	return response.choices[0].message.content  
+			 ])
 
 
 if __name__ == '__main__':
 
+	parser = argparse.ArgumentParser(description="Rewrite a chapter in the style of several authors.")
+	parser.add_argument("--no-cache", action="store_true", help="Ignore cached responses and send every request again. Setting CHATGPT_CACHE_BYPASS=1 does the same.")
+	args = parser.parse_args()
+	if args.no_cache:
+		get_llm_cache().bypass = True
+
 	client = OpenAI()
 	# # Directory paths 
 	dir = 'C:/files/personal/myfiles/book/latex/book050602'
@@ -77,4 +83,6 @@ if __name__ == '__main__':
         
 		print(f"Written response to {response_dir}/{text_file}.")
 
+	print(get_llm_cache().summary())
+
 
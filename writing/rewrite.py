@@ -1,8 +1,19 @@
 
 from openai import OpenAI
+import argparse
 import os  
 import json
 
+from utils.batch import BatchRunner, chat_request, custom_id
+from utils.llm import chat_completion
+from utils.llm_cache import get_llm_cache
+from utils.models import input_budget
+from utils.tokens import get_counter
+
+MODEL = "gpt-4o"
+# Input tokens a request can carry, leaving room for the reply
+MODEL_LIMIT = input_budget(MODEL)
+
 
 def revise_user_content(user_content, word_count, reduction):
 	count = word_count
@@ -36,23 +47,31 @@ def is_json(myjson):
   return True
 
                               
+def build_messages(system_content, user_content, text_content):
+	return [
+		{"role": "system", "content": system_content},
+		{"role": "user", "content": user_content +  text_content}
+		]
+
+
 def make_chatgpt_request(system_content, user_content, text_content):     
 	# return text_content
 
-	response = client.chat.completions.create(
-		 model="gpt-4o",
-		 messages=[ 
-			 {"role": "system", "content": system_content},
-			 {"role": "user", "content": user_content +  text_content}
-			 ])     	
-	
-	# print(response.choices[0].message.content)
-	return response.choices[0].message.content  
+	# Identical requests from an earlier run are answered from the shared response cache
+	return chat_completion(client, MODEL, build_messages(system_content, user_content, text_content))
 
 
 if __name__ == '__main__':
 
+	parser = argparse.ArgumentParser(description="Rewrite every text with every pair of system and user roles.")
+	parser.add_argument("--batch", action="store_true", help="Send the requests through the OpenAI Batch API and wait for the results.")
+	parser.add_argument("--no-cache", action="store_true", help="Ignore cached responses and send every request again. Setting CHATGPT_CACHE_BYPASS=1 does the same.")
+	args = parser.parse_args()
+	if args.no_cache:
+		get_llm_cache().bypass = True
+
 	client = OpenAI()
+	token_counter = get_counter(MODEL)
 	# # Directory paths 
 	dir = 'G:\My Drive\PR\Consciousness\chatgpt\paper'
 	reduction = 0
@@ -75,12 +94,14 @@ if __name__ == '__main__':
 	user_roles = os.listdir(user_roles_dir) 
 	text_files = os.listdir(text_dir)  
 
+	# Collect every request first, so they can be sent one by one or as a single batch
+	jobs = []
+	word_counts = {}
 	for system_role_file in system_roles:     
 		system_prefix = os.path.splitext(system_role_file)[0] 
 		system_content = read_file(os.path.join(system_roles_dir, system_role_file))     
 		total_word_count = 0
 		revised_total_word_count = 0
-		response_total_word_count = 0
 		for user_role_file in user_roles:         
 			user_prefix = os.path.splitext(user_role_file)[0] 
 			response_subdir = os.path.join(responses_dir, system_prefix, user_prefix)
@@ -95,13 +116,37 @@ if __name__ == '__main__':
 				total_word_count += word_count
 				revised_total_word_count += revised_count
 				# print(f"Number of words in text_content: {word_count}")
-				response_content = make_chatgpt_request(system_content, user_content, text_content)         
-				# print(response_content)    
-				response_word_count = len(response_content.split())
-				print(response_word_count)
-				response_total_word_count += response_word_count
+				if not token_counter.fits(system_content + user_content + text_content, MODEL_LIMIT):
+					print(f"Warning: {text_file} with {user_role_file} exceeds the {MODEL_LIMIT} token input budget of {MODEL}")
 				response_file_name = os.path.splitext(text_file)[0] + '_response.txt'             
-				write_file(os.path.join(response_subdir, response_file_name), response_content) 
-				
+				jobs.append({
+					# Stable across runs, so batch results are matched to the same output file
+					"id": custom_id(system_prefix, user_prefix, text_file, system_content, user_content, text_content),
+					"system_prefix": system_prefix,
+					"contents": (system_content, user_content, text_content),
+					"response_file": os.path.join(response_subdir, response_file_name)
+				})
+		word_counts[system_prefix] = [total_word_count, revised_total_word_count, 0]
+
+	if args.batch:
+		requests = [chat_request(job["id"], MODEL, build_messages(*job["contents"])) for job in jobs]
+		results = BatchRunner(client, custom_id("rewrite", sorted(job["id"] for job in jobs))).run(requests)
+
+	for job in jobs:
+		if args.batch:
+			result = results.get(job["id"], {"error": "no result"})
+			if "content" not in result:
+				print(f"Error: no response for {job['response_file']}: {result['error']}")
+				continue
+			response_content = result["content"]
+		else:
+			response_content = make_chatgpt_request(*job["contents"])         
+		# print(response_content)    
+		response_word_count = len(response_content.split())
+		print(response_word_count)
+		word_counts[job["system_prefix"]][2] += response_word_count
+		write_file(job["response_file"], response_content) 
+
+	for total_word_count, revised_total_word_count, response_total_word_count in word_counts.values():
 		print(f"Total number of words in text_content: original {total_word_count} revised {revised_total_word_count} response {response_total_word_count}")
-
+	print(get_llm_cache().summary())